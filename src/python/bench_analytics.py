@@ -0,0 +1,88 @@
+"""
+CPU cost of the analytics rules engine.
+
+Simulates N sources at the given frame rate with tracked objects walking through zones and over lines and feeds
+every frame to AnalyticsEngine.update as the probe would. Reports the CPU time per frame and the share of one core
+needed to keep up in real time.
+
+Example:
+    $ python3 bench_analytics.py -n_sources 32 -fps 30 -seconds 60 -objects 20
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from common import analytics
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Analytics rules engine benchmark')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=32, help='int, number of sources')
+    parser.add_argument('-fps', metavar='fps', type=int, default=30, help='int, frames per second of a source')
+    parser.add_argument('-seconds', metavar='seconds', type=int, default=60, help='int, simulated seconds')
+    parser.add_argument('-objects', metavar='objects', type=int, default=20, help='int, tracked objects per frame')
+    parser.add_argument('-zones', metavar='zones', type=int, default=4, help='int, zones per source')
+    parser.add_argument('-lines', metavar='lines', type=int, default=2, help='int, lines per source')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, random seed')
+    return parser.parse_args()
+
+
+def make_geometry(n_zones: int, n_lines: int, rng: np.random.RandomState) -> analytics.SourceGeometry:
+    zones = []
+    for i in range(n_zones):
+        # Irregular hexagons around random centers
+        center = rng.uniform([300, 200], [1620, 880])
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 6))
+        radius = rng.uniform(100, 300, 6)
+        polygon = np.stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)], axis=1)
+        zones.append(analytics.Zone(f'zone{i}', polygon.tolist()))
+    lines = [analytics.Line(f'line{i}', [x, 0], [x, 1080]) for i, x in enumerate(np.linspace(400, 1500, n_lines))]
+    return analytics.SourceGeometry(zones, lines)
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.RandomState(args.seed)
+    rules = {'window': 60.0, 'class_ids': None,
+             'sources': {i: make_geometry(args.zones, args.lines, rng) for i in range(args.n_sources)}}
+    reports = []
+    engine = analytics.AnalyticsEngine(rules, emit=reports.append)
+
+    # Objects walk with constant velocity and re-enter on the other side, a track id per pass
+    position = rng.uniform([0, 0], [1920, 1080], (args.n_sources, args.objects, 2))
+    velocity = rng.uniform(-8, 8, (args.n_sources, args.objects, 2))
+    track_ids = np.tile(np.arange(args.objects, dtype=np.int64), (args.n_sources, 1))
+    next_id = args.objects
+    class_ids = np.zeros(args.objects, dtype=np.int64)
+    size = np.array([60, 160], dtype=np.float32)
+
+    n_frames = args.fps * args.seconds
+    cpu_elapsed = 0.0
+    for frame in range(n_frames):
+        timestamp = frame / args.fps
+        position += velocity
+        outside = np.any((position < 0) | (position > [1920, 1080]), axis=2)
+        if outside.any():
+            position[outside] %= [1920, 1080]
+            n_new = int(outside.sum())
+            track_ids[outside] = np.arange(next_id, next_id + n_new)
+            next_id += n_new
+        boxes = np.concatenate([position - size / 2, np.broadcast_to(size, position.shape)], axis=2)
+
+        start = time.process_time()
+        for source_id in range(args.n_sources):
+            engine.update(source_id, timestamp, track_ids[source_id], class_ids, boxes[source_id])
+        cpu_elapsed += time.process_time() - start
+
+    total_frames = n_frames * args.n_sources
+    print(f'Sources: {args.n_sources} x {args.fps} fps, {args.objects} objects, {args.zones} zones, '
+          f'{args.lines} lines, {args.seconds} s simulated')
+    print(f'CPU per frame:        {1e6 * cpu_elapsed / total_frames:8.1f} us')
+    print(f'Real-time core usage: {100 * cpu_elapsed / args.seconds:8.1f} %')
+    print(f'Window reports:       {len(reports):8d}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+DetectNet_v2 output parsing cost on CPU: bbox_parser.DetectNetDecoder against the nvinfer parser.
+
+The nvinfer parser is C++ inside libnvds_infer and needs a GPU host, the reference here is a line by line Python
+port of its DetectNet loop (every class, row and column of every frame, box from the cell center offsets, clip to
+the network input) followed by per-class greedy NMS. Both parse the same tensors: recorded with
+`gst_multiple_rtsp_inference.py -bbox_parser numpy -record_tensors tensors.npz` or synthetic PeopleNet-like ones,
+cells around random objects with high coverage and jittered box offsets. The detections are checked to match and
+the throughput is reported in frames per second and microseconds per batch.
+
+Example:
+    $ python3 bench_bbox_parser.py -batches 200 -batch_size 8 -objects 20
+    $ python3 bench_bbox_parser.py -tensors tensors.npz
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from common import bbox_parser
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Raw output tensors parser benchmark')
+    parser.add_argument('-tensors', metavar='tensors', type=str, default=None,
+                        help='str, .npz file of -record_tensors, synthetic tensors if not set')
+    parser.add_argument('-batches', metavar='batches', type=int, default=200, help='int, synthetic batches')
+    parser.add_argument('-batch_size', metavar='batch_size', type=int, default=8, help='int, frames per batch')
+    parser.add_argument('-objects', metavar='objects', type=int, default=20, help='int, objects per frame')
+    parser.add_argument('-input_size', metavar='input_size', type=int, nargs=2, default=[960, 544],
+                        help='int, network width and height')
+    parser.add_argument('-classes', metavar='classes', type=int, default=3, help='int, classes of the model')
+    parser.add_argument('-threshold', metavar='threshold', type=float, default=0.2,
+                        help='float, pre-cluster-threshold')
+    parser.add_argument('-nms_iou', metavar='nms_iou', type=float, default=0.3, help='float, nms-iou-threshold')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, random seed')
+    return parser.parse_args()
+
+
+def synthetic_batch(batch_size: int, n_objects: int, n_classes: int, input_size: tuple,
+                    rng: np.random.RandomState, stride: int = 16) -> tuple:
+    """
+    :return: (cov (B, C, H, W), bbox (B, 4 * C, H, W)) float32
+    """
+    width, height = input_size
+    grid_width, grid_height = width // stride, height // stride
+    cov = rng.uniform(0.0, 0.1, (batch_size, n_classes, grid_height, grid_width)).astype(np.float32)
+    bbox = rng.normal(0.0, 0.5, (batch_size, n_classes, 4, grid_height, grid_width)).astype(np.float32)
+    centers_x = (np.arange(grid_width) * stride + bbox_parser.CENTER_OFFSET) / bbox_parser.BBOX_NORM
+    centers_y = (np.arange(grid_height) * stride + bbox_parser.CENTER_OFFSET) / bbox_parser.BBOX_NORM
+    for frame in range(batch_size):
+        for _ in range(n_objects):
+            class_id = rng.randint(0, n_classes)
+            w, h = rng.uniform(24, 200), rng.uniform(48, 300)
+            x1, y1 = rng.uniform(0, width - w), rng.uniform(0, height - h)
+            # Cells of the box center third predict the box, with jittered offsets
+            cols = np.arange(int((x1 + w / 3) / stride), int((x1 + 2 * w / 3) / stride) + 1)
+            rows = np.arange(int((y1 + h / 3) / stride), int((y1 + 2 * h / 3) / stride) + 1)
+            rows, cols = np.meshgrid(rows[rows < grid_height], cols[cols < grid_width], indexing='ij')
+            cov[frame, class_id, rows, cols] = rng.uniform(0.3, 0.95, rows.shape)
+            jitter = rng.normal(0, 0.05, (4,) + rows.shape)
+            cx, cy = centers_x[cols], centers_y[rows]
+            bbox[frame, class_id, 0, rows, cols] = cx - x1 / bbox_parser.BBOX_NORM + jitter[0]
+            bbox[frame, class_id, 1, rows, cols] = cy - y1 / bbox_parser.BBOX_NORM + jitter[1]
+            bbox[frame, class_id, 2, rows, cols] = (x1 + w) / bbox_parser.BBOX_NORM - cx + jitter[2]
+            bbox[frame, class_id, 3, rows, cols] = (y1 + h) / bbox_parser.BBOX_NORM - cy + jitter[3]
+    return cov, bbox.reshape(batch_size, 4 * n_classes, grid_height, grid_width)
+
+
+def reference_parse(cov, bbox, input_size, threshold, nms_iou):
+    """
+    nvinfer DetectNet parser loop and per-class greedy NMS on Python lists
+    :return: list of (frame, class id, score, left, top, width, height)
+    """
+    width, height = input_size
+    norm = bbox_parser.BBOX_NORM
+    n_frames, n_classes, grid_height, grid_width = cov.shape
+    stride_x, stride_y = width / grid_width, height / grid_height
+    cov, bbox = cov.tolist(), bbox.tolist()
+
+    def iou(a, b):
+        w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+        h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+        inter = w * h
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    objects = []
+    for frame in range(n_frames):
+        for class_id in range(n_classes):
+            candidates = []
+            for row in range(grid_height):
+                center_y = (row * stride_y + bbox_parser.CENTER_OFFSET) / norm
+                for col in range(grid_width):
+                    score = cov[frame][class_id][row][col]
+                    if score < threshold:
+                        continue
+                    center_x = (col * stride_x + bbox_parser.CENTER_OFFSET) / norm
+                    x1 = (bbox[frame][4 * class_id][row][col] - center_x) * -norm
+                    y1 = (bbox[frame][4 * class_id + 1][row][col] - center_y) * -norm
+                    x2 = (bbox[frame][4 * class_id + 2][row][col] + center_x) * norm
+                    y2 = (bbox[frame][4 * class_id + 3][row][col] + center_y) * norm
+                    box = [min(max(x1, 0), width - 1), min(max(y1, 0), height - 1),
+                           min(max(x2, 0), width - 1), min(max(y2, 0), height - 1)]
+                    # detected-min-w and detected-min-h of 0
+                    if box[2] >= box[0] and box[3] >= box[1]:
+                        candidates.append((score, box))
+            candidates.sort(key=lambda candidate: -candidate[0])
+            kept = []
+            for score, box in candidates:
+                if all(iou(box, other) <= nms_iou for _, other in kept):
+                    kept.append((score, box))
+            objects += [(frame, class_id, score, box[0], box[1], box[2] - box[0], box[3] - box[1])
+                        for score, box in kept]
+    return objects
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.RandomState(args.seed)
+    input_size = tuple(args.input_size)
+    if args.tensors is not None:
+        batches, recorded_size = bbox_parser.load_tensors(args.tensors)
+        input_size = recorded_size if all(recorded_size) else input_size
+    else:
+        batches = [synthetic_batch(args.batch_size, args.objects, args.classes, input_size, rng)
+                   for _ in range(args.batches)]
+    n_classes = batches[0][0].shape[1]
+    decoder = bbox_parser.DetectNetDecoder(n_classes, input_size, thresholds=args.threshold, nms_iou=args.nms_iou)
+
+    results = {}
+    for name in ('numpy', 'reference'):
+        objects = []
+        start = time.perf_counter()
+        for cov, bbox in batches:
+            if name == 'numpy':
+                objects.append(decoder.decode(cov, bbox))
+            else:
+                objects.append(reference_parse(cov, bbox, input_size, args.threshold, args.nms_iou))
+        results[name] = (time.perf_counter() - start, objects)
+
+    identical = True
+    for detections, reference in zip(results['numpy'][1], results['reference'][1]):
+        rows = np.column_stack([detections.frames, detections.class_ids, detections.scores, detections.boxes])
+        reference = np.array(reference, dtype=np.float64).reshape(-1, 7)
+        identical &= rows.shape == reference.shape and np.allclose(rows, reference, atol=1e-3)
+    n_frames = sum(len(cov) for cov, _ in batches)
+    n_cells = sum(int((cov >= args.threshold).sum()) for cov, _ in batches)
+    n_objects = sum(len(detections.scores) for detections in results['numpy'][1])
+    print(f'Batches: {len(batches)}, {n_frames} frames, {n_classes} classes, grid {batches[0][0].shape[2:]}, '
+          f'input {input_size[0]}x{input_size[1]}')
+    print(f'Cells above threshold: {n_cells / n_frames:.1f} per frame, objects after NMS: {n_objects / n_frames:.1f} '
+          f'per frame, identical to reference: {identical}')
+    for name, (elapsed, _) in results.items():
+        print(f'{name:10} {n_frames / elapsed:10.0f} frames/s {1e6 * elapsed / len(batches):12.1f} us/batch')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Cross-model de-duplication throughput on CPU.
+
+Generates synthetic frames as two detectors would see them: PeopleNet-like objects (person, bag, face) and
+DashCamNet-like objects (car, bicycle, person, road_sign), where a share of the persons is detected by both
+models with jittered boxes. Each frame is fused with fusion.fuse() and with a pure Python pairwise reference,
+the results are checked to be identical and the throughput is reported in objects per second.
+
+Example:
+    $ python3 bench_fusion.py -frames 2000 -objects 40 -duplicates 0.5
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from common import fusion
+
+MODELS_LABELS = {1: ['person', 'bag', 'face'],
+                 2: ['car', 'bicycle', 'person', 'road_sign'],
+                 }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Cross-model NMS benchmark')
+    parser.add_argument('-frames', metavar='frames', type=int, default=2000, help='int, number of frames')
+    parser.add_argument('-objects', metavar='objects', type=int, default=40, help='int, objects per frame and model')
+    parser.add_argument('-duplicates', metavar='duplicates', type=float, default=0.5,
+                        help='float, share of persons detected by both models')
+    parser.add_argument('-iou', metavar='iou', type=float, default=0.5, help='float, duplicates IOU')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, random seed')
+    return parser.parse_args()
+
+
+def synthetic_frame(n_objects: int, duplicates: float, rng: np.random.RandomState) -> tuple:
+    """
+    :return: (boxes, scores, component ids, class ids)
+    """
+    boxes = np.concatenate([rng.uniform(0, 1800, (2 * n_objects, 2)),
+                            rng.uniform(20, 200, (2 * n_objects, 2))], axis=1)
+    components = np.repeat([1, 2], n_objects)
+    classes = np.concatenate([rng.randint(0, 3, n_objects), rng.randint(0, 4, n_objects)])
+    # DashCamNet persons on top of PeopleNet persons
+    persons = np.flatnonzero(classes[:n_objects] == 0)
+    n_dup = int(len(persons) * duplicates)
+    dup = n_objects + np.arange(n_dup)
+    boxes[dup] = boxes[persons[:n_dup]] + rng.normal(0, 3, (n_dup, 4))
+    classes[dup] = 2
+    scores = rng.uniform(0.2, 1.0, 2 * n_objects)
+    return boxes.astype(np.float32), scores.astype(np.float32), components, classes
+
+
+def reference_fuse(boxes, scores, classes, models, iou_threshold):
+    def iou(a, b):
+        ax2, ay2, bx2, by2 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+        w = max(0.0, min(ax2, bx2) - max(a[0], b[0]))
+        h = max(0.0, min(ay2, by2) - max(a[1], b[1]))
+        inter = w * h
+        union = a[2] * a[3] + b[2] * b[3] - inter
+        return inter / union if union > 0 else 0.0
+
+    order = sorted(range(len(scores)), key=lambda i: -scores[i])
+    keep = [True] * len(scores)
+    for rank, i in enumerate(order):
+        if not keep[i] or classes[i] < 0:
+            continue
+        for j in order[rank + 1:]:
+            if keep[j] and classes[j] == classes[i] and models[j] != models[i] and \
+                    iou(boxes[i], boxes[j]) > iou_threshold:
+                keep[j] = False
+    return np.array(keep)
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.RandomState(args.seed)
+    taxonomy = fusion.Taxonomy(MODELS_LABELS)
+    frames = [synthetic_frame(args.objects, args.duplicates, rng) for _ in range(args.frames)]
+
+    results = {}
+    for name in ('numpy', 'reference'):
+        masks = []
+        start = time.perf_counter()
+        for boxes, scores, components, class_ids in frames:
+            shared = taxonomy.shared_ids(components, class_ids)
+            if name == 'numpy':
+                masks.append(fusion.fuse(boxes, scores, shared, components, args.iou))
+            else:
+                masks.append(reference_fuse(boxes.tolist(), scores.tolist(), shared.tolist(),
+                                            components.tolist(), args.iou))
+        results[name] = (time.perf_counter() - start, masks)
+
+    n_objects = sum(len(frame[1]) for frame in frames)
+    n_removed = sum(int((~mask).sum()) for mask in results['numpy'][1])
+    identical = all(np.array_equal(a, b) for a, b in zip(results['numpy'][1], results['reference'][1]))
+    print(f'Taxonomy: {taxonomy.names}')
+    print(f'Frames: {args.frames}, {2 * args.objects} objects per frame, {n_removed} duplicates removed, '
+          f'identical to reference: {identical}')
+    for name, (elapsed, _) in results.items():
+        print(f'{name:10} {n_objects / elapsed:12.0f} objects/s {1e6 * elapsed / args.frames:10.1f} us/frame')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Throughput benchmark of the headless and display pipeline topologies.
+
+Both topologies decode nothing: every source is a videotestsrc, and both join the sources into one stream
+ending in the same fakesink, so the measured difference is the cost of the tiler, color conversion and RGBA caps
+that the display path adds after the analytics chain. With the DeepStream plugins available the pipelines use
+nvstreammux/nvmultistreamtiler/nvvideoconvert, otherwise the same topologies are built from CPU elements: a funnel
+stands for the muxer, compositor/videoconvert for the tiler and conversion. The elements of every variant are
+printed with its result (TOPOLOGY_ELEMENTS).
+
+Example:
+    $ python3 bench_headless.py -n_sources 8 -num_buffers 600
+"""
+import argparse
+import sys
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+TOPOLOGIES = ('headless', 'display')
+# What each variant runs after the sources, per backend
+TOPOLOGY_ELEMENTS = {
+    ('nv', 'headless'): 'nvvideoconvert to NVMM per source, nvstreammux, fakesink',
+    ('nv', 'display'): 'nvvideoconvert to NVMM per source, nvstreammux, nvmultistreamtiler, nvvideoconvert to RGBA, '
+                       'fakesink',
+    ('cpu', 'headless'): 'queue per source, funnel, fakesink',
+    ('cpu', 'display'): 'queue per source, compositor, videoconvert to RGBA, fakesink',
+}
+# Both topologies end in the same sink
+SINK = 'fakesink name=sink sync=false async=false qos=false enable-last-sample=false'
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Headless vs display topology benchmark')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=4, help='int, number of sources')
+    parser.add_argument('-num_buffers', metavar='num_buffers', type=int, default=300,
+                        help='int, frames per source')
+    parser.add_argument('-width', metavar='width', type=int, default=1920, help='int, frame width')
+    parser.add_argument('-height', metavar='height', type=int, default=1080, help='int, frame height')
+    parser.add_argument('-backend', metavar='backend', type=str, default='auto', choices=('auto', 'nv', 'cpu'),
+                        help='str, elements backend: auto, nv or cpu')
+    parser.add_argument('-repeat', metavar='repeat', type=int, default=3, help='int, runs per topology')
+    return parser.parse_args()
+
+
+def has_nv_plugins() -> bool:
+    return all(Gst.ElementFactory.find(name) for name in ('nvstreammux', 'nvmultistreamtiler', 'nvvideoconvert'))
+
+
+def nv_pipeline_string(topology: str, n_sources: int, num_buffers: int, width: int, height: int) -> str:
+    rows = max(1, int(n_sources ** 0.5))
+    columns = (n_sources + rows - 1) // rows
+    sources = ' '.join(
+        f'videotestsrc num-buffers={num_buffers} pattern=ball '
+        f'! video/x-raw,width={width},height={height},format=NV12 '
+        f'! nvvideoconvert ! video/x-raw(memory:NVMM),format=NV12 ! mux.sink_{i}'
+        for i in range(n_sources)
+    )
+    head = f'nvstreammux name=mux batch-size={n_sources} width={width} height={height} batched-push-timeout=40000'
+    if topology == 'headless':
+        tail = SINK
+    else:
+        tail = (f'nvmultistreamtiler rows={rows} columns={columns} width={width} height={height} '
+                f'! nvvideoconvert ! video/x-raw(memory:NVMM),format=RGBA ! {SINK}')
+    return f'{head} ! {tail} {sources}'
+
+
+def cpu_pipeline_string(topology: str, n_sources: int, num_buffers: int, width: int, height: int) -> str:
+    src = f'videotestsrc num-buffers={num_buffers} pattern=ball ! video/x-raw,width={width},height={height},format=I420'
+    if topology == 'headless':
+        # One stream into one sink as after the muxer, without compositing
+        sources = ' '.join(f'{src} ! queue ! join.sink_{i}' for i in range(n_sources))
+        return f'funnel name=join ! {SINK} {sources}'
+    rows = max(1, int(n_sources ** 0.5))
+    columns = (n_sources + rows - 1) // rows
+    tile_w, tile_h = width // columns, height // rows
+    pads = ' '.join(
+        f'sink_{i}::xpos={(i % columns) * tile_w} sink_{i}::ypos={(i // columns) * tile_h} '
+        f'sink_{i}::width={tile_w} sink_{i}::height={tile_h}'
+        for i in range(n_sources)
+    )
+    sources = ' '.join(f'{src} ! queue ! comp.sink_{i}' for i in range(n_sources))
+    return (f'compositor name=comp {pads} ! video/x-raw,width={width},height={height} '
+            f'! videoconvert ! video/x-raw,format=RGBA ! {SINK} {sources}')
+
+
+def run_once(description: str) -> float:
+    """
+    Run a pipeline until EOS
+    :param description: gst-launch pipeline description
+    :return: elapsed seconds
+    """
+    pipeline = Gst.parse_launch(description)
+    bus = pipeline.get_bus()
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = bus.timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    elapsed = time.perf_counter() - start
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug = msg.parse_error()
+        raise RuntimeError(f'{err.message}: {debug}')
+    return elapsed
+
+
+def main():
+    args = parse_arguments()
+    Gst.init(None)
+
+    backend = args.backend
+    if backend == 'auto':
+        backend = 'nv' if has_nv_plugins() else 'cpu'
+    make_description = nv_pipeline_string if backend == 'nv' else cpu_pipeline_string
+    n_frames = args.n_sources * args.num_buffers
+
+    print(f'Backend: {backend}, sources: {args.n_sources}, frames per source: {args.num_buffers}, '
+          f'resolution: {args.width}x{args.height}')
+    results = {}
+    for topology in TOPOLOGIES:
+        description = make_description(topology, args.n_sources, args.num_buffers, args.width, args.height)
+        timings = [run_once(description) for _ in range(args.repeat)]
+        results[topology] = n_frames / min(timings)
+        print(f'{topology:>10}: {results[topology]:10.1f} frames/s (best of {args.repeat}), '
+              f'{TOPOLOGY_ELEMENTS[(backend, topology)]}')
+    print(f'headless/display speedup: {results["headless"] / results["display"]:.2f}x')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
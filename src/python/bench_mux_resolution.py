@@ -0,0 +1,109 @@
+"""
+Throughput of the muxer at a fixed 1920x1080 vs at the model input size.
+
+Sources are videotestsrc at the camera size. The fixed layout scales them to 1920x1080 in the muxer and
+again to the network input size, as nvinfer does before inference. The model layout muxes at the size
+derived by resolution.muxer_resolution(), so the only scaling is from the camera size.
+With the DeepStream plugins available the pipelines use nvstreammux/nvvideoconvert, otherwise the same
+scaling passes are built from CPU elements (videoscale). Frames per second and bytes per NV12 batch are reported.
+
+Example:
+    $ python3 bench_mux_resolution.py -n_sources 8 -source_size 1280x720 -model_size 960x544
+"""
+import argparse
+import sys
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from common import resolution
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Muxer resolution benchmark')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=4, help='int, number of sources')
+    parser.add_argument('-num_buffers', metavar='num_buffers', type=int, default=300,
+                        help='int, frames per source')
+    parser.add_argument('-source_size', metavar='source_size', type=str, default='1280x720',
+                        help='str, camera WxH')
+    parser.add_argument('-model_size', metavar='model_size', type=str, default='960x544',
+                        help='str, network input WxH')
+    parser.add_argument('-backend', metavar='backend', type=str, default='auto', choices=('auto', 'nv', 'cpu'),
+                        help='str, elements backend: auto, nv or cpu')
+    parser.add_argument('-repeat', metavar='repeat', type=int, default=3, help='int, runs per layout')
+    return parser.parse_args()
+
+
+def has_nv_plugins() -> bool:
+    return all(Gst.ElementFactory.find(name) for name in ('nvstreammux', 'nvvideoconvert'))
+
+
+def nv_pipeline_string(n_sources: int, num_buffers: int, source: tuple, mux: tuple, model: tuple) -> str:
+    sources = ' '.join(
+        f'videotestsrc num-buffers={num_buffers} pattern=ball '
+        f'! video/x-raw,width={source[0]},height={source[1]},format=NV12 '
+        f'! nvvideoconvert ! video/x-raw(memory:NVMM),format=NV12 ! mux.sink_{i}'
+        for i in range(n_sources)
+    )
+    return (f'nvstreammux name=mux batch-size={n_sources} width={mux[0]} height={mux[1]} batched-push-timeout=40000 '
+            f'! nvvideoconvert ! video/x-raw(memory:NVMM),width={model[0]},height={model[1]},format=RGBA '
+            f'! fakesink sync=false async=false qos=false enable-last-sample=false {sources}')
+
+
+def cpu_pipeline_string(n_sources: int, num_buffers: int, source: tuple, mux: tuple, model: tuple) -> str:
+    return ' '.join(
+        f'videotestsrc num-buffers={num_buffers} pattern=ball '
+        f'! video/x-raw,width={source[0]},height={source[1]},format=NV12 '
+        f'! videoscale ! video/x-raw,width={mux[0]},height={mux[1]} '
+        f'! videoscale ! video/x-raw,width={model[0]},height={model[1]} '
+        f'! fakesink sync=false async=false qos=false enable-last-sample=false'
+        for _ in range(n_sources)
+    )
+
+
+def run_once(description: str) -> float:
+    pipeline = Gst.parse_launch(description)
+    bus = pipeline.get_bus()
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = bus.timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    elapsed = time.perf_counter() - start
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug = msg.parse_error()
+        raise RuntimeError(f'{err.message}: {debug}')
+    return elapsed
+
+
+def main():
+    args = parse_arguments()
+    Gst.init(None)
+
+    backend = args.backend
+    if backend == 'auto':
+        backend = 'nv' if has_nv_plugins() else 'cpu'
+    make_description = nv_pipeline_string if backend == 'nv' else cpu_pipeline_string
+    source = resolution.parse_size(args.source_size)
+    model = resolution.parse_size(args.model_size)
+    layouts = {'fixed': (1920, 1080),
+               'model': resolution.muxer_resolution([model], [source]),
+               }
+    n_frames = args.n_sources * args.num_buffers
+
+    print(f'Backend: {backend}, sources: {args.n_sources}x{args.source_size}, model input: {args.model_size}')
+    results = {}
+    for name, mux in layouts.items():
+        description = make_description(args.n_sources, args.num_buffers, source, mux, model)
+        timings = [run_once(description) for _ in range(args.repeat)]
+        results[name] = n_frames / min(timings)
+        batch_mb = mux[0] * mux[1] * 1.5 * args.n_sources / 1e6
+        print(f'{name:>6} {mux[0]}x{mux[1]}: {results[name]:10.1f} frames/s, {batch_mb:6.1f} MB per NV12 batch '
+              f'(best of {args.repeat})')
+    print(f'model/fixed speedup: {results["model"] / results["fixed"]:.2f}x')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
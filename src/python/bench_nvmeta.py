@@ -0,0 +1,128 @@
+"""
+Per-object overhead of metadata access in probes, on CPU with fake DeepStream metadata.
+
+Compares the hand-written l_frame/l_obj loops of the probes (with and without the try/except StopIteration
+blocks and per-object tuple building of det_buffer_probe) to the nvmeta iterators and to nvmeta.object_arrays(),
+which reads every field once and returns NumPy arrays for the vectorized consumers (tracker, fusion, analytics).
+Fake metadata are plain Python objects: attribute reads of pyds bindings are slower, so absolute numbers on
+a DeepStream host are higher while the ordering of the variants holds.
+
+Example:
+    $ python3 bench_nvmeta.py -sources 8 -objects 30 -batches 2000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from common import nvmeta
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Metadata iteration benchmark')
+    parser.add_argument('-sources', metavar='sources', type=int, default=8, help='int, frames per batch')
+    parser.add_argument('-objects', metavar='objects', type=int, default=30, help='int, objects per frame')
+    parser.add_argument('-batches', metavar='batches', type=int, default=2000, help='int, number of batches')
+    return parser.parse_args()
+
+
+def cast(data):
+    # Stands for pyds.NvDsFrameMeta.cast / pyds.NvDsObjectMeta.cast
+    return data
+
+
+def handwritten_stop_iteration(batch_meta) -> int:
+    n = 0
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        try:
+            frame_meta = cast(l_frame.data)
+        except StopIteration:
+            break
+        l_obj = frame_meta.obj_meta_list
+        l_obj_info = []
+        while l_obj is not None:
+            try:
+                obj_meta = cast(l_obj.data)
+            except StopIteration:
+                break
+            rect_params = obj_meta.rect_params
+            top = int(rect_params.top)
+            left = int(rect_params.left)
+            width = int(rect_params.width)
+            height = int(rect_params.height)
+            l_obj_info.append((frame_meta.batch_id, frame_meta.pad_index, obj_meta.confidence,
+                               (top, left, width, height), obj_meta.class_id))
+            try:
+                l_obj = l_obj.next
+            except StopIteration:
+                break
+        n += len(l_obj_info)
+        try:
+            l_frame = l_frame.next
+        except StopIteration:
+            break
+    return n
+
+
+def handwritten_boxes(batch_meta) -> int:
+    n = 0
+    l_frame = batch_meta.frame_meta_list
+    while l_frame is not None:
+        frame_meta = cast(l_frame.data)
+        boxes = []
+        l_obj = frame_meta.obj_meta_list
+        while l_obj is not None:
+            obj_meta = cast(l_obj.data)
+            rect_params = obj_meta.rect_params
+            boxes.append((rect_params.left, rect_params.top, rect_params.width, rect_params.height))
+            l_obj = l_obj.next
+        n += len(np.array(boxes, dtype=np.float32).reshape(-1, 4))
+        l_frame = l_frame.next
+    return n
+
+
+def iterators_boxes(batch_meta) -> int:
+    n = 0
+    for frame_meta, obj_metas in nvmeta.batch_objects(batch_meta):
+        boxes = []
+        for obj_meta in obj_metas:
+            rect_params = obj_meta.rect_params
+            boxes.append((rect_params.left, rect_params.top, rect_params.width, rect_params.height))
+        n += len(np.array(boxes, dtype=np.float32).reshape(-1, 4))
+    return n
+
+
+def object_arrays(batch_meta) -> int:
+    n = 0
+    for frame_meta, obj_metas in nvmeta.batch_objects(batch_meta):
+        n += len(nvmeta.object_arrays(obj_metas).boxes)
+    return n
+
+
+VARIANTS = {'handwritten, StopIteration + tuples': handwritten_stop_iteration,
+            'handwritten, boxes array': handwritten_boxes,
+            'nvmeta iterators, boxes array': iterators_boxes,
+            'nvmeta.object_arrays, all fields': object_arrays,
+            }
+
+
+def main():
+    args = parse_arguments()
+    nvmeta.use_fake_metadata()
+    rng = np.random.RandomState(0)
+    buffers = [nvmeta.fake_batch(args.sources, args.objects, frame_num=i, rng=rng) for i in range(16)]
+
+    print(f'{args.batches} batches of {args.sources} frames x {args.objects} objects')
+    for name, function in VARIANTS.items():
+        n_objects = 0
+        start = time.perf_counter()
+        for i in range(args.batches):
+            n_objects += function(nvmeta.batch_meta(buffers[i % len(buffers)]))
+        elapsed = time.perf_counter() - start
+        print(f'{name:36} {1e9 * elapsed / n_objects:8.0f} ns/object {1e6 * elapsed / args.batches:10.1f} us/batch')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+CPU throughput and latency benchmark of the shared memory frame export.
+
+A writer process publishes synthetic RGBA frames with objects metadata for every source as fast as
+possible (or at a fixed rate), a reader process per source maps them zero-copy and measures the
+publish-to-read latency.
+
+Example:
+    $ python3 bench_shm_export.py -n_sources 4 -frames 2000 -width 960 -height 540
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from common import shm_ring
+
+PREFIX = 'bench_shm'
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Shared memory export benchmark')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=4, help='int, number of sources')
+    parser.add_argument('-frames', metavar='frames', type=int, default=1000, help='int, frames per source')
+    parser.add_argument('-width', metavar='width', type=int, default=960, help='int, frame width')
+    parser.add_argument('-height', metavar='height', type=int, default=540, help='int, frame height')
+    parser.add_argument('-objects', metavar='objects', type=int, default=16, help='int, objects per frame')
+    parser.add_argument('-fps', metavar='fps', type=float, default=0, help='float, publish rate, 0 - unlimited')
+    return parser.parse_args()
+
+
+def writer_process(args, ready, done):
+    writers = [shm_ring.ShmFrameWriter(i, args.width, args.height, prefix=PREFIX, verbose=False)
+               for i in range(args.n_sources)]
+    image = np.random.randint(0, 255, (args.height, args.width, 4), dtype=np.uint8)
+    objects = np.zeros(args.objects, dtype=shm_ring.OBJECT_DTYPE)
+    objects['width'], objects['height'] = 64, 128
+    ready.set()
+    time.sleep(0.5)
+
+    period = 1.0 / args.fps if args.fps else 0
+    start = time.perf_counter()
+    for frame_num in range(args.frames):
+        for writer in writers:
+            writer.write(image, frame_num, objects=objects)
+        if period:
+            time.sleep(max(0.0, start + (frame_num + 1) * period - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+    done.put(elapsed)
+    # Let readers finish before the rings disappear
+    time.sleep(1.0)
+    for writer in writers:
+        writer.close()
+
+
+def reader_process(args, source_id, results):
+    reader = shm_ring.ShmFrameReader(source_id, prefix=PREFIX)
+    latencies = []
+    torn = 0
+    while True:
+        frame = reader.poll(timeout=1.0, interval=0)
+        if frame is None:
+            break
+        latency = time.time() - frame.timestamp
+        # Touch the pixels and the objects as a consumer would
+        frame.image[::64, ::64, 0].sum()
+        frame.objects['class_id'].sum()
+        if not reader.is_valid(frame):
+            torn += 1
+            continue
+        latencies.append(latency)
+        if frame.frame_num == args.frames - 1:
+            break
+    results.put((source_id, np.array(latencies), torn))
+    del frame
+    reader.close()
+
+
+def main():
+    args = parse_arguments()
+    ready = multiprocessing.Event()
+    done = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+
+    writer = multiprocessing.Process(target=writer_process, args=(args, ready, done))
+    writer.start()
+    ready.wait()
+    readers = [multiprocessing.Process(target=reader_process, args=(args, i, results))
+               for i in range(args.n_sources)]
+    for reader in readers:
+        reader.start()
+
+    elapsed = done.get()
+    frame_bytes = args.width * args.height * 4
+    n_frames = args.frames * args.n_sources
+    print(f'Sources: {args.n_sources}, frames per source: {args.frames}, frame: {args.width}x{args.height} RGBA')
+    print(f'Writer: {n_frames / elapsed:10.1f} frames/s, {n_frames * frame_bytes / elapsed / 1e9:6.2f} GB/s')
+    for _ in readers:
+        source_id, latencies, torn = results.get()
+        if len(latencies):
+            print(f'Reader {source_id}: read {len(latencies)} frames, overwritten {torn}, latency ms '
+                  f'p50 {1e3 * np.percentile(latencies, 50):.3f} p99 {1e3 * np.percentile(latencies, 99):.3f}')
+        else:
+            print(f'Reader {source_id}: no frames read')
+    for process in readers + [writer]:
+        process.join()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
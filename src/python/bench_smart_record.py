@@ -0,0 +1,130 @@
+"""
+CPU cost of the smart record pre-roll rings.
+
+Simulates N cameras of encoded H.264 (keyframe every GOP, bitrate split between I and P frames) and feeds
+every frame through SmartRecorder.push as the record appsink would, including the copy of the buffer data.
+Reports the CPU time per frame, the share of one core needed to keep up in real time, the ring memory
+and the cost of taking a pre-roll snapshot when a detection fires. The write path is measured on real H.264
+(videotestsrc encoded by x264enc, needs gst-plugins-ugly): the wall and CPU time to mux one pre-roll plus post-roll
+clip to MP4, and how many of the simultaneous triggers of all cameras the clip bounds admit.
+
+Example:
+    $ python3 bench_smart_record.py -n_sources 32 -seconds 60
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from common import smart_record
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Smart record CPU cost benchmark')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=32, help='int, number of cameras')
+    parser.add_argument('-seconds', metavar='seconds', type=int, default=60, help='int, simulated video seconds')
+    parser.add_argument('-fps', metavar='fps', type=int, default=30, help='int, camera frame rate')
+    parser.add_argument('-gop', metavar='gop', type=int, default=30, help='int, frames per GOP')
+    parser.add_argument('-bitrate', metavar='bitrate', type=float, default=4.0, help='float, Mbit/s per camera')
+    parser.add_argument('-pre_roll', metavar='pre_roll', type=float, default=5.0, help='float, pre-roll seconds')
+    parser.add_argument('-post_roll', metavar='post_roll', type=float, default=5.0, help='float, post-roll seconds')
+    parser.add_argument('-clips', metavar='clips', type=int, default=4, help='int, clips muxed, 0 to skip')
+    return parser.parse_args()
+
+
+def encode_frames(seconds: float, fps: int, gop: int, bitrate: float) -> tuple:
+    """
+    :return: (list of EncodedFrame, caps) of an H.264 test stream, as the record appsink receives them
+    """
+    pipeline = Gst.parse_launch(f'videotestsrc num-buffers={int(seconds * fps)} pattern=ball ! '
+                                f'video/x-raw,width=1280,height=720,framerate={fps}/1 ! '
+                                f'x264enc speed-preset=ultrafast tune=zerolatency key-int-max={gop} '
+                                f'bitrate={int(bitrate * 1000)} ! h264parse ! '
+                                f'video/x-h264,stream-format=byte-stream,alignment=au ! appsink name=sink sync=false')
+    # The ring keeps twice the pre-roll, the whole stream here
+    recorder = smart_record.SmartRecorder(0, tempfile.mkdtemp(prefix='bench_smart_record_'), pre_roll=seconds,
+                                          max_bytes=2 ** 31, verbose=False)
+    recorder.attach(pipeline.get_by_name('sink'))
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if msg.type == Gst.MessageType.ERROR:
+        err, debug = msg.parse_error()
+        raise RuntimeError(f'H.264 test stream failed: {err.message}')
+    return recorder.ring.snapshot(), recorder.caps
+
+
+def bench_write(args: argparse.Namespace, output_dir: str) -> None:
+    frames, caps = encode_frames(args.pre_roll + args.post_roll, args.fps, args.gop, args.bitrate)
+    clip_bytes = sum(len(frame.data) for frame in frames)
+    recorder = smart_record.SmartRecorder(0, output_dir, verbose=False)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    saved = sum(recorder.mux_clip({'frames': frames, 'caps': caps, 'location': f'{output_dir}/clip{i}.mp4'})
+                for i in range(args.clips))
+    wall_elapsed, cpu_elapsed = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    print(f'Clip mux and write:   {1e3 * wall_elapsed / args.clips:8.2f} ms wall, '
+          f'{1e3 * cpu_elapsed / args.clips:.2f} ms CPU per clip of {len(frames)} frames, '
+          f'{clip_bytes / 2 ** 20:.1f} MiB, {saved}/{args.clips} saved')
+    print(f'Mux throughput:       {clip_bytes * args.clips / 2 ** 20 / wall_elapsed:8.1f} MiB/s, '
+          f'{(args.pre_roll + args.post_roll) * args.clips / wall_elapsed:.0f} s of video per second per thread')
+
+
+def main():
+    args = parse_arguments()
+    Gst.init(None)
+
+    # Keyframes take about a third of a GOP bitrate
+    gop_bytes = int(args.bitrate * 1e6 / 8 * args.gop / args.fps)
+    key_bytes = gop_bytes // 3
+    delta_bytes = (gop_bytes - key_bytes) // max(1, args.gop - 1)
+    payloads = {True: bytearray(key_bytes), False: bytearray(delta_bytes)}
+    frame_duration = Gst.SECOND // args.fps
+
+    output_dir = tempfile.mkdtemp(prefix='bench_smart_record_')
+    recorders = [smart_record.SmartRecorder(i, output_dir, pre_roll=args.pre_roll, verbose=False)
+                 for i in range(args.n_sources)]
+
+    n_frames = args.seconds * args.fps
+    cpu_start = time.process_time()
+    for frame_num in range(n_frames):
+        is_keyframe = frame_num % args.gop == 0
+        pts = frame_num * frame_duration
+        for recorder in recorders:
+            # bytes() stands for Gst.Buffer.extract_dup in the appsink callback
+            frame = smart_record.EncodedFrame(data=bytes(payloads[is_keyframe]), pts=pts, dts=pts,
+                                              duration=frame_duration, is_keyframe=is_keyframe)
+            recorder.push(frame)
+    cpu_elapsed = time.process_time() - cpu_start
+
+    snapshot_start = time.perf_counter()
+    for recorder in recorders:
+        recorder.ring.snapshot(args.pre_roll)
+    snapshot_elapsed = time.perf_counter() - snapshot_start
+
+    total_frames = n_frames * args.n_sources
+    ring_bytes = sum(recorder.ring.n_bytes for recorder in recorders)
+    print(f'Cameras: {args.n_sources}, {args.fps} fps, GOP {args.gop}, {args.bitrate} Mbit/s, '
+          f'{args.seconds} s simulated')
+    print(f'CPU per frame:        {1e6 * cpu_elapsed / total_frames:8.2f} us')
+    print(f'Real-time core usage: {100 * cpu_elapsed / args.seconds:8.2f} %')
+    print(f'Ring memory:          {ring_bytes / 2 ** 20:8.1f} MiB total, '
+          f'{ring_bytes / 2 ** 20 / args.n_sources:.2f} MiB per camera')
+    print(f'Pre-roll snapshot:    {1e6 * snapshot_elapsed / args.n_sources:8.2f} us per camera')
+
+    # Every camera fires at once: the clip bounds admit only some of the triggers
+    for recorder in recorders:
+        recorder.trigger('bench')
+    admitted = sum(recorder.is_recording for recorder in recorders)
+    print(f'Simultaneous triggers: {admitted}/{args.n_sources} admitted, '
+          f'{smart_record.SmartRecorder.max_clips} clips in flight at most')
+    if args.clips > 0:
+        bench_write(args, output_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
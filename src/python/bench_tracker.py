@@ -0,0 +1,223 @@
+"""
+Tracker backends: per-stream cost and ID switches.
+
+CPU backends run tracking.IOUTracker on a ground-truth sequence: a MOTChallenge gt.txt (-gt) or synthetic
+objects moving with constant velocity. Detections are the ground-truth boxes with position noise and
+missed detections, so ID switches are counted against the true identities:
+    iou  - IOU matching only
+    sort - IOU matching of velocity-predicted tracks
+
+DeepStream backends (nvdcf, iou, klt) run with -video: the video is decoded -n_streams times, batched by
+nvstreammux and processed by the Primary_Detector and nvtracker. The nvtracker time per batch is measured
+between its sink and src pads. With -gt of the same video ID switches of stream 0 are counted as well.
+
+Examples:
+    $ python3 bench_tracker.py -n_streams 16 -frames 900
+    $ python3 bench_tracker.py -gt MOT17-04/gt/gt.txt -jitter 4 -miss 0.2
+    $ python3 bench_tracker.py -video MOT17-04.mp4 -gt MOT17-04/gt/gt.txt -backends nvdcf iou klt
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from common import tracking
+
+CPU_BACKENDS = {'iou': {'motion': False}, 'sort': {'motion': True}}
+DEEPSTREAM_BACKENDS = {'nvdcf': 'libnvds_nvdcf', 'iou': 'libnvds_mot_iou', 'klt': 'libnvds_mot_klt'}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Tracker backends benchmark')
+    parser.add_argument('-backends', metavar='backends', type=str, nargs='+', default=None,
+                        help='str, backends to compare: iou, sort on CPU, nvdcf, iou, klt with -video')
+    parser.add_argument('-gt', metavar='gt', type=str, default=None, help='str, MOTChallenge gt.txt sequence')
+    parser.add_argument('-video', metavar='video', type=str, default=None, help='str, video for DeepStream backends')
+    parser.add_argument('-n_streams', metavar='n_streams', type=int, default=8, help='int, number of streams')
+    parser.add_argument('-frames', metavar='frames', type=int, default=600, help='int, synthetic sequence frames')
+    parser.add_argument('-objects', metavar='objects', type=int, default=20, help='int, synthetic objects per frame')
+    parser.add_argument('-jitter', metavar='jitter', type=float, default=3.0, help='float, detection noise, pixels')
+    parser.add_argument('-miss', metavar='miss', type=float, default=0.1, help='float, missed detection rate')
+    parser.add_argument('-tracker_width', metavar='tracker_width', type=int, default=640,
+                        help='int, nvtracker frame width')
+    parser.add_argument('-tracker_height', metavar='tracker_height', type=int, default=384,
+                        help='int, nvtracker frame height')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, random seed')
+    return parser.parse_args()
+
+
+def load_mot(path: str) -> dict:
+    """
+    :param path: MOTChallenge file: frame, id, left, top, width, height, conf, ...
+    :return: frame -> (ids, (N, 4) ltwh boxes)
+    """
+    data = np.loadtxt(path, delimiter=',', ndmin=2)
+    if data.shape[1] > 6:
+        # gt.txt marks ignored entries with conf 0
+        data = data[data[:, 6] != 0]
+    frames = {}
+    for frame in np.unique(data[:, 0]).astype(int):
+        rows = data[data[:, 0] == frame]
+        frames[frame] = (rows[:, 1].astype(np.int64), rows[:, 2:6].astype(np.float32))
+    return frames
+
+
+def synthetic_sequence(n_frames: int, n_objects: int, rng: np.random.RandomState,
+                       width: int = 1920, height: int = 1080) -> dict:
+    """
+    Objects moving with constant velocity and bouncing off the frame borders, paths cross regularly
+    :return: frame -> (ids, (N, 4) ltwh boxes)
+    """
+    size = rng.uniform(40, 160, (n_objects, 2)) * np.array([0.5, 1.0])
+    position = rng.uniform(0, 1, (n_objects, 2)) * (np.array([width, height]) - size)
+    velocity = rng.uniform(-6, 6, (n_objects, 2))
+    ids = np.arange(n_objects, dtype=np.int64)
+    frames = {}
+    for frame in range(1, n_frames + 1):
+        frames[frame] = (ids, np.concatenate([position, size], axis=1).astype(np.float32))
+        position = position + velocity
+        for axis, bound in ((0, width), (1, height)):
+            out = (position[:, axis] < 0) | (position[:, axis] + size[:, axis] > bound)
+            velocity[out, axis] *= -1
+            position[:, axis] = np.clip(position[:, axis], 0, bound - size[:, axis])
+    return frames
+
+
+def make_detections(gt: dict, jitter: float, miss: float, rng: np.random.RandomState) -> dict:
+    detections = {}
+    for frame, (ids, boxes) in gt.items():
+        keep = rng.uniform(size=len(ids)) >= miss
+        noisy = boxes[keep] + rng.normal(0, jitter, (int(keep.sum()), 4)).astype(np.float32)
+        noisy[:, 2:] = np.maximum(noisy[:, 2:], 1.0)
+        detections[frame] = (ids[keep], noisy)
+    return detections
+
+
+def count_id_switches(gt: dict, tracked: dict, iou_threshold: float = 0.5) -> tuple:
+    """
+    A switch is counted when a ground-truth object is matched to a different track id than the last time
+    :param gt:      frame -> (ids, ltwh boxes)
+    :param tracked: frame -> (track ids, ltwh boxes), untracked objects excluded
+    :return: (id switches, matched objects, ground-truth objects)
+    """
+    last_track = {}
+    n_switches = n_matched = n_gt = 0
+    for frame, (gt_ids, gt_boxes) in gt.items():
+        n_gt += len(gt_ids)
+        track_ids, track_boxes = tracked.get(frame, (np.empty(0), np.empty((0, 4))))
+        if not len(track_ids) or not len(gt_ids):
+            continue
+        scores = tracking.iou_matrix(tracking.ltwh_to_xyxy(gt_boxes), tracking.ltwh_to_xyxy(track_boxes))
+        rows, cols = tracking.greedy_match(scores, iou_threshold)
+        for gt_id, track_id in zip(gt_ids[rows].tolist(), np.asarray(track_ids)[cols].tolist()):
+            previous = last_track.get(gt_id)
+            if previous is not None and previous != track_id:
+                n_switches += 1
+            last_track[gt_id] = track_id
+            n_matched += 1
+    return n_switches, n_matched, n_gt
+
+
+def run_cpu(backend: str, gt: dict, detections: dict, n_streams: int) -> tuple:
+    """
+    Every stream replays the same detections through its own tracker
+    :return: (seconds per frame per stream, tracked frames of stream 0)
+    """
+    tracker = tracking.MultiStreamTracker(**CPU_BACKENDS[backend])
+    tracked = {}
+    elapsed = 0.0
+    for frame in sorted(detections):
+        _, boxes = detections[frame]
+        class_ids = np.zeros(len(boxes), dtype=np.int64)
+        start = time.perf_counter()
+        for stream in range(n_streams):
+            ids = tracker.update(stream, boxes, class_ids)
+        elapsed += time.perf_counter() - start
+        valid = ids != tracking.UNTRACKED_ID
+        tracked[frame] = (ids[valid], boxes[valid])
+    return elapsed / (len(detections) * n_streams), tracked
+
+
+def run_deepstream(backend: str, args: argparse.Namespace) -> tuple:
+    """
+    :return: (seconds of nvtracker per frame per stream, tracked frames of stream 0)
+    """
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    from common import nvmeta
+
+    Gst.init(None)
+    lib = os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib', f'{DEEPSTREAM_BACKENDS[backend]}.so')
+    config = os.path.join('..', 'configs', 'pgie_primary_detector.txt')
+    uri = f'file://{os.path.abspath(args.video)}'
+    sources = ' '.join(f'uridecodebin uri={uri} ! mux.sink_{i}' for i in range(args.n_streams))
+    pipeline = Gst.parse_launch(
+        f'nvstreammux name=mux batch-size={args.n_streams} width=1920 height=1080 live-source=0 ! '
+        f'nvinfer config-file-path={config} batch-size={args.n_streams} ! '
+        f'nvtracker name=tracker ll-lib-file={lib} tracker-width={args.tracker_width} '
+        f'tracker-height={args.tracker_height} enable-batch-process=1 ! fakesink sync=0 {sources}')
+    tracker = pipeline.get_by_name('tracker')
+
+    started = {}
+    timings = []
+    tracked = {}
+
+    def sink_probe(pad, info, u_data):
+        started[info.get_buffer().pts] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def src_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        start = started.pop(gst_buffer.pts, None)
+        if start is not None:
+            timings.append(time.perf_counter() - start)
+        for frame_meta in nvmeta.frames(nvmeta.batch_meta(gst_buffer)):
+            if frame_meta.pad_index == 0:
+                arrays = nvmeta.object_arrays(nvmeta.objects(frame_meta))
+                valid = arrays.object_ids != tracking.UNTRACKED_ID
+                # MOT frames start from 1
+                tracked[frame_meta.frame_num + 1] = (arrays.object_ids[valid], arrays.boxes[valid])
+        return Gst.PadProbeReturn.OK
+
+    tracker.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, sink_probe, 0)
+    tracker.get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, src_probe, 0)
+    pipeline.set_state(Gst.State.PLAYING)
+    msg = pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if msg is not None and msg.type == Gst.MessageType.ERROR:
+        err, debug = msg.parse_error()
+        raise RuntimeError(f'{backend}: {err.message}')
+    return sum(timings) / max(1, len(timings) * args.n_streams), tracked
+
+
+def main():
+    args = parse_arguments()
+    rng = np.random.RandomState(args.seed)
+
+    if args.gt is not None:
+        gt = load_mot(args.gt)
+    else:
+        gt = synthetic_sequence(args.frames, args.objects, rng)
+
+    if args.video is not None:
+        backends = args.backends or list(DEEPSTREAM_BACKENDS)
+        results = {backend: run_deepstream(backend, args) for backend in backends}
+    else:
+        backends = args.backends or list(CPU_BACKENDS)
+        detections = make_detections(gt, args.jitter, args.miss, rng)
+        results = {backend: run_cpu(backend, gt, detections, args.n_streams) for backend in backends}
+
+    n_objects = sum(len(ids) for ids, _ in gt.values())
+    print(f'Sequence: {len(gt)} frames, {n_objects / max(1, len(gt)):.1f} objects per frame, '
+          f'{args.n_streams} streams')
+    print(f'{"Backend":8} {"us/frame/stream":>16} {"ID switches":>12} {"Matched":>8}')
+    for backend, (seconds, tracked) in results.items():
+        switches, matched, total = count_id_switches(gt, tracked) if tracked else (0, 0, n_objects)
+        print(f'{backend:8} {1e6 * seconds:16.1f} {switches:12d} {100 * matched / max(1, total):7.1f}%')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
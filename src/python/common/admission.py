@@ -0,0 +1,151 @@
+import time
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+STAGES = ('decode', 'mux')
+
+
+class SourceLatency:
+
+    def __init__(self, drift: float = 0.001):
+        """
+        Lateness of the buffers of one source from their timestamps and the wall clock. The transit time
+        (wall clock - pts) of a buffer on time is the baseline, the fastest transit seen. The baseline rises
+        by drift seconds per second, so camera clock drift is not taken for lateness, and is reset on
+        timestamp discontinuities (reconnections).
+        :param drift: seconds per second
+        """
+        self.drift = drift
+        self.baseline = None
+        self.last_pts = None
+        self.last_now = None
+
+    def lateness(self, pts: float, now: float) -> float:
+        """
+        :param pts: buffer timestamp, seconds
+        :param now: wall clock, seconds
+        :return: seconds behind the baseline
+        """
+        transit = now - pts
+        if self.baseline is None or pts < self.last_pts - 1.0 or pts > self.last_pts + 10.0:
+            self.baseline = transit
+        else:
+            self.baseline = min(transit, self.baseline + self.drift * (now - self.last_now))
+        self.last_pts, self.last_now = pts, now
+        return transit - self.baseline
+
+
+class AdmissionController:
+
+    def __init__(self, budget: float = 0.5, report_interval: float = 10.0, metrics=None, verbose: bool = True):
+        """
+        Per-source frame dropping, so one slow decoder or a burst of one camera does not make nvstreammux
+        wait and add latency to every source. Buffers later than the budget are dropped:
+            decode - encoded access units before the decoder. A late frame starts skipping of the rest of
+                     its GOP, admission resumes at the next keyframe on time, so the decoder never sees
+                     a broken reference chain.
+            mux    - decoded frames before nvstreammux, dropped one by one.
+        :param budget:          seconds of lateness allowed
+        :param report_interval: seconds between logged drop reports, 0 disables them
+        :param metrics:         metrics.PipelineMetrics for source_dropped_frames_total, optional
+        :param verbose:
+        """
+        self.budget = budget
+        self.report_interval = report_interval
+        self.metrics = metrics
+        self.verbose = verbose
+        # (source_id, stage) -> counts
+        self.latencies = {}
+        self.admitted = {}
+        self.dropped = {}
+        self._skipping = {}
+        self._counters = {}
+        self._reported = {}
+        self._last_report = time.monotonic()
+
+    def attach(self, source_id: int, pad, stage: str) -> None:
+        """
+        :param source_id: source index
+        :param pad:       decoder sink pad (decode) or decoder src pad (mux)
+        :param stage:     'decode' or 'mux'
+        :return: None
+        """
+        if stage not in STAGES:
+            raise ValueError(f'Unknown admission stage {stage}, expected one of {STAGES}')
+        key = (source_id, stage)
+        # decodebin adds a new src pad after a reconnection: timestamps restart, the counts go on
+        self.latencies[key] = SourceLatency()
+        self.admitted.setdefault(key, 0)
+        self.dropped.setdefault(key, 0)
+        self._skipping[key] = False
+        if self.metrics is not None:
+            self._counters[key] = self.metrics.frames_dropped.labels(source=source_id, stage=stage)
+        probe = self._decode_probe(key) if stage == 'decode' else self._mux_probe(key)
+        pad.add_probe(Gst.PadProbeType.BUFFER, probe, 0)
+
+    def _lateness(self, key: tuple, gst_buffer):
+        if gst_buffer.pts == Gst.CLOCK_TIME_NONE:
+            return None
+        return self.latencies[key].lateness(gst_buffer.pts / Gst.SECOND, time.monotonic())
+
+    def _decode_probe(self, key: tuple):
+        def _buffer_probe(pad, info, u_data):
+            gst_buffer = info.get_buffer()
+            if not gst_buffer:
+                return Gst.PadProbeReturn.OK
+            lateness = self._lateness(key, gst_buffer)
+            late = lateness is not None and lateness > self.budget
+            keyframe = not gst_buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+            if self._skipping[key]:
+                self._skipping[key] = not (keyframe and not late)
+            elif late:
+                self._skipping[key] = True
+            return self._admit(key, not self._skipping[key])
+
+        return _buffer_probe
+
+    def _mux_probe(self, key: tuple):
+        def _buffer_probe(pad, info, u_data):
+            gst_buffer = info.get_buffer()
+            if not gst_buffer:
+                return Gst.PadProbeReturn.OK
+            lateness = self._lateness(key, gst_buffer)
+            return self._admit(key, lateness is None or lateness <= self.budget)
+
+        return _buffer_probe
+
+    def _admit(self, key: tuple, admit: bool):
+        if admit:
+            self.admitted[key] += 1
+        else:
+            self.dropped[key] += 1
+            counter = self._counters.get(key)
+            if counter is not None:
+                counter.inc()
+        if self.report_interval and time.monotonic() - self._last_report >= self.report_interval:
+            self._last_report = time.monotonic()
+            self.log_report()
+        return Gst.PadProbeReturn.OK if admit else Gst.PadProbeReturn.DROP
+
+    def report(self) -> dict:
+        """
+        :return: (source_id, stage) -> (admitted, dropped, dropped since the last report)
+        """
+        report = {}
+        for key in sorted(self.dropped):
+            dropped = self.dropped[key]
+            report[key] = (self.admitted[key], dropped, dropped - self._reported.get(key, 0))
+            self._reported[key] = dropped
+        return report
+
+    def log_report(self) -> None:
+        report = self.report()
+        if not self.verbose or not any(new for _, _, new in report.values()):
+            return
+        lines = [f'source {source_id} {stage}: dropped {new} late frames, total {dropped}/{admitted + dropped}'
+                 for (source_id, stage), (admitted, dropped, new) in report.items() if new]
+        logging.warning(f'{self.__class__.__name__}, budget {self.budget} s:\n' + '\n'.join(lines))
@@ -0,0 +1,291 @@
+import json
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+Zone = namedtuple('Zone', ['name', 'polygon'])
+Line = namedtuple('Line', ['name', 'p1', 'p2'])
+
+
+def load_rules(path: str) -> dict:
+    """
+    Rules file:
+        {"window": 60, "gie_id": 1, "class_ids": [0],
+         "sources": {"0": {"zones": [{"name": "entrance", "polygon": [[x, y], ...]}],
+                           "lines": [{"name": "door", "points": [[x1, y1], [x2, y2]]}]}}}
+    Objects of the gie_id model and class_ids are analyzed. Coordinates are in the native resolution of the
+    source, independent of the muxer size, the object anchor is the bottom center of its box.
+    Line crossings count as "in" from the left to the right side of p1 -> p2 as seen on the image.
+    :param path: JSON rules file
+    :return: dict with window, gie_id, class_ids and source_id -> SourceGeometry
+    """
+    with open(path) as f:
+        rules = json.load(f)
+    sources = {}
+    for source_id, source in rules.get('sources', {}).items():
+        zones = [Zone(z['name'], z['polygon']) for z in source.get('zones', [])]
+        lines = [Line(l['name'], *l['points']) for l in source.get('lines', [])]
+        sources[int(source_id)] = SourceGeometry(zones, lines)
+    return {'window': rules.get('window', 60.0),
+            'gie_id': rules.get('gie_id', 1),
+            'class_ids': rules.get('class_ids'),
+            'sources': sources,
+            }
+
+
+class SourceGeometry:
+
+    def __init__(self, zones: list, lines: list):
+        """
+        Zones and lines of a source as padded edge arrays, so that every check is one broadcast over
+        the objects of a frame
+        :param zones: list of Zone
+        :param lines: list of Line
+        """
+        self.zone_names = [zone.name for zone in zones]
+        self.line_names = [line.name for line in lines]
+
+        # (Z, E) polygon edges, shorter polygons are padded with zero-length edges which never count
+        n_edges = max((len(zone.polygon) for zone in zones), default=0)
+        self.x1 = np.zeros((len(zones), n_edges), dtype=np.float32)
+        self.y1 = np.zeros_like(self.x1)
+        self.x2 = np.zeros_like(self.x1)
+        self.y2 = np.zeros_like(self.x1)
+        for i, zone in enumerate(zones):
+            start = np.asarray(zone.polygon, dtype=np.float32)
+            end = np.roll(start, -1, axis=0)
+            k = len(start)
+            self.x1[i, :k], self.y1[i, :k] = start[:, 0], start[:, 1]
+            self.x2[i, :k], self.y2[i, :k] = end[:, 0], end[:, 1]
+        dy = self.y2 - self.y1
+        self.slope = np.divide(self.x2 - self.x1, dy, out=np.zeros_like(dy), where=dy != 0)
+
+        # (L, 2) line segments
+        self.p1 = np.array([line.p1 for line in lines], dtype=np.float32).reshape(-1, 2)
+        self.p2 = np.array([line.p2 for line in lines], dtype=np.float32).reshape(-1, 2)
+        self.direction = self.p2 - self.p1
+        self.length2 = np.maximum((self.direction ** 2).sum(axis=1), 1e-9)
+
+    @property
+    def n_zones(self) -> int:
+        return len(self.zone_names)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_names)
+
+    def inside(self, points: np.ndarray) -> np.ndarray:
+        """
+        Crossing number test
+        :param points: (N, 2)
+        :return: (N, Z) bool
+        """
+        px = points[:, 0, None, None]
+        py = points[:, 1, None, None]
+        straddles = (self.y1 > py) != (self.y2 > py)
+        x_cross = self.x1 + (py - self.y1) * self.slope
+        return ((straddles & (px < x_cross)).sum(axis=2) % 2).astype(bool)
+
+    def sides(self, points: np.ndarray) -> tuple:
+        """
+        :param points: (N, 2)
+        :return: (N, L) sign of the side of every line, (N, L) whether the projection falls on the segment
+        """
+        rel = points[:, None, :] - self.p1[None, :, :]
+        cross = self.direction[:, 0] * rel[..., 1] - self.direction[:, 1] * rel[..., 0]
+        t = (rel * self.direction).sum(axis=2) / self.length2
+        return np.sign(cross).astype(np.int8), (t >= 0) & (t <= 1)
+
+
+class SourceAnalytics:
+
+    def __init__(self, source_id: int, geometry: SourceGeometry, window: float, class_ids=None,
+                 max_age: float = 2.0):
+        """
+        Track state and window aggregates of one source. Track state is kept in arrays sorted by track id,
+        rows of the current objects are found with searchsorted.
+        """
+        self.source_id = source_id
+        self.geometry = geometry
+        self.window = window
+        self.class_ids = np.asarray(class_ids) if class_ids is not None else None
+        self.max_age = max_age
+
+        n_zones, n_lines = geometry.n_zones, geometry.n_lines
+        self.ids = np.empty(0, dtype=np.int64)
+        self.side = np.zeros((0, n_lines), dtype=np.int8)
+        self.inside = np.zeros((0, n_zones), dtype=bool)
+        self.entered = np.zeros((0, n_zones), dtype=np.float64)
+        self.last_seen = np.empty(0, dtype=np.float64)
+        self.window_start = None
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        n_zones, n_lines = self.geometry.n_zones, self.geometry.n_lines
+        self.tracks_seen = set()
+        self.crossings_in = np.zeros(n_lines, dtype=np.int64)
+        self.crossings_out = np.zeros(n_lines, dtype=np.int64)
+        self.occupancy_sum = np.zeros(n_zones, dtype=np.int64)
+        self.occupancy_max = np.zeros(n_zones, dtype=np.int64)
+        self.dwell_sum = np.zeros(n_zones, dtype=np.float64)
+        self.dwell_max = np.zeros(n_zones, dtype=np.float64)
+        self.dwell_count = np.zeros(n_zones, dtype=np.int64)
+        self.n_frames = 0
+
+    def update(self, timestamp: float, track_ids: np.ndarray, class_ids: np.ndarray, boxes: np.ndarray):
+        """
+        :param timestamp: frame time, seconds
+        :param track_ids: (N,) tracker ids, negative for untracked objects
+        :param class_ids: (N,) class ids
+        :param boxes:     (N, 4) left, top, width, height
+        :return: window report dict when a window is closed, else None
+        """
+        report = None
+        if self.window_start is None:
+            self.window_start = timestamp
+        elif timestamp - self.window_start >= self.window:
+            report = self.report()
+            self.window_start += self.window * ((timestamp - self.window_start) // self.window)
+            self._reset_window()
+
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        valid = track_ids >= 0
+        if self.class_ids is not None:
+            valid &= np.isin(class_ids, self.class_ids)
+        track_ids, class_ids, boxes = track_ids[valid], class_ids[valid], boxes[valid]
+        points = np.stack([boxes[:, 0] + boxes[:, 2] / 2, boxes[:, 1] + boxes[:, 3]], axis=1)
+
+        inside = self.geometry.inside(points)
+        side, on_segment = self.geometry.sides(points)
+        rows = self._rows(track_ids, timestamp)
+
+        # Line crossings: side changed since the last observation of the track, on the segment
+        previous = self.side[rows]
+        crossed = (previous != 0) & (side != 0) & (previous != side) & on_segment
+        self.crossings_in += (crossed & (side > 0)).sum(axis=0)
+        self.crossings_out += (crossed & (side < 0)).sum(axis=0)
+        self.side[rows] = np.where(side != 0, side, previous)
+
+        # Zone entries and exits
+        was_inside = self.inside[rows]
+        entered = inside & ~was_inside
+        exited = was_inside & ~inside
+        entered_at = self.entered[rows]
+        entered_at[entered] = timestamp
+        self._add_dwell(exited, timestamp - entered_at)
+        self.entered[rows] = entered_at
+        self.inside[rows] = inside
+        self.last_seen[rows] = timestamp
+
+        occupancy = inside.sum(axis=0)
+        self.occupancy_sum += occupancy
+        np.maximum(self.occupancy_max, occupancy, out=self.occupancy_max)
+        self.tracks_seen.update(zip(class_ids.tolist(), track_ids.tolist()))
+        self.n_frames += 1
+
+        self._expire(timestamp)
+        return report
+
+    def _rows(self, track_ids: np.ndarray, timestamp: float) -> np.ndarray:
+        rows = np.searchsorted(self.ids, track_ids)
+        known = rows < len(self.ids)
+        known[known] = self.ids[rows[known]] == track_ids[known]
+        if not known.all():
+            new_ids = np.unique(track_ids[~known])
+            n_new = len(new_ids)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.side = np.concatenate([self.side, np.zeros((n_new, self.geometry.n_lines), dtype=np.int8)])
+            self.inside = np.concatenate([self.inside, np.zeros((n_new, self.geometry.n_zones), dtype=bool)])
+            self.entered = np.concatenate([self.entered, np.zeros((n_new, self.geometry.n_zones))])
+            self.last_seen = np.concatenate([self.last_seen, np.full(n_new, timestamp)])
+            order = np.argsort(self.ids, kind='stable')
+            self._take(order)
+            rows = np.searchsorted(self.ids, track_ids)
+        return rows
+
+    def _take(self, rows: np.ndarray) -> None:
+        self.ids, self.side, self.inside = self.ids[rows], self.side[rows], self.inside[rows]
+        self.entered, self.last_seen = self.entered[rows], self.last_seen[rows]
+
+    def _add_dwell(self, exited: np.ndarray, dwell: np.ndarray) -> None:
+        if not exited.any():
+            return
+        dwell = np.where(exited, dwell, 0.0)
+        self.dwell_sum += dwell.sum(axis=0)
+        self.dwell_count += exited.sum(axis=0)
+        np.maximum(self.dwell_max, dwell.max(axis=0), out=self.dwell_max)
+
+    def _expire(self, timestamp: float) -> None:
+        stale = timestamp - self.last_seen > self.max_age
+        if not stale.any():
+            return
+        # Lost tracks leave their zones when they were last seen
+        self._add_dwell(self.inside[stale], self.last_seen[stale, None] - self.entered[stale])
+        self._take(np.flatnonzero(~stale))
+
+    def report(self) -> dict:
+        n_frames = max(1, self.n_frames)
+        classes = {}
+        for class_id, _ in self.tracks_seen:
+            classes[class_id] = classes.get(class_id, 0) + 1
+        return {'source_id': self.source_id,
+                'window_start': self.window_start,
+                'window': self.window,
+                'frames': self.n_frames,
+                'tracks': classes,
+                'lines': {name: {'in': int(self.crossings_in[i]), 'out': int(self.crossings_out[i])}
+                          for i, name in enumerate(self.geometry.line_names)},
+                'zones': {name: {'occupancy_mean': round(float(self.occupancy_sum[i]) / n_frames, 2),
+                                 'occupancy_max': int(self.occupancy_max[i]),
+                                 'dwell_count': int(self.dwell_count[i]),
+                                 'dwell_mean': round(float(self.dwell_sum[i]) / max(1, self.dwell_count[i]), 2),
+                                 'dwell_max': round(float(self.dwell_max[i]), 2)}
+                          for i, name in enumerate(self.geometry.zone_names)},
+                }
+
+
+def log_report(report: dict) -> None:
+    logging.info(json.dumps(report))
+
+
+class AnalyticsEngine:
+
+    def __init__(self, rules: dict, emit=log_report, max_age: float = 2.0):
+        """
+        Zone occupancy, dwell times, line crossings and unique tracks per class, aggregated over fixed windows
+        per source. Sources without geometry still get their track counts.
+        :param rules:   load_rules() output
+        :param emit:    callable(report dict) for closed windows
+        :param max_age: seconds after which an unseen track is dropped
+        """
+        self.rules = rules
+        self.emit = emit
+        self.max_age = max_age
+        self.sources = {}
+
+    def update(self, source_id: int, timestamp: float, track_ids, class_ids, boxes) -> None:
+        source = self.sources.get(source_id)
+        if source is None:
+            geometry = self.rules['sources'].get(source_id, SourceGeometry([], []))
+            source = SourceAnalytics(source_id, geometry, window=self.rules['window'],
+                                     class_ids=self.rules['class_ids'], max_age=self.max_age)
+            self.sources[source_id] = source
+        report = source.update(timestamp, track_ids, class_ids, boxes)
+        if report is not None:
+            self.emit(report)
+
+    def remove(self, source_id: int) -> None:
+        """
+        Reports the open window of a source and forgets its tracks, e.g. when the next file takes its muxer pad
+        """
+        source = self.sources.pop(source_id, None)
+        if source is not None and source.n_frames:
+            self.emit(source.report())
+
+    def flush(self) -> None:
+        for source in self.sources.values():
+            if source.n_frames:
+                self.emit(source.report())
@@ -0,0 +1,211 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Output layers of the DetectNet_v2 models (PeopleNet, DashCamNet, TrafficCamNet), coverage first
+DETECTNET_LAYERS = ('output_cov/Sigmoid', 'output_bbox/BiasAdd')
+# Box offsets are predicted in units of 35 pixels from the grid cell centers
+BBOX_NORM = 35.0
+CENTER_OFFSET = 0.5
+# nvinfer runs the network without parsing it and attaches the output layers to the frames
+PARSER_OVERRIDES = {'network-type': 100, 'output-tensor-meta': 1}
+# nvinfer defaults of the [class-attrs-*] keys
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_NMS_IOU = 0.3
+# Batches written by TensorRecorder
+RECORD_BATCHES = 100
+
+# frames: batch index of every object, boxes (N, 4) left, top, width, height in output coordinates
+Detections = namedtuple('Detections', ['frames', 'boxes', 'scores', 'class_ids'])
+
+
+def _class_values(sections: dict, key: str, n_classes: int, default: float) -> np.ndarray:
+    base = float(sections.get('class-attrs-all', {}).get(key, default))
+    return np.array([float(sections.get(f'class-attrs-{class_id}', {}).get(key, base))
+                     for class_id in range(n_classes)], dtype=np.float32)
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, groups: np.ndarray, iou_thresholds) -> np.ndarray:
+    """
+    Greedy NMS of many independent groups at once, e.g. every class of every frame of a batch. Objects are swept
+    by group and left edge: IOU is computed in one flat array for the pairs of a group that overlap horizontally,
+    not for all pairs, so the cost follows the overlaps instead of the squared number of candidates.
+    :param boxes:          (N, 4) x1, y1, x2, y2
+    :param scores:         (N,) confidences
+    :param groups:         (N,) group ids, objects of different groups never suppress each other
+    :param iou_thresholds: duplicates IOU, a float or (N,) per object
+    :return: indices of the kept objects, by group and descending score
+    """
+    n = len(scores)
+    order = np.lexsort((-scores, groups))
+    if n < 2:
+        return order
+    x1, y1, x2, y2 = (np.ascontiguousarray(column, dtype=np.float32) for column in boxes.T)
+    # Groups are spaced further apart than any box is wide, one sorted key holds them all
+    span = float(x2.max()) + 1.0
+    sweep = np.lexsort((x1, groups))
+    keys = groups[sweep] * span + x1[sweep]
+    ends = np.searchsorted(keys, groups[sweep] * span + x2[sweep], side='left')
+    n_pairs = np.maximum(ends - np.arange(n) - 1, 0)
+    rows = np.repeat(np.arange(n), n_pairs)
+    first = np.cumsum(n_pairs) - n_pairs
+    cols = rows + 1 + np.arange(len(rows)) - np.repeat(first, n_pairs)
+    rows, cols = sweep[rows], sweep[cols]
+
+    w = np.minimum(x2[rows], x2[cols]) - np.maximum(x1[rows], x1[cols])
+    h = np.minimum(y2[rows], y2[cols]) - np.maximum(y1[rows], y1[cols])
+    inter = np.maximum(w, 0) * np.maximum(h, 0)
+    areas = (x2 - x1) * (y2 - y1)
+    union = np.maximum(areas[rows] + areas[cols] - inter, 1e-9)
+
+    # Every pair is ordered by score rank, the higher one can suppress the other
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    swap = rank[cols] < rank[rows]
+    rows, cols = np.where(swap, cols, rows), np.where(swap, rows, cols)
+    thresholds = np.asarray(iou_thresholds, dtype=np.float32)
+    if thresholds.ndim:
+        thresholds = thresholds[rows]
+    conflicts = inter > thresholds * union
+    rows, cols = rows[conflicts], cols[conflicts]
+    by_rank = np.argsort(rank[rows], kind='stable')
+    rows, cols = rows[by_rank], cols[by_rank]
+
+    kept = np.ones(n, dtype=bool)
+    # Only the objects with conflicts need the sequential pass, in descending score
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(rows)]
+    for i, start, end in zip(rows[starts].tolist(), starts.tolist(), ends.tolist()):
+        if kept[i]:
+            kept[cols[start:end]] = False
+    return order[kept[order]]
+
+
+class DetectNetDecoder:
+
+    def __init__(self, n_classes: int, input_size: tuple, output_size: tuple = None, thresholds=DEFAULT_THRESHOLD,
+                 nms_iou=DEFAULT_NMS_IOU, min_size: tuple = (0, 0), bbox_norm: float = BBOX_NORM,
+                 layers: tuple = DETECTNET_LAYERS):
+        """
+        DetectNet_v2 output parser of nvinfer in NumPy: thresholding, grid decoding and per-class NMS run on
+        the whole batch at once, no compiled parser library is needed for models with other output layouts.
+        :param n_classes:   classes of the model
+        :param input_size:  network (width, height)
+        :param output_size: (width, height) of the returned boxes, the muxer frame; the network input if None
+        :param thresholds:  pre-cluster-threshold, a float or one per class
+        :param nms_iou:     nms-iou-threshold, a float or one per class
+        :param min_size:    detected-min-w, detected-min-h in network pixels
+        :param bbox_norm:   box offsets scale
+        :param layers:      (coverage, bbox) output layer names
+        """
+        self.n_classes = n_classes
+        self.input_size = input_size
+        self.output_size = output_size or input_size
+        self.thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float32), (n_classes,))
+        self.nms_iou = np.broadcast_to(np.asarray(nms_iou, dtype=np.float32), (n_classes,))
+        self.min_size = min_size
+        self.bbox_norm = bbox_norm
+        self.cov_layer, self.bbox_layer = layers
+        self._scale = np.array([self.output_size[0] / input_size[0], self.output_size[1] / input_size[1]] * 2,
+                               dtype=np.float32)
+        # grid shape -> cell centers in bbox_norm units
+        self._centers = {}
+
+    @classmethod
+    def from_config(cls, config, output_size: tuple = None) -> 'DetectNetDecoder':
+        """
+        :param config:      configs.NvInferConfig of the model
+        :param output_size: (width, height) of the returned boxes
+        :return: DetectNetDecoder with the thresholds of the [class-attrs-*] sections
+        """
+        n_classes = config.get_int('num-detected-classes', len(config.labels))
+        if config.input_size is None:
+            raise ValueError(f'{config.path}: network input size is unknown, set input-dims or infer-dims')
+        sections = config.sections
+        min_size = (float(sections.get('class-attrs-all', {}).get('detected-min-w', 0)),
+                    float(sections.get('class-attrs-all', {}).get('detected-min-h', 0)))
+        return cls(n_classes, config.input_size, output_size,
+                   thresholds=_class_values(sections, 'pre-cluster-threshold', n_classes, DEFAULT_THRESHOLD),
+                   nms_iou=_class_values(sections, 'nms-iou-threshold', n_classes, DEFAULT_NMS_IOU),
+                   min_size=min_size)
+
+    def _grid_centers(self, grid_height: int, grid_width: int) -> tuple:
+        key = (grid_height, grid_width)
+        if key not in self._centers:
+            stride_x = self.input_size[0] / grid_width
+            stride_y = self.input_size[1] / grid_height
+            self._centers[key] = ((np.arange(grid_width) * stride_x + CENTER_OFFSET) / self.bbox_norm,
+                                  (np.arange(grid_height) * stride_y + CENTER_OFFSET) / self.bbox_norm)
+        return self._centers[key]
+
+    def decode(self, cov: np.ndarray, bbox: np.ndarray) -> Detections:
+        """
+        :param cov:  (B, C, H, W) coverage of the cells
+        :param bbox: (B, 4 * C, H, W) x1, y1, x2, y2 offsets of the cells per class
+        :return: Detections of the batch, by frame, class and descending score
+        """
+        n_frames, n_classes, grid_height, grid_width = cov.shape
+        bbox = bbox.reshape(n_frames, n_classes, 4, grid_height, grid_width)
+        frames, class_ids, rows, cols = np.nonzero(cov >= self.thresholds[:n_classes, None, None])
+        scores = cov[frames, class_ids, rows, cols]
+        offsets = bbox[frames, class_ids, :, rows, cols]
+
+        centers_x, centers_y = self._grid_centers(grid_height, grid_width)
+        centers = np.stack([-centers_x[cols], -centers_y[rows], centers_x[cols], centers_y[rows]], axis=1)
+        boxes = (offsets + centers) * self.bbox_norm
+        boxes[:, :2] *= -1
+        width, height = self.input_size
+        np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+        valid = (boxes[:, 2] - boxes[:, 0] >= self.min_size[0]) & (boxes[:, 3] - boxes[:, 1] >= self.min_size[1])
+        if not valid.all():
+            frames, class_ids, scores, boxes = frames[valid], class_ids[valid], scores[valid], boxes[valid]
+
+        keep = batched_nms(boxes, scores, frames * n_classes + class_ids, self.nms_iou[class_ids])
+        boxes = boxes[keep] * self._scale
+        boxes[:, 2:] -= boxes[:, :2]
+        return Detections(frames[keep], boxes, scores[keep], class_ids[keep])
+
+
+class TensorRecorder:
+
+    def __init__(self, path: str, n_batches: int = RECORD_BATCHES, input_size: tuple = None):
+        """
+        Raw output batches of a running pipeline saved to a .npz file, input of bench_bbox_parser.py
+        :param path:       .npz file written once n_batches are collected
+        :param n_batches:  batches to record
+        :param input_size: network (width, height) stored with the tensors
+        """
+        self.path = path
+        self.n_batches = n_batches
+        self.input_size = input_size
+        self._cov = []
+        self._bbox = []
+
+    @property
+    def done(self) -> bool:
+        return len(self._cov) >= self.n_batches
+
+    def add(self, cov: np.ndarray, bbox: np.ndarray) -> None:
+        if self.done:
+            return
+        self._cov.append(np.array(cov))
+        self._bbox.append(np.array(bbox))
+        if self.done:
+            self.save()
+
+    def save(self) -> None:
+        np.savez_compressed(self.path, cov=np.concatenate(self._cov), bbox=np.concatenate(self._bbox),
+                            batch_sizes=np.array([len(cov) for cov in self._cov]),
+                            input_size=np.array(self.input_size or (0, 0)))
+
+
+def load_tensors(path: str) -> tuple:
+    """
+    :param path: .npz file of TensorRecorder
+    :return: (list of (cov, bbox) batches, network (width, height))
+    """
+    with np.load(path) as data:
+        bounds = np.cumsum(data['batch_sizes'])[:-1]
+        batches = list(zip(np.split(data['cov'], bounds), np.split(data['bbox'], bounds)))
+        return batches, tuple(int(value) for value in data['input_size'])
@@ -0,0 +1,178 @@
+import logging
+from collections import namedtuple
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from common import nvmeta
+
+# nvinfer in secondary mode skips objects whose unique_component_id differs from its operate-on-gie-id
+SKIPPED_COMPONENT_ID = 0x7FFF
+
+# Secondary detector object of a track, rect relative to the track box: left, top, width, height in box units
+BranchDetection = namedtuple('BranchDetection', ['class_id', 'confidence', 'label', 'rect'])
+
+
+def secondary_batch_size(n_sources: int, objects_per_frame: int, max_batch: int = 64) -> int:
+    """
+    Secondary nvinfer batches object crops, not frames.
+    :param n_sources:         number of frames in a primary batch
+    :param objects_per_frame: expected number of gated objects per frame
+    :param max_batch:         upper bound, engine memory grows with the batch
+    :return: batch size
+    """
+    return max(1, min(n_sources * objects_per_frame, max_batch))
+
+
+class ReinferGate:
+
+    def __init__(self, operate_on_gie_id: int, operate_on_class_ids: tuple = None,
+                 reinfer_interval: int = 30, reattach: bool = True, verbose: bool = True):
+        """
+        Skips secondary inference for tracked objects that were already processed less than
+        reinfer_interval frames ago. Requires nvtracker upstream of the secondary nvinfer.
+        The sink pad probe hides such objects from the secondary by changing their unique_component_id,
+        the src pad probe restores it, so downstream elements see unchanged metadata. Untracked objects share one
+        object id and are always inferred.
+        nvinfer keeps the results of a secondary classifier per track, not the objects of a secondary detector:
+        with reattach the last detections of a track are kept relative to its box and attached again on the
+        frames it is hidden.
+        :param operate_on_gie_id:    gie-unique-id of the primary the secondary operates on
+        :param operate_on_class_ids: primary class ids the secondary operates on, None for all
+        :param reinfer_interval:     frames before a track is sent to the secondary again, 0 disables the gate
+        :param reattach:             attach the last detections of hidden tracks, for a secondary detector
+        :param verbose:
+        """
+        self.operate_on_gie_id = operate_on_gie_id
+        self.operate_on_class_ids = set(operate_on_class_ids) if operate_on_class_ids is not None else None
+        self.reinfer_interval = reinfer_interval
+        self.reattach = reattach
+        self.verbose = verbose
+        self.component_id = None
+
+        # pad_index -> {object_id: frame number of the last secondary inference}
+        self._last_inferred = {}
+        # pad_index -> {object_id: [BranchDetection] of the last secondary inference}
+        self._detections = {}
+        # hash(gst_buffer) -> (hidden objects, (pad_index, object_id) inferred), several batches can be in flight
+        self._batches = {}
+        self._prune_every = max(1, reinfer_interval) * 10
+        self.n_inferred = 0
+        self.n_skipped = 0
+
+    def attach(self, secondary_gie) -> None:
+        self.component_id = secondary_gie.get_property('unique-id')
+        secondary_gie.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self.sink_probe, 0)
+        secondary_gie.get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, self.src_probe, 0)
+
+    def is_gated(self, obj_meta) -> bool:
+        if obj_meta.unique_component_id != self.operate_on_gie_id or obj_meta.object_id == nvmeta.UNTRACKED_OBJECT_ID:
+            return False
+        return self.operate_on_class_ids is None or obj_meta.class_id in self.operate_on_class_ids
+
+    def sink_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer or not self.reinfer_interval:
+            return Gst.PadProbeReturn.OK
+
+        hidden = []
+        inferred = []
+        for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+            frame_number = frame_meta.frame_num
+            last_inferred = self._last_inferred.setdefault(frame_meta.pad_index, {})
+            for obj_meta in obj_metas:
+                if self.is_gated(obj_meta):
+                    last = last_inferred.get(obj_meta.object_id)
+                    if last is not None and frame_number - last < self.reinfer_interval:
+                        obj_meta.unique_component_id = SKIPPED_COMPONENT_ID
+                        hidden.append(obj_meta)
+                        self.n_skipped += 1
+                    else:
+                        last_inferred[obj_meta.object_id] = frame_number
+                        inferred.append((frame_meta.pad_index, obj_meta.object_id))
+                        self.n_inferred += 1
+            if frame_number % self._prune_every == 0:
+                self.prune(frame_meta.pad_index, frame_number)
+
+        if hidden or (inferred and self.reattach):
+            self._batches[hash(gst_buffer)] = (hidden, inferred)
+        return Gst.PadProbeReturn.OK
+
+    def src_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        hidden, inferred = self._batches.pop(hash(gst_buffer), ((), ()))
+        for obj_meta in hidden:
+            obj_meta.unique_component_id = self.operate_on_gie_id
+        if self.reattach and (hidden or inferred):
+            self._reattach(nvmeta.batch_meta(gst_buffer), hidden, set(inferred))
+        return Gst.PadProbeReturn.OK
+
+    def _reattach(self, batch, hidden: list, inferred: set) -> None:
+        """
+        Keeps the secondary detections of the inferred tracks and attaches the kept ones to the hidden tracks
+        """
+        hidden = {id(obj_meta) for obj_meta in hidden}
+        for frame_meta, obj_metas in nvmeta.batch_objects(batch):
+            pad_index = frame_meta.pad_index
+            tracks = {obj_meta.object_id: obj_meta for obj_meta in obj_metas
+                      if obj_meta.unique_component_id == self.operate_on_gie_id}
+            found = {}
+            for obj_meta in obj_metas:
+                parent = getattr(obj_meta, 'parent', None)
+                if obj_meta.unique_component_id != self.component_id or parent is None:
+                    continue
+                parent_id = parent.object_id
+                if (pad_index, parent_id) in inferred:
+                    found.setdefault(parent_id, []).append(
+                        BranchDetection(obj_meta.class_id, obj_meta.confidence, obj_meta.obj_label,
+                                        _relative(_rect(obj_meta), _rect(tracks.get(parent_id, parent)))))
+            detections = self._detections.setdefault(pad_index, {})
+            for object_id, obj_meta in tracks.items():
+                if (pad_index, object_id) in inferred:
+                    detections[object_id] = found.get(object_id, [])
+                elif id(obj_meta) in hidden:
+                    parent_rect = _rect(obj_meta)
+                    for detection in detections.get(object_id, ()):
+                        nvmeta.add_object(batch, frame_meta, self.component_id, detection.class_id,
+                                          detection.confidence, _absolute(detection.rect, parent_rect),
+                                          detection.label)
+
+    def prune(self, pad_index: int, frame_number: int) -> None:
+        """
+        Forget tracks of a source which have not been sent to the secondary for a long time
+        :param pad_index:    source index
+        :param frame_number: current frame number of the source
+        :return: None
+        """
+        horizon = frame_number - self._prune_every
+        last_inferred = self._last_inferred[pad_index]
+        self._last_inferred[pad_index] = {k: v for k, v in last_inferred.items() if v >= horizon}
+        detections = self._detections.get(pad_index, {})
+        self._detections[pad_index] = {k: v for k, v in detections.items() if k in self._last_inferred[pad_index]}
+        if self.verbose:
+            logging.info(f'{self.__class__.__name__}: source {pad_index}, inferred {self.n_inferred}, '
+                         f'skipped {self.n_skipped}, tracks {len(self._last_inferred[pad_index])}')
+
+
+def _rect(obj_meta) -> tuple:
+    rect = obj_meta.rect_params
+    return rect.left, rect.top, rect.width, rect.height
+
+
+def _relative(rect: tuple, parent: tuple) -> tuple:
+    left, top, width, height = rect
+    parent_left, parent_top, parent_width, parent_height = parent
+    parent_width, parent_height = max(parent_width, 1e-6), max(parent_height, 1e-6)
+    return ((left - parent_left) / parent_width, (top - parent_top) / parent_height,
+            width / parent_width, height / parent_height)
+
+
+def _absolute(rect: tuple, parent: tuple) -> tuple:
+    left, top, width, height = rect
+    parent_left, parent_top, parent_width, parent_height = parent
+    return (parent_left + left * parent_width, parent_top + top * parent_height,
+            width * parent_width, height * parent_height)
@@ -0,0 +1,318 @@
+import os
+import re
+import logging
+import configparser
+from collections import OrderedDict
+from functools import lru_cache
+
+NETWORK_MODES = {0: 'fp32', 1: 'int8', 2: 'fp16'}
+MODEL_KEYS = ('tlt-encoded-model', 'onnx-file', 'uff-file', 'model-file')
+PATH_KEYS = MODEL_KEYS + ('proto-file', 'labelfile-path', 'int8-calib-file', 'model-engine-file', 'mean-file',
+                          'custom-lib-path')
+ENGINE_NAME_PATTERN = re.compile(r'_b(\d+)_gpu(\d+)_(fp32|fp16|int8)\.engine$')
+
+
+class NvInferConfig:
+
+    def __init__(self, path: str):
+        """
+        Parsed nvinfer config file with the values derived from it: label table, network input size
+        and the engine file name nvinfer generates for a given batch size.
+        Use load_nvinfer_config() to parse each file once per modification.
+        :param path: nvinfer config file
+        """
+        self.path = os.path.abspath(path)
+        self.folder = os.path.dirname(self.path)
+
+        parser = configparser.ConfigParser(interpolation=None, strict=False)
+        with open(self.path) as f:
+            parser.read_file(f)
+        if not parser.has_section('property'):
+            raise ValueError(f'{self.path}: no [property] section')
+        self.sections = OrderedDict((name, OrderedDict(parser.items(name))) for name in parser.sections())
+        self.properties = self.sections['property']
+
+        self.labels = self._read_labels()
+        self.input_dims = self._read_input_dims()
+
+    def get(self, key: str, default=None):
+        return self.properties.get(key, default)
+
+    def get_int(self, key: str, default: int = None):
+        value = self.properties.get(key)
+        return default if value is None else int(value)
+
+    def get_path(self, key: str):
+        value = self.properties.get(key)
+        if value is None:
+            return None
+        return os.path.normpath(os.path.join(self.folder, value))
+
+    @property
+    def model_path(self):
+        for key in MODEL_KEYS:
+            if key in self.properties:
+                return self.get_path(key)
+        return None
+
+    @property
+    def network_mode(self) -> int:
+        return self.get_int('network-mode', 0)
+
+    @property
+    def batch_size(self) -> int:
+        return self.get_int('batch-size', 1)
+
+    @property
+    def input_size(self):
+        """
+        :return: network (width, height) or None if unknown
+        """
+        if self.input_dims is None:
+            return None
+        channels, height, width = self.input_dims
+        return width, height
+
+    def _read_labels(self) -> list:
+        path = self.get_path('labelfile-path')
+        if path is None or not os.path.exists(path):
+            return []
+        with open(path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        # Classifier label files keep the labels of an attribute on one line separated with ';'
+        if len(lines) == 1 and ';' in lines[0]:
+            lines = [label for label in lines[0].split(';') if label]
+        return lines
+
+    def _read_input_dims(self):
+        """
+        input-dims (or infer-dims) of the config, the input layer of a caffe prototxt otherwise
+        :return: (channels, height, width) or None
+        """
+        dims = self.get('input-dims', self.get('infer-dims'))
+        if dims is not None:
+            values = [int(v) for v in dims.split(';') if v.strip()]
+            return tuple(values[:3])
+        proto = self.get_path('proto-file')
+        if proto is not None and os.path.exists(proto):
+            return self._read_prototxt_dims(proto)
+        return None
+
+    @staticmethod
+    def _read_prototxt_dims(proto: str):
+        with open(proto) as f:
+            text = f.read(4096)
+        dims = [int(v) for v in re.findall(r'dim:\s*(\d+)', text)[:4]]
+        return tuple(dims[1:4]) if len(dims) == 4 else None
+
+    def engine_file_name(self, batch_size: int = None, gpu_id: int = None, network_mode: int = None):
+        """
+        Engine file nvinfer serializes next to the model: <model>_b<batch>_gpu<id>_<precision>.engine
+        :return: path or None without a model file
+        """
+        model = self.model_path
+        if model is None:
+            return None
+        batch_size = self.batch_size if batch_size is None else batch_size
+        gpu_id = self.get_int('gpu-id', 0) if gpu_id is None else gpu_id
+        network_mode = self.network_mode if network_mode is None else network_mode
+        return f'{model}_b{batch_size}_gpu{gpu_id}_{NETWORK_MODES[network_mode]}.engine'
+
+    def validate(self, batch_size: int = None) -> list:
+        """
+        Consistency and throughput checks
+        :param batch_size: runtime batch-size which overrides the config value
+        :return: list of warnings
+        """
+        warnings = []
+        batch_size = self.batch_size if batch_size is None else batch_size
+        name = os.path.basename(self.path)
+
+        for key in PATH_KEYS:
+            path = self.get_path(key)
+            if path is not None and key != 'model-engine-file' and not os.path.exists(path):
+                warnings.append(f'{name}: {key} {path} does not exist')
+
+        n_classes = self.get_int('num-detected-classes')
+        if n_classes is not None and self.labels and n_classes != len(self.labels):
+            warnings.append(f'{name}: num-detected-classes={n_classes}, but the label file has '
+                            f'{len(self.labels)} labels')
+
+        proto = self.get_path('proto-file')
+        if self.get('input-dims') is not None and proto is not None and os.path.exists(proto):
+            proto_dims = self._read_prototxt_dims(proto)
+            if proto_dims is not None and proto_dims != self.input_dims:
+                warnings.append(f'{name}: input-dims {self.input_dims} differ from the model input {proto_dims}')
+
+        engine = self.get_path('model-engine-file')
+        if engine is not None:
+            match = ENGINE_NAME_PATTERN.search(engine)
+            if match is not None:
+                engine_batch, engine_precision = int(match.group(1)), match.group(3)
+                if engine_batch < batch_size:
+                    warnings.append(f'{name}: engine {os.path.basename(engine)} is built for batch {engine_batch}, '
+                                    f'runtime batch is {batch_size}: the engine is rebuilt on every start')
+                elif engine_batch > batch_size:
+                    warnings.append(f'{name}: engine {os.path.basename(engine)} is built for batch {engine_batch}, '
+                                    f'runtime batch is {batch_size}: larger engine than needed')
+                if engine_precision != NETWORK_MODES.get(self.network_mode):
+                    warnings.append(f'{name}: engine precision {engine_precision} does not match '
+                                    f'network-mode={self.network_mode} ({NETWORK_MODES.get(self.network_mode)})')
+
+        calib = self.get_path('int8-calib-file')
+        if calib is not None and os.path.exists(calib) and self.network_mode != 1:
+            warnings.append(f'{name}: network-mode={self.network_mode} '
+                            f'({NETWORK_MODES.get(self.network_mode)}) while INT8 calibration '
+                            f'{os.path.basename(calib)} exists: INT8 gives higher throughput')
+
+        if self.get_int('process-mode', 1) == 2 and self.get('operate-on-gie-id') is None:
+            warnings.append(f'{name}: secondary mode without operate-on-gie-id runs on objects of every model')
+
+        return warnings
+
+    def effective(self, output_dir: str, overrides: dict = None) -> str:
+        """
+        Write the config of a deployment: paths are made absolute, overrides applied and model-engine-file
+        points to the engine nvinfer builds for the effective batch size and precision.
+        :param output_dir: deployment configs directory
+        :param overrides:  [property] values, for example {'batch-size': 8}
+        :return: path of the effective config
+        """
+        overrides = overrides or {}
+        properties = OrderedDict(self.properties)
+        for key in PATH_KEYS:
+            if key in properties:
+                properties[key] = self.get_path(key)
+        properties.update((key, str(value)) for key, value in overrides.items())
+        if 'model-engine-file' not in overrides and self.model_path is not None:
+            properties['model-engine-file'] = self.engine_file_name(batch_size=int(properties.get('batch-size', 1)),
+                                                                    gpu_id=int(properties.get('gpu-id', 0)),
+                                                                    network_mode=int(properties.get('network-mode', 0)))
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, os.path.basename(self.path))
+        with open(path, 'w') as f:
+            f.write(f'# Generated from {self.path}\n')
+            for section, values in self.sections.items():
+                values = properties if section == 'property' else values
+                f.write(f'[{section}]\n')
+                for key, value in values.items():
+                    f.write(f'{key}={value}\n')
+                f.write('\n')
+        return path
+
+
+class TrackerConfig:
+
+    def __init__(self, path: str):
+        """
+        Low-level tracker config (%YAML:1.0 with one section per tracker library)
+        :param path: tracker config file
+        """
+        self.path = os.path.abspath(path)
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.sections = self._parse(lines)
+
+    @staticmethod
+    def _parse(lines: list) -> OrderedDict:
+        """
+        The files are flat two-level mappings, parsed without a YAML dependency
+        """
+        sections = OrderedDict()
+        section = None
+        for line in lines:
+            content = line.split('#', 1)[0].rstrip()
+            if not content.strip() or content.startswith('%'):
+                continue
+            if not content.startswith((' ', '\t')):
+                section = content.rstrip(':').strip()
+                sections[section] = OrderedDict()
+                continue
+            if section is None or ':' not in content:
+                raise ValueError(f'Unsupported tracker config line: {line}')
+            key, value = content.split(':', 1)
+            sections[section][key.strip()] = _parse_scalar(value.strip())
+        return sections
+
+    def effective(self, output_dir: str, overrides: dict = None) -> str:
+        """
+        :param output_dir: deployment configs directory
+        :param overrides:  {section: {key: value}}
+        :return: path of the effective config
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, os.path.basename(self.path))
+        with open(path, 'w') as f:
+            f.write('%YAML:1.0\n')
+            f.write(f'# Generated from {self.path}\n')
+            for section, values in self.sections.items():
+                values = OrderedDict(values)
+                values.update((overrides or {}).get(section, {}))
+                f.write(f'{section}:\n')
+                for key, value in values.items():
+                    f.write(f'  {key}: {value}\n')
+        return path
+
+
+def _parse_scalar(value: str):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+@lru_cache(maxsize=64)
+def _load_nvinfer_config(path: str, mtime: float) -> NvInferConfig:
+    return NvInferConfig(path)
+
+
+def load_nvinfer_config(path: str) -> NvInferConfig:
+    """
+    Parse a config once per file modification
+    :param path: nvinfer config file
+    :return: NvInferConfig
+    """
+    path = os.path.abspath(path)
+    return _load_nvinfer_config(path, os.path.getmtime(path))
+
+
+@lru_cache(maxsize=16)
+def _load_tracker_config(path: str, mtime: float) -> TrackerConfig:
+    return TrackerConfig(path)
+
+
+def load_tracker_config(path: str) -> TrackerConfig:
+    """
+    Parse a config once per file modification
+    :param path: tracker config file
+    :return: TrackerConfig
+    """
+    path = os.path.abspath(path)
+    return _load_tracker_config(path, os.path.getmtime(path))
+
+
+def prepare_nvinfer_config(path: str, batch_size: int, output_dir: str = None, overrides: dict = None,
+                           verbose: bool = True) -> NvInferConfig:
+    """
+    Validate a model config for its runtime batch size and write the effective config of the deployment
+    :param path:       nvinfer config file
+    :param batch_size: runtime batch-size
+    :param output_dir: deployment configs directory, no effective config is written if None
+    :param overrides:  extra [property] values
+    :param verbose:
+    :return: NvInferConfig of the file nvinfer has to load
+    """
+    config = load_nvinfer_config(path)
+    for warning in config.validate(batch_size=batch_size):
+        logging.warning(warning)
+    if output_dir is None:
+        return config
+    overrides = dict(overrides or {})
+    overrides['batch-size'] = batch_size
+    effective_path = config.effective(output_dir, overrides)
+    if verbose:
+        logging.info(f'Effective config {effective_path}')
+    return load_nvinfer_config(effective_path)
@@ -0,0 +1,132 @@
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+# stream_video.sh serves the cameras at 30 fps
+SOURCE_FPS = 30.0
+DECODER_PROPERTY = 'drop-frame-interval'
+
+# NvDCF settings counted in frames, scaled so they keep their duration at the decimated rate
+NVDCF_FRAME_KEYS = ('maxShadowTrackingAge', 'probationAge', 'earlyTerminationAge', 'targetDuplicateRunInterval')
+
+
+def source_rates(values: list, n_sources: int) -> list:
+    """
+    :param values:    target fps, one for all sources or one per source, 0 keeps every frame
+    :param n_sources: number of sources
+    :return: target fps per source
+    """
+    values = list(values or [0])
+    if len(values) == 1:
+        return values * n_sources
+    if len(values) != n_sources:
+        raise ValueError(f'Expected 1 or {n_sources} target frame rates, got {len(values)}')
+    return values
+
+
+def shared_rate(rates: list) -> float:
+    """
+    Rate of a decoder shared by several sources, the slower sources are decimated further after it
+    :param rates: target fps of the sources, 0 keeps every frame
+    :return: target fps of the decoder
+    """
+    return 0 if not all(rates) else max(rates)
+
+
+def drop_interval(target_fps: float, source_fps: float = SOURCE_FPS) -> int:
+    """
+    nvv4l2decoder drop-frame-interval: every interval-th frame is output
+    :param target_fps: analytics frame rate, 0 keeps every frame
+    :param source_fps: frame rate of the camera
+    :return: interval, 0 if frames are not dropped
+    """
+    if not target_fps or target_fps >= source_fps:
+        return 0
+    return max(1, int(round(source_fps / target_fps)))
+
+
+def effective_fps(target_fps: float, source_fps: float = SOURCE_FPS) -> float:
+    """
+    :return: frame rate reaching the muxer, the decoder keeps whole frame intervals
+    """
+    interval = drop_interval(target_fps, source_fps)
+    return source_fps / interval if interval else source_fps
+
+
+def scale_frames(frames: int, interval: int) -> int:
+    """
+    :param frames:   setting in frames of the source rate
+    :param interval: drop interval
+    :return: setting in frames of the decimated rate, at least 1
+    """
+    if interval <= 1 or frames <= 0:
+        return frames
+    return max(1, int(round(frames / interval)))
+
+
+def nvdcf_overrides(config, interval: int) -> dict:
+    """
+    :param config:   configs.TrackerConfig
+    :param interval: drop interval
+    :return: TrackerConfig.effective() overrides of the frame counted NvDCF settings
+    """
+    values = config.sections.get('NvDCF', {})
+    return {'NvDCF': {key: scale_frames(values[key], interval) for key in NVDCF_FRAME_KEYS
+                      if isinstance(values.get(key), int)}}
+
+
+class FrameDecimator:
+
+    def __init__(self, target_fps: float):
+        """
+        Keeps target_fps decoded frames per second by their timestamps and drops the rest, like a drop-only
+        videorate. Used when the decoder has no drop-frame-interval (software decoders picked by decodebin).
+        :param target_fps: frames per second
+        """
+        self.period = int(Gst.SECOND / target_fps)
+        self.next_pts = None
+        self.kept = 0
+        self.dropped = 0
+
+    def keep(self, pts: int) -> bool:
+        """
+        :param pts: buffer timestamp, nanoseconds
+        :return: True if the frame is kept
+        """
+        if pts == Gst.CLOCK_TIME_NONE:
+            return True
+        # First frame, timestamps going back before the last kept frame (reconnection) or a gap over a period
+        if self.next_pts is None or pts < self.next_pts - self.period or pts > self.next_pts + self.period:
+            self.next_pts = pts
+        if pts < self.next_pts:
+            return False
+        self.next_pts += self.period
+        return True
+
+    def probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+        if self.keep(gst_buffer.pts):
+            self.kept += 1
+            return Gst.PadProbeReturn.OK
+        self.dropped += 1
+        return Gst.PadProbeReturn.DROP
+
+
+def configure_decoder(element, interval: int, verbose: bool = True) -> bool:
+    """
+    :param element:  decoder element
+    :param interval: drop interval
+    :param verbose:
+    :return: True if the decoder drops the frames itself
+    """
+    if element.find_property(DECODER_PROPERTY) is None:
+        return False
+    element.set_property(DECODER_PROPERTY, interval)
+    if verbose:
+        logging.info(f'{element.get_name()}: {DECODER_PROPERTY} {interval}')
+    return True
@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+import socketserver
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+QUEUE_FACTORIES = ('queue', 'queue2', 'multiqueue')
+QUEUE_PROPERTIES = ('current-level-buffers', 'current-level-bytes', 'current-level-time',
+                    'max-size-buffers', 'max-size-bytes', 'max-size-time')
+
+CONTROL_HELP = ('dump                    write a diagnostics directory, replies its path\n'
+                'debug <spec>            set GStreamer debug levels, e.g. "debug nvinfer:5,rtsp*:4"\n'
+                'debug                   reply the categories above the default debug level\n'
+                'help                    this text\n')
+
+
+def iterate(iterator) -> list:
+    """
+    :param iterator: Gst.Iterator
+    :return: list of the items, restarted on resync
+    """
+    items = []
+    while True:
+        result, item = iterator.next()
+        if result == Gst.IteratorResult.RESYNC:
+            iterator.resync()
+            items = []
+            continue
+        if result != Gst.IteratorResult.OK:
+            return items
+        items.append(item)
+
+
+def _time(value: int) -> str:
+    return 'none' if value == Gst.CLOCK_TIME_NONE else f'{value / Gst.MSECOND:.1f} ms'
+
+
+class PipelineDiagnostics:
+
+    def __init__(self, pipeline, output_dir: str = 'diagnostics', verbose: bool = True):
+        """
+        On-demand snapshot of a live pipeline for stall and latency triage. Every dump() writes a timestamped
+        directory with:
+            pipeline.dot - graph with caps and states, `dot -Tsvg pipeline.dot -o pipeline.svg`
+            pads.txt     - negotiated caps and peer of every pad
+            states.txt   - current and pending state of every element
+            queues.txt   - levels and limits of the queues
+            latency.txt  - result of the pipeline latency query
+            debug.txt    - GStreamer debug levels in effect
+        Only non-blocking queries are used, so a dump also works while streaming threads are stuck.
+        :param pipeline:   Gst.Pipeline
+        :param output_dir: dumps directory
+        :param verbose:
+        """
+        self.pipeline = pipeline
+        self.output_dir = output_dir
+        self.verbose = verbose
+        self.commands = {}
+        self._lock = threading.Lock()
+
+    def add_command(self, name: str, handler, usage: str) -> None:
+        """
+        Application command of the control socket
+        :param name:    command name
+        :param handler: callable(argument) -> reply text, runs on the control server thread
+        :param usage:   help line
+        :return: None
+        """
+        self.commands[name] = (handler, usage)
+
+    def elements(self) -> list:
+        return iterate(self.pipeline.iterate_recurse())
+
+    def dump(self, reason: str = 'request') -> str:
+        """
+        :param reason: logged and written to the directory
+        :return: dump directory
+        """
+        with self._lock:
+            location = os.path.join(self.output_dir, time.strftime('%Y%m%d-%H%M%S'))
+            suffix = 1
+            while os.path.exists(location):
+                location = os.path.join(self.output_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{suffix}')
+                suffix += 1
+            os.makedirs(location)
+            elements = self.elements()
+            sections = {'pipeline.dot': lambda: Gst.debug_bin_to_dot_data(self.pipeline, Gst.DebugGraphDetails.ALL),
+                        'pads.txt': lambda: self.pads(elements),
+                        'states.txt': lambda: self.states(elements),
+                        'queues.txt': lambda: self.queues(elements),
+                        'latency.txt': self.latency,
+                        'debug.txt': self.debug_levels,
+                        }
+            for file_name, section in sections.items():
+                try:
+                    text = section()
+                except Exception as e:
+                    text = f'failed: {e}\n'
+                with open(os.path.join(location, file_name), 'w') as f:
+                    f.write(text)
+            with open(os.path.join(location, 'reason.txt'), 'w') as f:
+                f.write(f'{reason}\n')
+        if self.verbose:
+            logging.info(f'Pipeline diagnostics ({reason}) saved to {location}')
+        return location
+
+    @staticmethod
+    def pads(elements: list) -> str:
+        lines = []
+        for element in elements:
+            for pad in iterate(element.iterate_pads()):
+                peer = pad.get_peer()
+                peer_name = f'{peer.get_parent_element().get_name()}:{peer.get_name()}' \
+                    if peer is not None and peer.get_parent_element() is not None else 'unlinked'
+                caps = pad.get_current_caps()
+                direction = 'src' if pad.get_direction() == Gst.PadDirection.SRC else 'sink'
+                lines.append(f'{element.get_name()}:{pad.get_name()} ({direction}) -> {peer_name}\n'
+                             f'    {caps.to_string() if caps is not None else "not negotiated"}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def states(elements: list) -> str:
+        lines = []
+        for element in elements:
+            _, state, pending = element.get_state(0)
+            lines.append(f'{element.get_name():32} {Gst.Element.state_get_name(state):10} '
+                         f'pending {Gst.Element.state_get_name(pending)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def queues(elements: list) -> str:
+        lines = []
+        for element in elements:
+            factory = element.get_factory()
+            if factory is None or factory.get_name() not in QUEUE_FACTORIES:
+                continue
+            values = []
+            for name in QUEUE_PROPERTIES:
+                if element.find_property(name) is None:
+                    continue
+                value = element.get_property(name)
+                values.append(f'{name}={_time(value) if name.endswith("time") else value}')
+            lines.append(f'{element.get_name()}: {" ".join(values)}')
+        return '\n'.join(lines) + '\n'
+
+    def latency(self) -> str:
+        query = Gst.Query.new_latency()
+        if not self.pipeline.query(query):
+            return 'latency query failed\n'
+        live, min_latency, max_latency = query.parse_latency()
+        return f'live {live}\nmin {_time(min_latency)}\nmax {_time(max_latency)}\n'
+
+    @staticmethod
+    def debug_levels() -> str:
+        default = Gst.debug_get_default_threshold()
+        lines = [f'active {Gst.debug_is_active()}', f'default {int(default)}']
+        for category in Gst.debug_get_all_categories():
+            threshold = category.get_threshold()
+            if threshold != default:
+                lines.append(f'{category.get_name()}:{int(threshold)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def set_debug(spec: str) -> None:
+        """
+        Per-category levels at runtime, GST_DEBUG syntax
+        :param spec: e.g. 'nvinfer:5,rtsp*:4', a plain level sets the default
+        """
+        Gst.debug_set_active(True)
+        Gst.debug_set_threshold_from_string(spec, False)
+        logging.info(f'GStreamer debug levels: {spec}')
+
+    def execute(self, command: str) -> str:
+        """
+        :param command: control command, see CONTROL_HELP
+        :return: reply text
+        """
+        name, _, argument = command.strip().partition(' ')
+        if name == 'dump':
+            return self.dump(reason=argument or 'control socket') + '\n'
+        if name == 'debug':
+            if not argument:
+                return self.debug_levels()
+            self.set_debug(argument.strip())
+            return 'ok\n'
+        if name in self.commands:
+            return self.commands[name][0](argument.strip())
+        if name == 'help':
+            return CONTROL_HELP + ''.join(f'{usage}\n' for handler, usage in self.commands.values())
+        return f'unknown command "{name}"\n{CONTROL_HELP}'
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer:
+
+    def __init__(self, diagnostics: PipelineDiagnostics, path: str, verbose: bool = True):
+        """
+        Line-oriented control socket, one command per connection:
+            $ echo dump | socat - UNIX-CONNECT:/tmp/inference.sock
+            $ echo "debug nvstreammux:6" | nc -U /tmp/inference.sock
+        Commands run on the server thread, not on the main loop, so they are served while the main loop is busy.
+        :param diagnostics: PipelineDiagnostics
+        :param path:        unix socket path, a stale socket file is replaced
+        :param verbose:
+        """
+        self.path = path
+        self.verbose = verbose
+        diagnostics_ = diagnostics
+
+        class _Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                command = self.rfile.readline().decode(errors='replace')
+                try:
+                    reply = diagnostics_.execute(command)
+                except Exception as e:
+                    reply = f'error: {e}\n'
+                self.wfile.write(reply.encode())
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = _UnixServer(path, _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='control_server', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+        if self.verbose:
+            logging.info(f'Control socket on {self.path}')
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
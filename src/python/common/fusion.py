@@ -0,0 +1,91 @@
+import numpy as np
+
+from common import tracking
+
+# Label spellings of the same class in different models
+ALIASES = {'twowheeler': 'bicycle', 'two_wheeler': 'bicycle', 'roadsign': 'road_sign', 'people': 'person'}
+
+
+def normalize_label(label: str) -> str:
+    name = label.strip().lower().replace(' ', '_').replace('-', '_')
+    return ALIASES.get(name, name)
+
+
+class Taxonomy:
+
+    def __init__(self, models_labels: dict):
+        """
+        Shared class list of several detectors, classes with the same normalized label are merged
+        :param models_labels: unique_component_id -> labels of the model
+        """
+        self.names = []
+        self._lookup = {}
+        for component_id, labels in sorted(models_labels.items()):
+            table = np.empty(len(labels), dtype=np.int64)
+            for class_id, label in enumerate(labels):
+                name = normalize_label(label)
+                if name not in self.names:
+                    self.names.append(name)
+                table[class_id] = self.names.index(name)
+            self._lookup[component_id] = table
+        self.max_component_id = max(self._lookup) if self._lookup else 0
+        self.max_class_id = max((len(t) for t in self._lookup.values()), default=0)
+        # Dense (component, class) -> shared id table, -1 for unknown pairs
+        self._table = np.full((self.max_component_id + 1, self.max_class_id + 1), -1, dtype=np.int64)
+        for component_id, table in self._lookup.items():
+            self._table[component_id, :len(table)] = table
+
+    def shared_ids(self, component_ids: np.ndarray, class_ids: np.ndarray) -> np.ndarray:
+        """
+        :param component_ids: (N,) unique_component_id of the objects
+        :param class_ids:     (N,) model class ids
+        :return: (N,) shared class ids, -1 for classes outside the taxonomy
+        """
+        component_ids = np.asarray(component_ids, dtype=np.int64)
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        known = (component_ids >= 0) & (component_ids <= self.max_component_id) & \
+                (class_ids >= 0) & (class_ids <= self.max_class_id)
+        shared = np.full(len(class_ids), -1, dtype=np.int64)
+        shared[known] = self._table[component_ids[known], class_ids[known]]
+        return shared
+
+    def name(self, shared_id: int) -> str:
+        return self.names[shared_id] if 0 <= shared_id < len(self.names) else 'unknown'
+
+
+def fuse(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, models: np.ndarray = None,
+         iou_threshold: float = 0.5) -> np.ndarray:
+    """
+    Greedy NMS over objects of one frame. Objects suppress lower-score objects of the same shared class
+    with IOU above the threshold. With models given only objects of different models suppress each other,
+    the clustering of every model is kept as is.
+    :param boxes:         (N, 4) left, top, width, height
+    :param scores:        (N,) confidences
+    :param classes:       (N,) shared class ids, objects of class -1 are never suppressed
+    :param models:        (N,) unique_component_id, None for plain class-wise NMS
+    :param iou_threshold: duplicates IOU
+    :return: (N,) bool mask of the kept objects
+    """
+    n = len(scores)
+    models = np.asarray(models) if models is not None else None
+    keep = np.ones(n, dtype=bool)
+    if n < 2 or (models is not None and np.all(models == models[0])):
+        return keep
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    xyxy = tracking.ltwh_to_xyxy(boxes)[order]
+    classes = np.asarray(classes)[order]
+
+    # Upper triangle in score order: row i can only suppress lower-score columns
+    conflicts = np.triu(tracking.iou_matrix(xyxy, xyxy) > iou_threshold, k=1)
+    conflicts &= (classes[:, None] == classes[None, :]) & (classes[:, None] >= 0)
+    if models is not None:
+        models = models[order]
+        conflicts &= models[:, None] != models[None, :]
+
+    kept = np.ones(n, dtype=bool)
+    # Only rows with conflicts need the sequential pass
+    for i in np.flatnonzero(conflicts.any(axis=1)).tolist():
+        if kept[i]:
+            kept[conflicts[i]] = False
+    keep[order] = kept
+    return keep
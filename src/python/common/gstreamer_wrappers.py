@@ -1,10 +1,18 @@
+import os
 import sys
 import time
+import pstats
+import cProfile
 import logging
+import resource
+import threading
+import functools
+import collections
 import cv2
 import gi
 import platform
 from common import nvutils
+from common import decimation
 
 gi.require_version('Gst', '1.0')
 gi.require_version('GstRtsp', '1.0')
@@ -16,12 +24,17 @@ from abc import ABCMeta, abstractmethod
 class RTSPBin:
 
     def __init__(self, builder_id: int, location: str, compression: str = 'h264',
-                 retry: int = 25000, verbose: bool = True):
+                 retry: int = 25000, record: bool = False, parse: bool = False, target_fps: float = 0,
+                 source_fps: float = decimation.SOURCE_FPS, verbose: bool = True):
         """
         :param builder_id:  RTSP index, int
         :param location:    RTSP address with port and postfix, str
         :param compression: Video compression format
         :param retry:       rtspsrc number of retries
+        :param record:      tee the parsed encoded stream to record_sink appsink
+        :param parse:       depay and parse before decodebin on dGPU too, the decoder gets access units
+        :param target_fps:  decoded frames per second passed on to the muxer, 0 passes every frame
+        :param source_fps:  frame rate of the camera
         :param verbose:
         """
         self.verbose = verbose
@@ -29,6 +42,10 @@ class RTSPBin:
         self.location = location
         self.compression = compression
         self.retry = retry
+        self.record = record
+        self.parse = parse
+        self.target_fps = target_fps
+        self.drop_interval = decimation.drop_interval(target_fps, source_fps)
 
         self.available_compression = {'h264': {'depayer': 'rtph264depay',
                                                'parser': 'h264parse',
@@ -41,10 +58,16 @@ class RTSPBin:
         self.depayer = None
         self.parser = None
         self.decoder = None
+        self.tee = None
+        self.decoder_queue = None
+        self.record_queue = None
+        self.record_sink = None
         self.connect_plugin = None
         self.is_aarch64 = nvutils.is_aarch64()
         self.enable_max_performance = 1
         self.enable_frame_type_reporting = 0
+        self.decimator = None
+        self._decoder_drops = False
 
         self._build()
 
@@ -59,6 +82,13 @@ class RTSPBin:
                                 else:
                                              RTSP packets reader    |src|->
                                     |sink|-> decodebin              |src|->
+        With parse the depayer and parser are added on dGPU too, before decodebin.
+        With record the parsed stream is split before decoding (parser is added on dGPU too):
+                                    |sink|-> Video parser           |src|-> tee
+                                tee |src|-> queue -> Video decoder  |src|->
+                                tee |src|-> leaky queue -> appsink  (record_sink)
+        With target_fps nvv4l2decoder outputs every drop_interval-th frame. A decoder decodebin picks without
+        drop-frame-interval gets a FrameDecimator probe on the decoded pad, so skipped frames never reach the muxer.
         :return: self
         """
 
@@ -82,25 +112,190 @@ class RTSPBin:
             self.decoder = Gst.ElementFactory.make("nvv4l2decoder", "nvv4l2decoder" + f'_{self.builder_id}')
             self.decoder.set_property("enable-max-performance", self.enable_max_performance)
             self.decoder.set_property("enable-frame-type-reporting", self.enable_frame_type_reporting)
+            if self.drop_interval:
+                decimation.configure_decoder(self.decoder, self.drop_interval, self.verbose)
             self.connect_plugin = self.depayer
         else:
             self.decoder = Gst.ElementFactory.make("decodebin", "decode_container" + f'_{self.builder_id}')
+            if self.drop_interval:
+                self.decimator = decimation.FrameDecimator(self.target_fps)
+                self.decoder.connect('element-added', self._on_decoder_element_added)
+                self.decoder.connect('pad-added', self._on_decoded_pad_added)
             self.connect_plugin = self.decoder
+            if self.record or self.parse:
+                self.depayer = Gst.ElementFactory.make(cur_comp['depayer'],
+                                                       cur_comp['depayer'] + f'_{self.builder_id}')
+                self.parser = Gst.ElementFactory.make(cur_comp['parser'], cur_comp['parser'] + f'_{self.builder_id}')
+                self.connect_plugin = self.depayer
+
+        if self.record or self.parse:
+            # Parameter sets with every keyframe, so each recorded or admitted GOP is decodable on its own
+            self.parser.set_property('config-interval', -1)
+        if self.record:
+            self.tee = Gst.ElementFactory.make('tee', f'record_tee_{self.builder_id}')
+            self.decoder_queue = Gst.ElementFactory.make('queue', f'decoder_queue_{self.builder_id}')
+            self.record_queue = Gst.ElementFactory.make('queue', f'record_queue_{self.builder_id}')
+            self.record_queue.set_property('leaky', 2)
+            self.record_sink = Gst.ElementFactory.make('appsink', f'record_sink_{self.builder_id}')
+            self.record_sink.set_property('caps', Gst.Caps.from_string(
+                f'video/x-{self.compression}, stream-format=(string)byte-stream, alignment=(string)au'))
+            self.record_sink.set_property('max-buffers', 30)
+            self.record_sink.set_property('drop', True)
+
+    def _on_decoder_element_added(self, decodebin, element) -> None:
+        if decimation.configure_decoder(element, self.drop_interval, self.verbose):
+            self._decoder_drops = True
+
+    def _on_decoded_pad_added(self, decodebin, pad) -> None:
+        if self._decoder_drops:
+            return
+        if self.verbose:
+            logging.info(f'{decodebin.get_name()}: no {decimation.DECODER_PROPERTY}, '
+                         f'decimating to {self.target_fps} fps by timestamps')
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.decimator.probe, 0)
+
+    @property
+    def elements(self) -> list:
+        elements = [self.rtspsrc, self.depayer, self.parser, self.tee, self.decoder_queue, self.decoder,
+                    self.record_queue, self.record_sink]
+        return [e for e in elements if e is not None]
+
+    def restart(self) -> None:
+        """
+        Reconnects the block alone: the elements go to NULL upstream first, which closes the RTSP session and
+        drops the decoder state, and back to the state of the pipeline downstream first. The pad-removed and
+        pad-added handlers unlink and relink the block as on a camera reconnection.
+        :return: None
+        """
+        for element in self.elements:
+            element.set_state(Gst.State.NULL)
+        for element in reversed(self.elements):
+            element.sync_state_with_parent()
+
+    def link_elements(self) -> None:
+        """
+        Links static pads of the block, rtspsrc and decodebin pads are linked by pad-added handlers
+        :return: None
+        """
+        if self.depayer is None:
+            return
+        self.depayer.link(self.parser)
+        if self.record:
+            self.parser.link(self.tee)
+            self.tee.link(self.decoder_queue)
+            self.decoder_queue.link(self.decoder)
+            self.tee.link(self.record_queue)
+            self.record_queue.link(self.record_sink)
+        else:
+            self.parser.link(self.decoder)
+
+    def link_rtspsrc(self) -> None:
+        """
+        Links the dynamic rtspsrc pads to the depayloader as they are added, on every reconnection too. Call before
+        the pipeline leaves NULL: the first pads are added while it goes to PLAYING.
+        :return: None
+        """
+        self.rtspsrc.connect('pad-added', self._on_rtspsrc_pad_added)
+        self.rtspsrc.connect('pad-removed', self._on_rtspsrc_pad_removed)
+
+    def _on_rtspsrc_pad_added(self, rtspsrc, pad) -> None:
+        sink_pad = self.connect_plugin.get_static_pad('sink')
+        if not sink_pad.is_linked():
+            pad.link(sink_pad)
+
+    def _on_rtspsrc_pad_removed(self, rtspsrc, pad) -> None:
+        sink_pad = self.connect_plugin.get_static_pad('sink')
+        if sink_pad.is_linked():
+            pad.unlink(sink_pad)
+
+
+def group_sources(locations: list, share: bool = True) -> list:
+    """
+    :param locations: source URIs, the list index is the source id
+    :param share:     group the ids of duplicate URIs, one group per source otherwise
+    :return: lists of source ids in order of first appearance, one list per RTSP connection
+    """
+    groups = collections.OrderedDict()
+    for source_id, location in enumerate(locations):
+        groups.setdefault(location if share else source_id, []).append(source_id)
+    return list(groups.values())
+
+
+class SourceFanOut:
+
+    def __init__(self, builder_id: int, source_ids: list, max_buffers: int = 2, verbose: bool = True):
+        """
+        Decoded frames of one RTSPBin shared by the sources with the same URL:
+                |sink|-> tee   |src|->
+                tee    |src|-> leaky queue |src|-> nvstreammux sink_<source_id>, one queue per source id
+        Buffers are passed by reference, a camera is connected to and decoded once. The queues decouple
+        the muxer pads, a full branch drops its oldest frame instead of blocking the decoder.
+        :param builder_id:  RTSPBin index
+        :param source_ids:  muxer pad indices of the sources sharing the connection
+        :param max_buffers: queue size per source
+        :param verbose:
+        """
+        self.builder_id = builder_id
+        self.source_ids = list(source_ids)
+        self.verbose = verbose
+        self.tee = Gst.ElementFactory.make('tee', f'fanout_tee_{builder_id}')
+        self.queues = collections.OrderedDict()
+        for source_id in self.source_ids:
+            queue = Gst.ElementFactory.make('queue', f'fanout_queue_{builder_id}_{source_id}')
+            queue.set_property('leaky', 2)
+            queue.set_property('max-size-buffers', max_buffers)
+            queue.set_property('max-size-bytes', 0)
+            queue.set_property('max-size-time', 0)
+            self.queues[source_id] = queue
+
+    @property
+    def elements(self) -> list:
+        return [self.tee] + list(self.queues.values())
+
+    def link_elements(self) -> None:
+        for queue in self.queues.values():
+            self.tee.link(queue)
+
+    def src_pad(self, source_id: int):
+        """
+        :return: decoded frames of the source before the muxer
+        """
+        return self.queues[source_id].get_static_pad('src')
+
+    def link_muxer(self, streammux) -> None:
+        """
+        Queue src pads are static, the muxer pads of the sources are requested and linked once
+        :param streammux: nvstreammux
+        :return: None
+        """
+        for source_id in self.source_ids:
+            if self.verbose:
+                logging.info(f'Sharing connection {self.builder_id} with muxer pad sink_{source_id}')
+            self.src_pad(source_id).link(streammux.get_request_pad(f'sink_{source_id}'))
 
 
 class RTSPHandler:
-    def __init__(self, pipeline, loop, basic_blocks: dict, verbose: bool = True, **kwargs):
+    def __init__(self, pipeline, loop, basic_blocks: dict, verbose: bool = True, metrics=None,
+                 link_pads: bool = True, **kwargs):
         """
         GStreamer rtsp handler with pipeline reconnection option
         :param pipeline:
         :param loop:
         :param basic_blocks:
         :param verbose:
+        :param metrics:      metrics.PipelineMetrics for disconnects, downtime and reconnects, optional
+        :param link_pads:    link rtspsrc pads to the blocks, False if RTSPBin.link_rtspsrc already does it
+                             (pipelines started before the handler exists)
         """
 
         self.pipeline = pipeline
         self.loop = loop
         self.basic_blocks = basic_blocks
+        self.metrics = metrics
+        self.link_pads = link_pads
+        self.verbose = verbose
+        # source id -> (rtspsrc, pad signal handler ids)
+        self._pad_handlers = {}
 
         self.init_pipeline_callbacks()
         self.init_signal_watch()
@@ -117,8 +312,6 @@ class RTSPHandler:
         self._rtspsrc_flow_th = 0
         self._rtspsrc_flow_timer = 1e5
 
-        self.verbose = verbose
-
     def init_pipeline_callbacks(self):
         """Note that source is an rtspsrc element which has a dynamically
         created source pad.  This means it can only be linked after the pad has
@@ -127,13 +320,53 @@ class RTSPHandler:
         :return: None
         """
         for source_id in self.basic_blocks.keys():
-            self.basic_blocks[source_id].rtspsrc.connect('pad-added', self.on_pad_added_to_rtspsrc)
-            self.basic_blocks[source_id].rtspsrc.connect('pad-removed', self.on_pad_removed_from_rtspsrc)
+            self._connect_block(source_id, self.basic_blocks[source_id])
+
+    def _connect_block(self, source_id: int, block) -> None:
+        self._pad_handlers[source_id] = (block.rtspsrc,
+                                         [block.rtspsrc.connect('pad-added', self.on_pad_added_to_rtspsrc),
+                                          block.rtspsrc.connect('pad-removed', self.on_pad_removed_from_rtspsrc)])
+
+    def _disconnect_block(self, source_id: int) -> None:
+        rtspsrc, handler_ids = self._pad_handlers.pop(source_id, (None, []))
+        for handler_id in handler_ids:
+            rtspsrc.disconnect(handler_id)
+
+    def add_block(self, source_id: int, block) -> None:
+        """
+        Handles an RTSPBin added to the running pipeline
+        :param source_id: builder id of the block
+        :param block:     RTSPBin
+        :return: None
+        """
+        self.basic_blocks[source_id] = block
+        self._connect_block(source_id, block)
+
+    def remove_block(self, source_id: int) -> None:
+        """
+        Forgets an RTSPBin before it is removed from the pipeline
+        :param source_id: builder id of the block
+        :return: None
+        """
+        self._disconnect_block(source_id)
+        self.basic_blocks.pop(source_id, None)
+        self._rtspsrc_active.pop(source_id, None)
 
     def init_signal_watch(self):
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
-        bus_watch_id = bus.connect("message", self.reconnection_callback, self.loop)
+        self.bus_watch_id = bus.connect("message", self.reconnection_callback, self.loop)
+
+    def close(self) -> None:
+        """
+        Detaches the handler from the pipeline bus and the rtspsrc pads, the pipeline keeps its state
+        :return: None
+        """
+        for source_id in list(self._pad_handlers):
+            self._disconnect_block(source_id)
+        bus = self.pipeline.get_bus()
+        bus.disconnect(self.bus_watch_id)
+        bus.remove_signal_watch()
 
     def on_pad_added_to_rtspsrc(self, rtspsrc, pad):
         """
@@ -148,6 +381,10 @@ class RTSPHandler:
         source_id = int(rtspsrc.get_name().split('_')[-1])
         if self.verbose:
             logging.info(f'Pad added to rtspsrc element. Source id: {source_id}')
+        if self.metrics is not None:
+            self.metrics.source_connected(source_id)
+        if not self.link_pads:
+            return
         sink_pad = self.basic_blocks[source_id].connect_plugin.get_static_pad('sink')
         if not sink_pad.is_linked():
             pad.link(sink_pad)
@@ -162,6 +399,10 @@ class RTSPHandler:
         source_id = int(rtspsrc.get_name().split('_')[-1])
         if self.verbose:
             logging.info(f'Pad removed from rtspsrc element. Source id: {source_id}')
+        if self.metrics is not None:
+            self.metrics.source_disconnected(source_id)
+        if not self.link_pads:
+            return
         sink_pad = self.basic_blocks[source_id].connect_plugin.get_static_pad('sink')
         if sink_pad.is_linked():
             pad.unlink(sink_pad)
@@ -236,6 +477,8 @@ class RTSPHandler:
         self.check_rtspsrc_flow()
 
         while not self.alive:
+            if self.metrics is not None:
+                self.metrics.reconnects.labels().inc()
             time.sleep(self.reconn_wait)
             # Clean pipeline and set playing state
             self.pipeline.set_state(Gst.State.NULL)
@@ -355,21 +598,311 @@ class StreamMuxHandler(ElementsConnectionHandler):
         self.next_element_sink_pad = None
 
 
-def object_generator(obj, parse_function):
+class FrameBranch:
+
+    def __init__(self, name: str, width: int = None, height: int = None, caps_format: str = 'RGBA',
+                 max_buffers: int = 2, verbose: bool = True):
+        """
+        Side branch for a tee which converts batches to CPU-mappable frames for Python consumers:
+                |sink|-> leaky queue        |src|->
+                |sink|-> nvvideoconvert     |src|->
+                |sink|-> capsfilter         |src|->   <- probe on src_pad gets mappable surfaces
+                |sink|-> metadata sink
+        The queue drops old batches instead of blocking the tee, so a slow consumer never stalls analytics.
+        :param name:        branch name, used as element names prefix
+        :param width:       output width, muxer width if None
+        :param height:      output height, muxer height if None
+        :param caps_format: output color format
+        :param max_buffers: queue size in batches
+        :param verbose:
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.caps_format = caps_format
+        self.max_buffers = max_buffers
+        self.verbose = verbose
+        self.is_aarch64 = nvutils.is_aarch64()
+
+        self.queue = None
+        self.convertor = None
+        self.capsfilter = None
+        self.sink = None
+
+        self._build()
+
+    def _build(self):
+        self.queue = Gst.ElementFactory.make('queue', f'{self.name}_queue')
+        self.queue.set_property('leaky', 2)
+        self.queue.set_property('max-size-buffers', self.max_buffers)
+        self.queue.set_property('max-size-bytes', 0)
+        self.queue.set_property('max-size-time', 0)
+
+        self.convertor = Gst.ElementFactory.make('nvvideoconvert', f'{self.name}_convertor')
+        if not self.is_aarch64:
+            # pyds.get_nvds_buf_surface maps only unified CUDA memory on dGPU
+            self.convertor.set_property('nvbuf-memory-type', 3)
+
+        caps = f'video/x-raw(memory:NVMM), format=(string){self.caps_format}'
+        if self.width and self.height:
+            caps += f', width=(int){self.width}, height=(int){self.height}'
+        self.capsfilter = Gst.ElementFactory.make('capsfilter', f'{self.name}_filter')
+        self.capsfilter.set_property('caps', Gst.Caps.from_string(caps))
+
+        self.sink = make_metadata_sink(f'{self.name}_sink')
+        if self.verbose:
+            logging.info(f'Building {self.name} branch: {caps}')
+
+    @property
+    def elements(self) -> tuple:
+        return self.queue, self.convertor, self.capsfilter, self.sink
+
+    @property
+    def src_pad(self):
+        return self.capsfilter.get_static_pad('src')
+
+    def add_to(self, pipeline) -> None:
+        for element in self.elements:
+            pipeline.add(element)
+        self.queue.link(self.convertor)
+        self.convertor.link(self.capsfilter)
+        self.capsfilter.link(self.sink)
+
+    def link_from(self, tee) -> None:
+        tee.link(self.queue)
+
+
+def make_metadata_sink(name: str = 'metadata_sink'):
     """
-    Note that batch_meta.frame_meta_list.data needs a cast to pyds.NvDsFrameMeta.cast()
-    The casting also keeps ownership of the underlying memory in the C code,
-    so the Python garbage collector will leave it alone.
-    Args:
-        obj:  batch_meta.frame_meta_list or another
-        parse_function: pyds.NvDsFrameMeta.cast or another
-
-    Returns:
+    Terminal element for headless pipelines. The sink only drops batches after the probes have read
+    their metadata: no clock synchronization, no preroll wait and no reference to the last buffer,
+    so batch surfaces return to the nvstreammux pool as soon as the analytics chain is done with them.
+    :param name: element name
+    :return: fakesink element
     """
+    sink = Gst.ElementFactory.make('fakesink', name)
+    sink.set_property('sync', 0)
+    sink.set_property('async', 0)
+    sink.set_property('qos', 0)
+    sink.set_property('enable-last-sample', 0)
+    return sink
 
-    try:
-        while obj is not None:
-            yield parse_function(obj.data)
-            obj = obj.next
-    except Exception as e:
-        sys.stderr.write(e)
+
+try:
+    _thread_cpu_ns = time.thread_time_ns
+except AttributeError:
+    # Python 3.6
+    def _thread_cpu_ns() -> int:
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return int((usage.ru_utime + usage.ru_stime) * 1e9)
+
+
+class HdrHistogram:
+
+    def __init__(self, sub_bucket_bits: int = 5, max_exponent: int = 40):
+        """
+        Log-linear histogram of integer values in the spirit of HdrHistogram: every power of two is split
+        into 2 ** sub_bucket_bits linear buckets, so the relative error is bounded (~3 % for 5 bits) over the
+        whole range. Recording is an index computation and a list increment.
+        :param sub_bucket_bits: linear buckets per power of two, as bits
+        :param max_exponent:    largest recorded value is 2 ** max_exponent, larger values are clamped
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.max_value = (1 << max_exponent) - 1
+        self.counts = [0] * ((max_exponent - sub_bucket_bits + 1) * self.sub_buckets)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return (shift + 1) * self.sub_buckets + (value >> shift) - self.sub_buckets
+
+    def _lower_bound(self, index: int) -> int:
+        if index < self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        return (index % self.sub_buckets + self.sub_buckets) << shift
+
+    def record(self, value: int) -> None:
+        value = min(max(0, int(value)), self.max_value)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> int:
+        """
+        :param q: percentile, 0 - 100
+        :return: lower bound of the bucket holding the percentile
+        """
+        if not self.count:
+            return 0
+        rank = q / 100 * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if count and running >= rank:
+                return self._lower_bound(index)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class ProbeStats:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall = HdrHistogram()
+        self.cpu = HdrHistogram()
+        self.objects = 0
+        self.threads = set()
+
+    def summary(self) -> str:
+        calls = self.wall.count
+        return (f'{self.name}: calls {calls}, '
+                f'wall mean {self.wall.mean / 1e3:.1f} us p50 {self.wall.percentile(50) / 1e3:.1f} us '
+                f'p99 {self.wall.percentile(99) / 1e3:.1f} us max {self.wall.max / 1e3:.1f} us, '
+                f'cpu mean {self.cpu.mean / 1e3:.1f} us, '
+                f'objects/call {self.objects / max(1, calls):.1f}, '
+                f'us/object {self.wall.total / 1e3 / max(1, self.objects):.2f}')
+
+
+class ProbeProfiler:
+
+    def __init__(self, objects=None, verbose: bool = True):
+        """
+        Measures pad probes in the streaming threads: wall and thread CPU time and objects per call
+        into HdrHistograms. On demand, for a window of seconds, the probes also run under cProfile and
+        a sampler thread records the stacks of the probe threads, dumped as a pstats file and as
+        folded stacks (the py-spy raw format, input of flamegraph.pl / speedscope).
+            profiler = ProbeProfiler()
+            pad.add_probe(Gst.PadProbeType.BUFFER, profiler.wrap('pgie', probe, objects=count_objects), 0)
+            # or
+            @profiler.profile('pgie')
+            def probe(pad, info, u_data): ...
+        :param objects: default callable(info) -> number of objects processed by a call, optional
+        :param verbose:
+        """
+        self.objects = objects
+        self.verbose = verbose
+        self.stats = collections.OrderedDict()
+        # thread id -> cProfile.Profile while a window is open
+        self._profiles = None
+        self._window_lock = threading.Lock()
+
+    def wrap(self, name: str, probe, objects=None):
+        """
+        :param name:    probe name
+        :param probe:   pad probe callback
+        :param objects: callable(info) -> number of objects processed by the call, the profiler default if None
+        :return: profiled probe callback
+        """
+        objects = objects or self.objects
+        stats = self.stats.setdefault(name, ProbeStats(name))
+
+        @functools.wraps(probe)
+        def _profiled_probe(pad, info, u_data):
+            stats.threads.add(threading.get_ident())
+            profiles = self._profiles
+            wall_start = time.perf_counter()
+            cpu_start = _thread_cpu_ns()
+            if profiles is None:
+                result = probe(pad, info, u_data)
+            else:
+                profile = profiles.get(threading.get_ident())
+                if profile is None:
+                    profile = profiles.setdefault(threading.get_ident(), cProfile.Profile())
+                result = profile.runcall(probe, pad, info, u_data)
+            stats.cpu.record(_thread_cpu_ns() - cpu_start)
+            stats.wall.record((time.perf_counter() - wall_start) * 1e9)
+            if objects is not None:
+                stats.objects += objects(info)
+            return result
+
+        return _profiled_probe
+
+    def instrument_probe(self, name: str, probe):
+        return self.wrap(name, probe)
+
+    def profile(self, name: str, objects=None):
+        """
+        Decorator form of wrap()
+        """
+        def _decorator(probe):
+            return self.wrap(name, probe, objects=objects)
+
+        return _decorator
+
+    def report(self) -> str:
+        return '\n'.join(stats.summary() for stats in self.stats.values())
+
+    def start_window(self, seconds: float, output_dir: str, sample_interval: float = 0.005) -> str:
+        """
+        Profile the probes for a window of seconds on a background thread
+        :param seconds:         window duration
+        :param output_dir:      a timestamped directory is created inside
+        :param sample_interval: stack sampling period, seconds
+        :return: output directory of the window, None if a window is already open
+        """
+        if not self._window_lock.acquire(blocking=False):
+            return None
+        location = os.path.join(output_dir, time.strftime('%Y%m%d-%H%M%S'))
+        os.makedirs(location, exist_ok=True)
+        self._profiles = {}
+        thread = threading.Thread(target=self._run_window, args=(seconds, location, sample_interval),
+                                  name='probe_profiler', daemon=True)
+        thread.start()
+        if self.verbose:
+            logging.info(f'Profiling probes for {seconds} s to {location}')
+        return location
+
+    def _run_window(self, seconds: float, location: str, sample_interval: float) -> None:
+        try:
+            samples = collections.Counter()
+            probe_threads = set()
+            for stats in self.stats.values():
+                probe_threads |= stats.threads
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id in probe_threads:
+                        samples[self._folded_stack(frame)] += 1
+                time.sleep(sample_interval)
+
+            profiles, self._profiles = self._profiles, None
+            with open(os.path.join(location, 'probes.folded'), 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f'{stack} {count}\n')
+            profiles = [p for p in profiles.values()]
+            if profiles:
+                # A profile of a thread still inside runcall is complete after the next call returns
+                time.sleep(0.1)
+                stats = pstats.Stats(profiles[0])
+                for profile in profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(os.path.join(location, 'probes.prof'))
+            with open(os.path.join(location, 'summary.txt'), 'w') as f:
+                f.write(self.report() + '\n')
+            if self.verbose:
+                logging.info(f'Probe profile saved to {location}\n{self.report()}')
+        except Exception as e:
+            logging.error(f'Probe profile failed: {e}')
+        finally:
+            self._profiles = None
+            self._window_lock.release()
+
+    @staticmethod
+    def _folded_stack(frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
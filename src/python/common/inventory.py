@@ -0,0 +1,310 @@
+import os
+import json
+import difflib
+import logging
+from urllib.parse import quote, urlsplit
+from collections import OrderedDict, defaultdict, namedtuple
+
+import gi
+
+gi.require_version('GLib', '2.0')
+from gi.repository import GLib
+
+CODECS = ('h264', 'h265')
+CAMERA_FIELDS = ('id', 'url', 'host', 'port', 'path', 'user', 'password', 'password_env', 'codec', 'analytics_fps',
+                 'stall_timeout', 'enabled', 'tags')
+# analytics_fps and stall_timeout of None fall back to the command line values
+DEFAULTS = {'port': 554, 'path': '', 'codec': 'h264', 'analytics_fps': None, 'stall_timeout': None, 'enabled': True,
+            'tags': ()}
+# Errors listed in one ValueError, the rest are counted
+MAX_REPORTED_ERRORS = 20
+
+Camera = namedtuple('Camera', ['id', 'url', 'codec', 'analytics_fps', 'stall_timeout', 'enabled', 'tags'])
+InventoryDiff = namedtuple('InventoryDiff', ['added', 'removed', 'changed'])
+
+
+def display_url(url: str) -> str:
+    """
+    :return: url without the password, for logs
+    """
+    scheme, sep, rest = url.partition('://')
+    credentials, at, address = rest.rpartition('@')
+    if ':' not in credentials:
+        return url
+    return f'{scheme}{sep}{credentials.split(":")[0]}:***@{address}'
+
+
+def _camera_url(entry: dict, errors: list, where: str) -> str:
+    if 'url' in entry:
+        url = entry['url']
+        if not isinstance(url, str) or not url.startswith(('rtsp://', 'rtsps://')):
+            errors.append(f'{where}: url must start with rtsp:// or rtsps://')
+        return url
+    host, port, path = entry.get('host'), entry['port'], entry['path']
+    if not isinstance(host, str) or not host:
+        errors.append(f'{where}: url or host is required')
+        return ''
+    if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+        errors.append(f'{where}: port must be an integer in 1..65535, got {port!r}')
+    if 'password' in entry and 'password_env' in entry:
+        errors.append(f'{where}: password and password_env are exclusive')
+    password = entry.get('password')
+    if 'password_env' in entry:
+        password = os.environ.get(entry['password_env']) if isinstance(entry['password_env'], str) else None
+        if password is None:
+            errors.append(f'{where}: environment variable {entry["password_env"]} is not set')
+    credentials = ''
+    if entry.get('user'):
+        credentials = quote(entry['user'], safe='')
+        if password:
+            credentials += ':' + quote(password, safe='')
+        credentials += '@'
+    return f'rtsp://{credentials}{host}:{port}/{str(path).lstrip("/")}'
+
+
+def _number(entry: dict, key: str, errors: list, where: str):
+    value = entry[key]
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        errors.append(f'{where}: {key} must be a number >= 0, got {value!r}')
+        return None
+    return float(value)
+
+
+def parse_inventory(data) -> 'Inventory':
+    """
+    Validates every entry before anything is used, all errors are reported at once:
+        {"defaults": {"port": 554, "user": "viewer", "password_env": "CAM_PASSWORD", "analytics_fps": 5},
+         "cameras": [{"id": "gate-1", "host": "10.0.0.5", "path": "stream1"},
+                     {"id": "dock-3", "url": "rtsp://10.0.1.7:8554/live", "codec": "h265", "tags": ["dock"]},
+                     {"id": "lab-2", "host": "10.0.2.9", "user": "admin", "password": "secret", "enabled": false}]}
+    Camera values override the defaults. password_env names an environment variable, so the file carries no
+    secrets. analytics_fps and stall_timeout are the per-camera -analytics_fps and -stall_timeout, the command line
+    values apply when they are not set.
+    :param data: decoded JSON
+    :return: Inventory
+    """
+    errors = []
+    if not isinstance(data, dict) or not isinstance(data.get('cameras'), list):
+        raise ValueError('Inventory: expected an object with a "cameras" list')
+    if not isinstance(data.get('defaults', {}), dict):
+        raise ValueError('Inventory: "defaults" must be an object')
+    unknown = set(data) - {'defaults', 'cameras'}
+    if unknown:
+        errors.append(f'unknown top-level keys {sorted(unknown)}')
+    defaults = dict(DEFAULTS, **data.get('defaults', {}))
+    cameras = []
+    seen = set()
+    for index, item in enumerate(data['cameras']):
+        where = f'cameras[{index}]'
+        if not isinstance(item, dict):
+            errors.append(f'{where}: expected an object')
+            continue
+        entry = dict(defaults, **item)
+        for key in set(entry) - set(CAMERA_FIELDS):
+            match = difflib.get_close_matches(key, CAMERA_FIELDS, n=1)
+            errors.append(f'{where}: unknown key "{key}"' + (f', did you mean "{match[0]}"?' if match else ''))
+        camera_id = entry.get('id')
+        if not isinstance(camera_id, str) or not camera_id:
+            errors.append(f'{where}: id must be a non-empty string')
+            continue
+        where = f'{where} "{camera_id}"'
+        if camera_id in seen:
+            errors.append(f'{where}: duplicate id')
+            continue
+        seen.add(camera_id)
+        url = _camera_url(entry, errors, where)
+        if entry['codec'] not in CODECS:
+            errors.append(f'{where}: codec must be one of {CODECS}, got {entry["codec"]!r}')
+        if not isinstance(entry['enabled'], bool):
+            errors.append(f'{where}: enabled must be true or false')
+        tags = entry['tags']
+        if not isinstance(tags, (list, tuple)) or not all(isinstance(tag, str) for tag in tags):
+            errors.append(f'{where}: tags must be a list of strings')
+            tags = ()
+        cameras.append(Camera(camera_id, url, entry['codec'], _number(entry, 'analytics_fps', errors, where),
+                              _number(entry, 'stall_timeout', errors, where), entry['enabled'], tuple(tags)))
+    if errors:
+        listed = '\n'.join(errors[:MAX_REPORTED_ERRORS])
+        more = f'\n... {len(errors) - MAX_REPORTED_ERRORS} more' if len(errors) > MAX_REPORTED_ERRORS else ''
+        raise ValueError(f'Inventory: {len(errors)} errors\n{listed}{more}')
+    inventory = Inventory(cameras)
+    for url, camera_ids in inventory.duplicate_urls().items():
+        logging.warning(f'Inventory: cameras {camera_ids} have the same address {display_url(url)}')
+    return inventory
+
+
+def load_inventory(path: str) -> 'Inventory':
+    """
+    :param path: JSON inventory file, see parse_inventory
+    :return: Inventory
+    """
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Inventory {path}: {e}')
+    return parse_inventory(data)
+
+
+class Inventory:
+
+    def __init__(self, cameras: list):
+        """
+        Cameras in file order with id, host and tag indexes, lookups and diffs stay cheap for thousands of cameras
+        :param cameras: list of Camera
+        """
+        self.cameras = OrderedDict((camera.id, camera) for camera in cameras)
+        self.by_host = defaultdict(list)
+        self.by_tag = defaultdict(list)
+        self.by_url = defaultdict(list)
+        for camera in cameras:
+            self.by_host[urlsplit(camera.url).hostname].append(camera.id)
+            self.by_url[camera.url].append(camera.id)
+            for tag in camera.tags:
+                self.by_tag[tag].append(camera.id)
+
+    def __len__(self) -> int:
+        return len(self.cameras)
+
+    def __iter__(self):
+        return iter(self.cameras.values())
+
+    def __contains__(self, camera_id: str) -> bool:
+        return camera_id in self.cameras
+
+    def get(self, camera_id: str) -> Camera:
+        return self.cameras.get(camera_id)
+
+    def on_host(self, host: str) -> list:
+        """
+        :param host: host name or address
+        :return: cameras of the host
+        """
+        return [self.cameras[camera_id] for camera_id in self.by_host.get(host, ())]
+
+    def tagged(self, tag: str) -> list:
+        return [self.cameras[camera_id] for camera_id in self.by_tag.get(tag, ())]
+
+    @property
+    def enabled(self) -> list:
+        return [camera for camera in self.cameras.values() if camera.enabled]
+
+    def duplicate_urls(self) -> dict:
+        """
+        :return: url -> ids of the cameras sharing it
+        """
+        return {url: camera_ids for url, camera_ids in self.by_url.items() if len(camera_ids) > 1}
+
+    def diff(self, new: 'Inventory') -> InventoryDiff:
+        """
+        :param new: Inventory after a reload
+        :return: InventoryDiff of camera ids, changed cameras differ in any field
+        """
+        added = [camera_id for camera_id in new.cameras if camera_id not in self.cameras]
+        removed = [camera_id for camera_id in self.cameras if camera_id not in new.cameras]
+        changed = [camera_id for camera_id, camera in new.cameras.items()
+                   if camera_id in self.cameras and self.cameras[camera_id] != camera]
+        return InventoryDiff(added, removed, changed)
+
+
+class SlotTable:
+
+    def __init__(self, n_slots: int):
+        """
+        Muxer pads of the cameras: a removed camera frees its slot for the next added one
+        :param n_slots: muxer batch size
+        """
+        self.n_slots = n_slots
+        self.slots = {}
+        self._free = list(range(n_slots))
+
+    def assign(self, camera_id: str):
+        """
+        :return: slot of the camera, None if every slot is taken
+        """
+        if camera_id in self.slots:
+            return self.slots[camera_id]
+        if not self._free:
+            return None
+        slot = self.slots[camera_id] = self._free.pop(0)
+        return slot
+
+    def release(self, camera_id: str):
+        """
+        :return: freed slot, None if the camera had none
+        """
+        slot = self.slots.pop(camera_id, None)
+        if slot is not None:
+            self._free.append(slot)
+            self._free.sort()
+        return slot
+
+
+class InventoryWatcher:
+
+    def __init__(self, path: str, inventory: Inventory, on_change, interval: float = 2.0, verbose: bool = True):
+        """
+        Hot reload of the inventory file. A new version is validated as a whole first: with an error the running
+        cameras are kept and the error is logged, otherwise on_change gets the diff and only the added, removed
+        and changed cameras are touched.
+        :param path:      JSON inventory file
+        :param inventory: Inventory running now
+        :param on_change: callable(InventoryDiff, Inventory), called in the main loop
+        :param interval:  seconds between modification checks
+        :param verbose:
+        """
+        self.path = path
+        self.inventory = inventory
+        self.on_change = on_change
+        self.interval = interval
+        self.verbose = verbose
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self) -> None:
+        GLib.timeout_add(int(self.interval * 1000), self._poll)
+
+    def _poll(self) -> bool:
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._stamp:
+            self._stamp = stamp
+            self.reload()
+        return True
+
+    def request_reload(self, argument: str = '') -> str:
+        """
+        Control socket command, the reload runs in the main loop
+        :return: reply text
+        """
+        GLib.idle_add(self._reload_once)
+        return 'reload scheduled, the result is logged\n'
+
+    def _reload_once(self) -> bool:
+        self.reload()
+        return False
+
+    def reload(self):
+        """
+        :return: InventoryDiff, None if the file is not valid
+        """
+        try:
+            inventory = load_inventory(self.path)
+        except (OSError, ValueError) as e:
+            logging.error(f'Inventory not reloaded, {len(self.inventory)} cameras kept: {e}')
+            return None
+        diff = self.inventory.diff(inventory)
+        if self.verbose:
+            logging.info(f'Inventory reloaded: {len(diff.added)} added, {len(diff.removed)} removed, '
+                         f'{len(diff.changed)} changed')
+        if diff.added or diff.removed or diff.changed:
+            self.on_change(diff, inventory)
+        self.inventory = inventory
+        return diff
@@ -0,0 +1,135 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from common import nvmeta
+
+BranchObject = namedtuple('BranchObject', ['unique_component_id', 'class_id', 'confidence', 'obj_label',
+                                           'left', 'top', 'width', 'height'])
+
+
+class MetadataMerger:
+
+    def __init__(self, timeout: float = 1.0, verbose: bool = True):
+        """
+        Frame-accurate merge of parallel inference branches. The muxer output is split with a tee:
+        the main branch runs one model and continues to the tracker, side branches run the other models and end
+        in a metadata sink. Side branch objects are collected in their nvinfer src pad probes, removed from the
+        shared batch meta and copied into the frame meta of the main branch at the merge pad, which waits until
+        every side branch delivered the same frame. End-to-end latency is the one of the slowest model.
+        :param timeout: seconds the main branch waits for the side branches per batch, objects are not merged
+                        after it and a branch that missed it is not waited for until it delivers a frame again
+        :param verbose:
+        """
+        self.timeout = timeout
+        self.verbose = verbose
+        self.branches = []
+        self._cond = threading.Condition()
+        # (branch, pad_index, frame_num) -> [BranchObject]
+        self._objects = {}
+        # Branches that missed a deadline
+        self._stalled = set()
+        self.n_merged = 0
+        self.n_timeouts = 0
+
+    def add_branch(self, gie) -> None:
+        """
+        :param gie: nvinfer of a side branch
+        :return: None
+        """
+        branch = len(self.branches)
+        self.branches.append(gie.get_name())
+        probe = self._collect_probe(branch, component_id=gie.get_property('unique-id'))
+        gie.get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, probe, 0)
+
+    def attach(self, pad) -> None:
+        """
+        :param pad: main branch pad where side branch objects are added, after the main branch probes
+        :return: None
+        """
+        pad.add_probe(Gst.PadProbeType.BUFFER, self.merge_probe, 0)
+
+    def _collect_probe(self, branch: int, component_id: int):
+        def _buffer_probe(pad, info, u_data):
+            gst_buffer = info.get_buffer()
+            if not gst_buffer:
+                return Gst.PadProbeReturn.OK
+
+            batch_meta = nvmeta.batch_meta(gst_buffer)
+            collected = {}
+            # The main branch walks the objects of the same batch meta, its probes hold the lock too
+            with nvmeta.locked(batch_meta):
+                for frame_meta, obj_metas in nvmeta.batch_objects(batch_meta):
+                    objects = []
+                    for obj_meta in obj_metas:
+                        if obj_meta.unique_component_id != component_id:
+                            continue
+                        rect = obj_meta.rect_params
+                        objects.append(BranchObject(obj_meta.unique_component_id, obj_meta.class_id,
+                                                    obj_meta.confidence, obj_meta.obj_label,
+                                                    rect.left, rect.top, rect.width, rect.height))
+                        # The buffer can be shared with the main branch, its objects enter only through the merge
+                        nvmeta.remove_object(frame_meta, obj_meta)
+                    collected[(branch, frame_meta.pad_index, frame_meta.frame_num)] = objects
+
+            with self._cond:
+                self._objects.update(collected)
+                if branch in self._stalled:
+                    self._stalled.discard(branch)
+                    if self.verbose:
+                        logging.info(f'{self.__class__.__name__}: {self.branches[branch]} delivers frames again')
+                self._cond.notify_all()
+            return Gst.PadProbeReturn.OK
+
+        return _buffer_probe
+
+    def merge_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        batch_meta = nvmeta.batch_meta(gst_buffer)
+        # One deadline for the whole batch, a stalled branch delays it by the timeout at most once
+        deadline = time.monotonic() + self.timeout
+        merged = []
+        for frame_meta in nvmeta.frames(batch_meta):
+            for branch in range(len(self.branches)):
+                objects = self._wait(branch, frame_meta.pad_index, frame_meta.frame_num, deadline)
+                if objects:
+                    merged.append((frame_meta, objects))
+        # Never waits with the lock held: a late side branch still removes its objects from this batch meta
+        with nvmeta.locked(batch_meta):
+            for frame_meta, objects in merged:
+                for obj in objects:
+                    nvmeta.add_object(batch_meta, frame_meta, obj.unique_component_id, obj.class_id,
+                                      obj.confidence, (obj.left, obj.top, obj.width, obj.height), obj.obj_label)
+                self.n_merged += len(objects)
+        return Gst.PadProbeReturn.OK
+
+    def _wait(self, branch: int, pad_index: int, frame_num: int, deadline: float):
+        key = (branch, pad_index, frame_num)
+        with self._cond:
+            while key not in self._objects:
+                remaining = deadline - time.monotonic()
+                if branch in self._stalled or remaining <= 0:
+                    self.n_timeouts += 1
+                    if branch not in self._stalled:
+                        self._stalled.add(branch)
+                        if self.verbose:
+                            logging.warning(f'{self.__class__.__name__}: {self.branches[branch]} did not deliver '
+                                            f'frame {frame_num} of source {pad_index} in {self.timeout} s, '
+                                            f'not waiting for it until it delivers again')
+                    return None
+                self._cond.wait(remaining)
+            objects = self._objects.pop(key)
+            # Older frames of this source will never be merged
+            stale = [k for k in self._objects if k[0] == branch and k[1] == pad_index and k[2] < frame_num]
+            for k in stale:
+                del self._objects[k]
+        return objects
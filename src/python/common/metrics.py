@@ -0,0 +1,395 @@
+import os
+import time
+import bisect
+import logging
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+# Seconds, from 10 us to 1 s
+DURATION_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 1.0)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+# Seconds, from 1 s to 10 min
+STALL_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class _Shards:
+    """
+    Per-thread cells: each streaming thread only writes its own cell, readers sum all cells.
+    No lock on the update path, the cell of a new thread is created once with dict.setdefault.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.cells = {}
+
+    def cell(self) -> list:
+        cell = self.cells.get(threading.get_ident())
+        if cell is None:
+            cell = self.cells.setdefault(threading.get_ident(), [0.0] * self.size)
+        return cell
+
+    def total(self) -> list:
+        totals = [0.0] * self.size
+        for cell in list(self.cells.values()):
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class CounterChild:
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, value: float = 1.0) -> None:
+        self._shards.cell()[0] += value
+
+    @property
+    def value(self) -> float:
+        return self._shards.total()[0]
+
+
+class GaugeChild:
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value: float) -> None:
+        # Single attribute assignment, the last writer wins
+        self.value = value
+
+    def set_function(self, function) -> None:
+        """
+        :param function: callable() -> float evaluated at scrape time
+        """
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class HistogramChild:
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        # bucket counts, +Inf count, sum
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value: float) -> None:
+        cell = self._shards.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def snapshot(self) -> tuple:
+        """
+        :return: (cumulative bucket counts including +Inf, count, sum)
+        """
+        totals = self._shards.total()
+        cumulative, running = [], 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, running, totals[-1]
+
+
+class Metric:
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), registry=None, **kwargs):
+        """
+        Metric family, children are created per label values and should be kept by the hot path:
+            frames = registry.counter('frames_total', 'Frames', ('source',)).labels(source=0)
+        :param name:          metric name
+        :param documentation: HELP text
+        :param labelnames:    label names
+        :param registry:      Registry the family is added to
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.kwargs = kwargs
+        self.children = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, **labels):
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            child = self.children.setdefault(key, self._make_child())
+        return child
+
+    def _make_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self.children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: tuple, child) -> list:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def _make_child(self):
+        return CounterChild()
+
+    def _render_child(self, key, child):
+        return [f'{self.name}{_format_labels(key)} {child.value}']
+
+
+class Gauge(Metric):
+
+    kind = 'gauge'
+
+    def _make_child(self):
+        return GaugeChild()
+
+    def _render_child(self, key, child):
+        try:
+            value = child.get()
+        except Exception as e:
+            logging.error(f'{self.name}: {e}')
+            return []
+        return [f'{self.name}{_format_labels(key)} {value}']
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def _make_child(self):
+        return HistogramChild(self.kwargs.get('buckets', DURATION_BUCKETS))
+
+    def _render_child(self, key, child):
+        cumulative, count, total = child.snapshot()
+        lines = []
+        for bound, value in zip(list(child.buckets) + ['+Inf'], cumulative):
+            lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {value}')
+        lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        lines.append(f'{self.name}_sum{_format_labels(key)} {total}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric: Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def add_collector(self, collector) -> None:
+        """
+        :param collector: callable() run before every scrape, refreshes scrape-time gauges
+        """
+        self.collectors.append(collector)
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.metrics.get(name) or Counter(name, documentation, labelnames, registry=self)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.metrics.get(name) or Gauge(name, documentation, labelnames, registry=self)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DURATION_BUCKETS) -> Histogram:
+        return self.metrics.get(name) or Histogram(name, documentation, labelnames, registry=self, buckets=buckets)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.error(f'Metrics collector {collector}: {e}')
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ProcessCollector:
+
+    def __init__(self, registry: Registry):
+        """
+        Process RSS, CPU time, threads and open file descriptors from /proc
+        """
+        self.rss = registry.gauge('process_resident_memory_bytes', 'Resident memory size').labels()
+        self.cpu = registry.gauge('process_cpu_seconds_total', 'User and system CPU time').labels()
+        self.threads = registry.gauge('process_threads', 'Number of threads').labels()
+        self.fds = registry.gauge('process_open_fds', 'Number of open file descriptors').labels()
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.ticks = os.sysconf('SC_CLK_TCK')
+
+    def __call__(self) -> None:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name, which can contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        self.cpu.set((int(fields[11]) + int(fields[12])) / self.ticks)
+        self.threads.set(int(fields[17]))
+        self.rss.set(int(fields[21]) * self.page_size)
+        self.fds.set(len(os.listdir('/proc/self/fd')))
+
+
+class PipelineMetrics:
+
+    def __init__(self, registry: Registry = None):
+        """
+        Metric families of the inference pipelines
+        :param registry: Registry, a new one if None
+        """
+        self.registry = registry or Registry()
+        r = self.registry
+        self.frames = r.counter('source_frames_total', 'Frames of a source after inference', ('source',))
+        self.fps = r.gauge('source_fps', 'Frames per second of a source since the last scrape', ('source',))
+        self.target_fps = r.gauge('source_target_fps', 'Frames per second of a source passed to the muxer',
+                                  ('source',))
+        self.disconnects = r.counter('source_disconnects_total', 'rtspsrc pad removals of a source', ('source',))
+        self.downtime = r.counter('source_downtime_seconds_total', 'Seconds a source was disconnected', ('source',))
+        self.frames_dropped = r.counter('source_dropped_frames_total', 'Late frames dropped by admission control',
+                                        ('source', 'stage'))
+        self.stalls = r.counter('source_stalls_total', 'Stalls detected by the data-flow watchdog', ('source',))
+        self.stall_duration = r.histogram('source_stall_seconds', 'Time between the last frame before a stall and '
+                                          'the first one after it', ('source',), buckets=STALL_BUCKETS)
+        self.silence = r.gauge('source_seconds_since_frame', 'Seconds since the last new decoded frame of a source',
+                               ('source',))
+        self.watchdog_restarts = r.counter('source_watchdog_restarts_total', 'RTSP block restarts by the watchdog',
+                                           ('source',))
+        self.reconnects = r.counter('pipeline_reconnects_total', 'Pipeline restarts by the reconnection callback')
+        self.queue_buffers = r.gauge('queue_level_buffers', 'Buffers in a queue element', ('element',))
+        self.queue_time = r.gauge('queue_level_seconds', 'Data in a queue element, seconds', ('element',))
+        self.probe_duration = r.histogram('probe_duration_seconds', 'Pad probe wall time per call', ('probe',))
+        self.batch_fill = r.histogram('batch_fill_ratio', 'Frames in a muxer batch over batch-size', (),
+                                      buckets=RATIO_BUCKETS)
+        r.add_collector(ProcessCollector(r))
+        r.add_collector(self._collect_fps)
+        self._fps_last = {}
+        self._disconnected_at = {}
+        self.pipeline = None
+
+    def watch_pipeline(self, pipeline) -> None:
+        """
+        Queue levels of the pipeline are read at scrape time, a later call replaces the pipeline
+        """
+        if self.pipeline is None:
+            self.registry.add_collector(self._collect_queues)
+        self.pipeline = pipeline
+
+    def _collect_queues(self) -> None:
+        iterator = self.pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result == Gst.IteratorResult.RESYNC:
+                iterator.resync()
+                continue
+            if result != Gst.IteratorResult.OK:
+                break
+            factory = element.get_factory()
+            if factory is None or factory.get_name() != 'queue':
+                continue
+            name = element.get_name()
+            self.queue_buffers.labels(element=name).set(element.get_property('current-level-buffers'))
+            self.queue_time.labels(element=name).set(element.get_property('current-level-time') / Gst.SECOND)
+
+    def _collect_fps(self) -> None:
+        now = time.monotonic()
+        for key, child in list(self.frames.children.items()):
+            frames = child.value
+            last = self._fps_last.get(key)
+            if last is not None and now > last[0]:
+                self.fps.labels(**dict(key)).set(round((frames - last[1]) / (now - last[0]), 2))
+            self._fps_last[key] = (now, frames)
+
+    def source_disconnected(self, source_id: int) -> None:
+        self.disconnects.labels(source=source_id).inc()
+        self._disconnected_at.setdefault(source_id, time.monotonic())
+
+    def source_connected(self, source_id: int) -> None:
+        disconnected_at = self._disconnected_at.pop(source_id, None)
+        if disconnected_at is not None:
+            self.downtime.labels(source=source_id).inc(time.monotonic() - disconnected_at)
+
+    def instrument_probe(self, name: str, probe):
+        """
+        :param name:  probe label
+        :param probe: pad probe callback
+        :return: probe callback observing its wall time
+        """
+        histogram = self.probe_duration.labels(probe=name)
+
+        def _timed_probe(pad, info, u_data):
+            start = time.perf_counter()
+            try:
+                return probe(pad, info, u_data)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return _timed_probe
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MetricsServer:
+
+    def __init__(self, registry: Registry, port: int = 9100, address: str = '127.0.0.1', verbose: bool = True):
+        """
+        Serves GET /metrics in the Prometheus text format from a daemon thread
+        :param registry: Registry
+        :param port:     TCP port
+        :param address:  bind address, local only by default
+        :param verbose:
+        """
+        self.registry = registry
+        self.verbose = verbose
+
+        registry_ = registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry_.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _ThreadingHTTPServer((address, port), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics_server', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+        if self.verbose:
+            host, port = self.server.server_address
+            logging.info(f'Metrics on http://{host}:{port}/metrics')
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
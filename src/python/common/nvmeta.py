@@ -0,0 +1,350 @@
+import os
+import sys
+import ctypes
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+# Path for pyds library if python bindings are not installed
+sys.path.append(os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib'))
+try:
+    import pyds
+except ImportError:
+    # CPU hosts: only the fake metadata below can be iterated
+    pyds = None
+
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+
+# Per-frame object fields as arrays, object_ids are int64 with -1 (tracking.UNTRACKED_ID) for untracked objects
+ObjectArrays = namedtuple('ObjectArrays', ['boxes', 'confidences', 'class_ids', 'component_ids', 'object_ids'])
+ClassifierLabel = namedtuple('ClassifierLabel', ['component_id', 'class_id', 'label', 'probability'])
+
+
+def _identity(data):
+    return data
+
+
+_fake = pyds is None
+if pyds is not None:
+    _cast_frame = pyds.NvDsFrameMeta.cast
+    _cast_object = pyds.NvDsObjectMeta.cast
+    _cast_classifier = pyds.NvDsClassifierMeta.cast
+    _cast_label = pyds.NvDsLabelInfo.cast
+    _cast_user = pyds.NvDsUserMeta.cast
+else:
+    _cast_frame = _cast_object = _cast_classifier = _cast_label = _cast_user = _identity
+
+
+def use_fake_metadata() -> None:
+    """
+    Iterate Fake* metadata instead of pyds metadata, for CPU checks and benchmarks
+    """
+    global _fake, _cast_frame, _cast_object, _cast_classifier, _cast_label, _cast_user
+    _fake = True
+    _cast_frame = _cast_object = _cast_classifier = _cast_label = _cast_user = _identity
+
+
+def batch_meta(gst_buffer):
+    """
+    :param gst_buffer: Gst.Buffer with NvDsBatchMeta, or FakeBuffer
+    :return: NvDsBatchMeta
+    """
+    if _fake:
+        return gst_buffer.batch_meta
+    return pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
+
+
+@contextmanager
+def locked(batch):
+    """
+    Holds the lock of the batch meta: branches after a tee share it and add or remove objects concurrently
+    :param batch: NvDsBatchMeta
+    """
+    if _fake:
+        yield batch
+        return
+    pyds.nvds_acquire_meta_lock(batch)
+    try:
+        yield batch
+    finally:
+        pyds.nvds_release_meta_lock(batch)
+
+
+def _collect(node, cast) -> list:
+    items = []
+    while node is not None:
+        items.append(cast(node.data))
+        node = node.next
+    return items
+
+
+def frames(batch) -> list:
+    """
+    :param batch: NvDsBatchMeta
+    :return: list of NvDsFrameMeta. Lists are collected before use, so metadata can be removed while looping.
+    """
+    return _collect(batch.frame_meta_list, _cast_frame)
+
+
+def objects(frame_meta) -> list:
+    """
+    :param frame_meta: NvDsFrameMeta
+    :return: list of NvDsObjectMeta
+    """
+    return _collect(frame_meta.obj_meta_list, _cast_object)
+
+
+def batch_objects(batch) -> list:
+    """
+    :param batch: NvDsBatchMeta
+    :return: list of (NvDsFrameMeta, list of NvDsObjectMeta)
+    """
+    return [(frame_meta, _collect(frame_meta.obj_meta_list, _cast_object)) for frame_meta in frames(batch)]
+
+
+def object_arrays(obj_metas: list) -> ObjectArrays:
+    """
+    One pass over the objects, one attribute read per field. Values go to flat lists: NumPy converts a flat
+    list of scalars several times faster than a list of per-object tuples.
+    :param obj_metas: list of NvDsObjectMeta
+    :return: ObjectArrays, boxes (N, 4) float32 left, top, width, height
+    """
+    floats, ints, ids = [], [], []
+    for obj_meta in obj_metas:
+        rect = obj_meta.rect_params
+        floats += (rect.left, rect.top, rect.width, rect.height, obj_meta.confidence)
+        ints += (obj_meta.class_id, obj_meta.unique_component_id)
+        # Object ids are unsigned 64-bit, negative ids of Python trackers are masked to the same bits
+        ids.append(obj_meta.object_id & UNTRACKED_OBJECT_ID)
+    floats = np.array(floats, dtype=np.float32).reshape(-1, 5)
+    ints = np.array(ints, dtype=np.int64).reshape(-1, 2)
+    # The untracked id 0xFFFFFFFFFFFFFFFF reads back as -1 in two's complement
+    object_ids = np.array(ids, dtype=np.uint64).view(np.int64)
+    return ObjectArrays(floats[:, :4], floats[:, 4], ints[:, 0], ints[:, 1], object_ids)
+
+
+def classifiers(obj_meta) -> list:
+    """
+    :param obj_meta: NvDsObjectMeta
+    :return: list of NvDsClassifierMeta
+    """
+    return _collect(obj_meta.classifier_meta_list, _cast_classifier)
+
+
+def classifier_labels(obj_meta) -> list:
+    """
+    :param obj_meta: NvDsObjectMeta
+    :return: list of ClassifierLabel of all secondary classifiers of the object
+    """
+    labels = []
+    for classifier_meta in classifiers(obj_meta):
+        for label_info in _collect(classifier_meta.label_info_list, _cast_label):
+            labels.append(ClassifierLabel(classifier_meta.unique_component_id, label_info.result_class_id,
+                                          label_info.result_label, label_info.result_prob))
+    return labels
+
+
+def user_metas(meta, meta_type=None) -> list:
+    """
+    :param meta:      NvDsBatchMeta, NvDsFrameMeta or NvDsObjectMeta
+    :param meta_type: keep only user meta of this NvDsMetaType, all if None
+    :return: list of NvDsUserMeta
+    """
+    for attribute in ('obj_user_meta_list', 'frame_user_meta_list', 'batch_user_meta_list'):
+        if hasattr(meta, attribute):
+            metas = _collect(getattr(meta, attribute), _cast_user)
+            break
+    else:
+        raise TypeError(f'{type(meta).__name__} has no user meta list')
+    if meta_type is None:
+        return metas
+    return [user_meta for user_meta in metas if user_meta.base_meta.meta_type == meta_type]
+
+
+def remove_object(frame_meta, obj_meta) -> None:
+    if _fake:
+        frame_meta.remove_object(obj_meta)
+    else:
+        pyds.nvds_remove_obj_meta_from_frame(frame_meta, obj_meta)
+
+
+def add_object(batch, frame_meta, component_id: int, class_id: int, confidence: float, rect: tuple,
+               label: str = '') -> None:
+    """
+    Adds an untracked object drawn like the nvinfer ones
+    :param batch:        NvDsBatchMeta, the object pool
+    :param frame_meta:   NvDsFrameMeta
+    :param component_id: unique_component_id of the model
+    :param rect:         left, top, width, height in muxer coordinates
+    :return: None
+    """
+    if _fake:
+        frame_meta.add_object(FakeObjectMeta(class_id=class_id, confidence=confidence, rect=rect,
+                                             unique_component_id=component_id, obj_label=label))
+        return
+    obj_meta = pyds.nvds_acquire_obj_meta_from_pool(batch)
+    obj_meta.unique_component_id = component_id
+    obj_meta.class_id = class_id
+    obj_meta.confidence = confidence
+    obj_meta.obj_label = label
+    obj_meta.object_id = UNTRACKED_OBJECT_ID
+    rect_params = obj_meta.rect_params
+    rect_params.left, rect_params.top, rect_params.width, rect_params.height = rect
+    rect_params.border_width = 3
+    rect_params.border_color.set(0.0, 0.0, 1.0, 1.0)
+    text = obj_meta.text_params
+    text.display_text = label
+    text.x_offset, text.y_offset = int(rect[0]), max(0, int(rect[1]) - 10)
+    text.font_params.font_name = 'Serif'
+    text.font_params.font_size = 10
+    text.font_params.font_color.set(1.0, 1.0, 1.0, 1.0)
+    text.set_bg_clr = 1
+    text.text_bg_clr.set(0.0, 0.0, 0.0, 1.0)
+    pyds.nvds_add_obj_meta_to_frame(frame_meta, obj_meta, None)
+
+
+def tensor_outputs(frame_meta, unique_id: int) -> dict:
+    """
+    Output layers of a model run with output-tensor-meta=1, float32 layers only
+    :param frame_meta: NvDsFrameMeta
+    :param unique_id:  gie-unique-id of the model
+    :return: layer name -> array over the host buffer, valid while the buffer is; empty for frames not inferred
+    """
+    if _fake:
+        for tensor_meta in user_metas(frame_meta):
+            if isinstance(tensor_meta, FakeTensorMeta) and tensor_meta.unique_id == unique_id:
+                return dict(tensor_meta.layers)
+        return {}
+    for user_meta in user_metas(frame_meta, pyds.NvDsMetaType.NVDSINFER_TENSOR_OUTPUT_META):
+        tensor_meta = pyds.NvDsInferTensorMeta.cast(user_meta.user_meta_data)
+        if tensor_meta.unique_id != unique_id:
+            continue
+        layers = {}
+        for i in range(tensor_meta.num_output_layers):
+            layer = pyds.get_nvds_LayerInfo(tensor_meta, i)
+            if layer.dataType != pyds.NvDsInferDataType.FLOAT:
+                continue
+            shape = tuple(layer.inferDims.d[:layer.inferDims.numDims])
+            pointer = ctypes.cast(pyds.get_ptr(layer.buffer), ctypes.POINTER(ctypes.c_float))
+            layers[layer.layerName] = np.ctypeslib.as_array(pointer, shape=shape)
+        return layers
+    return {}
+
+
+class FakeNode:
+    __slots__ = ('data', 'next')
+
+    def __init__(self, data, next_node=None):
+        self.data = data
+        self.next = next_node
+
+
+def make_list(items: list):
+    """
+    :param items: list of metadata
+    :return: head FakeNode of a GList-like linked list, None if empty
+    """
+    head = None
+    for item in reversed(items):
+        head = FakeNode(item, head)
+    return head
+
+
+class FakeRect:
+    __slots__ = ('left', 'top', 'width', 'height')
+
+    def __init__(self, left: float = 0.0, top: float = 0.0, width: float = 0.0, height: float = 0.0):
+        self.left, self.top, self.width, self.height = left, top, width, height
+
+
+class FakeObjectMeta:
+
+    def __init__(self, class_id: int = 0, confidence: float = 1.0, rect: tuple = (0, 0, 0, 0),
+                 unique_component_id: int = 1, object_id: int = UNTRACKED_OBJECT_ID, obj_label: str = '',
+                 classifier_metas: list = (), user_metas: list = ()):
+        self.class_id = class_id
+        self.confidence = confidence
+        self.rect_params = FakeRect(*rect)
+        self.unique_component_id = unique_component_id
+        self.object_id = object_id
+        self.obj_label = obj_label
+        self.classifier_meta_list = make_list(list(classifier_metas))
+        self.obj_user_meta_list = make_list(list(user_metas))
+
+
+class FakeTensorMeta:
+
+    def __init__(self, unique_id: int, layers: dict):
+        """
+        NvDsInferTensorMeta stand-in, put it in the user_metas of a FakeFrameMeta
+        :param unique_id: gie-unique-id of the model
+        :param layers:    layer name -> np.ndarray without the batch dimension
+        """
+        self.unique_id = unique_id
+        self.layers = layers
+
+
+class FakeFrameMeta:
+
+    def __init__(self, pad_index: int = 0, frame_num: int = 0, batch_id: int = 0, objects: list = (),
+                 buf_pts: int = 0, ntp_timestamp: int = 0, source_frame_width: int = 1920,
+                 source_frame_height: int = 1080, user_metas: list = ()):
+        self.pad_index = pad_index
+        self.source_id = pad_index
+        self.frame_num = frame_num
+        self.batch_id = batch_id
+        self.buf_pts = buf_pts
+        self.ntp_timestamp = ntp_timestamp
+        self.source_frame_width = source_frame_width
+        self.source_frame_height = source_frame_height
+        self.frame_user_meta_list = make_list(list(user_metas))
+        self._objects = list(objects)
+        self.obj_meta_list = make_list(self._objects)
+
+    @property
+    def num_obj_meta(self) -> int:
+        return len(self._objects)
+
+    def add_object(self, obj_meta) -> None:
+        self._objects.append(obj_meta)
+        self.obj_meta_list = make_list(self._objects)
+
+    def remove_object(self, obj_meta) -> None:
+        self._objects.remove(obj_meta)
+        self.obj_meta_list = make_list(self._objects)
+
+
+class FakeBatchMeta:
+
+    def __init__(self, frame_metas: list, max_frames_in_batch: int = None):
+        self.frame_meta_list = make_list(list(frame_metas))
+        self.num_frames_in_batch = len(frame_metas)
+        self.max_frames_in_batch = max_frames_in_batch or len(frame_metas)
+        self.batch_user_meta_list = None
+
+
+class FakeBuffer:
+
+    def __init__(self, batch: FakeBatchMeta):
+        self.batch_meta = batch
+
+
+def fake_batch(n_sources: int, n_objects: int, frame_num: int = 0, rng: np.random.RandomState = None) -> FakeBuffer:
+    """
+    :param n_sources: frames in the batch
+    :param n_objects: objects per frame
+    :param frame_num: frame number of all frames
+    :param rng:       random boxes, classes and confidences
+    :return: FakeBuffer
+    """
+    rng = rng or np.random.RandomState(0)
+    frame_metas = []
+    for source_id in range(n_sources):
+        boxes = np.concatenate([rng.uniform(0, 1700, (n_objects, 2)), rng.uniform(20, 200, (n_objects, 2))], axis=1)
+        obj_metas = [FakeObjectMeta(class_id=int(rng.randint(0, 3)), confidence=float(rng.uniform(0.2, 1.0)),
+                                    rect=tuple(box.tolist()), object_id=i)
+                     for i, box in enumerate(boxes)]
+        frame_metas.append(FakeFrameMeta(pad_index=source_id, frame_num=frame_num, batch_id=source_id,
+                                         objects=obj_metas))
+    return FakeBuffer(FakeBatchMeta(frame_metas))
@@ -0,0 +1,363 @@
+import os
+import glob
+import json
+import logging
+import threading
+from collections import deque
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+from common import decimation
+from common import nvmeta
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.ts', '.h264', '.h265', '.264', '.265')
+VIDEO_CAPS = ('video/x-h264', 'video/x-h265')
+# Seconds the last frame of a file has to reach the output pad after the decoder EOS, the slot is switched anyway
+DRAIN_TIMEOUT = 10
+
+
+def list_files(inputs: list, extensions: tuple = VIDEO_EXTENSIONS) -> list:
+    """
+    :param inputs:     files, directories or glob patterns
+    :param extensions: video file extensions searched in directories
+    :return: absolute paths, sorted per input, duplicates removed
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = [os.path.join(item, name) for name in os.listdir(item) if name.lower().endswith(extensions)]
+        elif os.path.isfile(item):
+            paths = [item]
+        else:
+            paths = glob.glob(item)
+        if not paths:
+            logging.warning(f'No video files in {item}')
+        files.extend(os.path.abspath(path) for path in sorted(paths))
+    return list(dict.fromkeys(files))
+
+
+class Checkpoint:
+
+    def __init__(self, path: str = None, save_interval: float = 10.0):
+        """
+        Progress of an offline run: finished and failed files, and the last processed position of the files
+        in progress. The file is rewritten atomically, a killed run resumes where the last save left off.
+        :param path:          JSON file, progress is not persisted if None
+        :param save_interval: seconds between saves of the positions, finished files are saved at once
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self.done = []
+        self.failed = []
+        self.positions = {}
+        self._lock = threading.Lock()
+        self._saver = None
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.done = state.get('done', [])
+            self.failed = state.get('failed', [])
+            self.positions = state.get('positions', {})
+
+    def is_finished(self, path: str) -> bool:
+        with self._lock:
+            return path in self.done or path in self.failed
+
+    def position(self, path: str) -> float:
+        """
+        :return: seconds of the file already processed
+        """
+        with self._lock:
+            return self.positions.get(path, 0.0)
+
+    def update(self, path: str, seconds: float) -> None:
+        """
+        Records the position only, called from the streaming thread. The positions are saved by the saver of the
+        main loop.
+        """
+        with self._lock:
+            self.positions[path] = seconds
+
+    def complete(self, path: str, failed: bool = False) -> None:
+        with self._lock:
+            self.positions.pop(path, None)
+            (self.failed if failed else self.done).append(path)
+        self.save()
+
+    def start_saver(self) -> None:
+        """
+        Saves the positions every save_interval seconds from the GLib main loop
+        :return: None
+        """
+        if self.path is not None and self._saver is None:
+            self._saver = GLib.timeout_add_seconds(max(1, round(self.save_interval)), self._on_save_timeout)
+
+    def stop_saver(self) -> None:
+        if self._saver is not None:
+            GLib.source_remove(self._saver)
+            self._saver = None
+
+    def _on_save_timeout(self) -> bool:
+        self.save()
+        return True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            state = {'done': list(self.done), 'failed': list(self.failed), 'positions': dict(self.positions)}
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+class FileSource:
+
+    def __init__(self, name: str, path: str, drop_interval: int = 0, verbose: bool = True):
+        """
+        Decoding bin of a recorded video, added to and removed from a running pipeline as one element:
+                     filesrc         |src|->
+            |sink|-> parsebin        |src|->   demuxer and parser picked from the container
+            |sink|-> nvv4l2decoder   |src|->   ghost src pad
+        :param name:          bin name
+        :param path:          video file
+        :param drop_interval: nvv4l2decoder drop-frame-interval, 0 decodes every frame
+        :param verbose:
+        """
+        self.path = path
+        self.verbose = verbose
+        self.bin = Gst.Bin.new(name)
+        self.filesrc = Gst.ElementFactory.make('filesrc', f'{name}_filesrc')
+        self.filesrc.set_property('location', path)
+        self.parsebin = Gst.ElementFactory.make('parsebin', f'{name}_parsebin')
+        self.decoder = Gst.ElementFactory.make('nvv4l2decoder', f'{name}_decoder')
+        if drop_interval:
+            decimation.configure_decoder(self.decoder, drop_interval, verbose)
+        for element in (self.filesrc, self.parsebin, self.decoder):
+            self.bin.add(element)
+        self.filesrc.link(self.parsebin)
+        self.parsebin.connect('pad-added', self._on_pad_added)
+        self.src_pad = Gst.GhostPad.new('src', self.decoder.get_static_pad('src'))
+        self.bin.add_pad(self.src_pad)
+        # PTS of the last decoded frame and of the last frame at the output pad of the pool
+        self.last_pts = None
+        self.output_pts = None
+        self.ended = False
+        self.finishing = False
+
+    def _on_pad_added(self, parsebin, pad) -> None:
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        caps_string = caps.to_string()
+        sink_pad = self.decoder.get_static_pad('sink')
+        # Audio and second video streams are left unlinked
+        if caps_string.startswith(VIDEO_CAPS) and not sink_pad.is_linked():
+            if self.verbose:
+                logging.info(f'{self.bin.get_name()}: {caps_string.split(",")[0]} from {self.path}')
+            pad.link(sink_pad)
+
+
+class FileSourcePool:
+
+    def __init__(self, pipeline, streammux, files: list, n_slots: int = 4, checkpoint: Checkpoint = None,
+                 drop_intervals: list = None, on_file_done=None, verbose: bool = True):
+        """
+        Offline processing of recorded videos faster than real time: n_slots files are muxer inputs at once,
+        a slot takes the next file when the last frame of its file passed the output pad, the muxer pad index
+        of a slot is its source id. Every file gets a new muxer pad, so per-stream state downstream (nvtracker
+        tracks and ids) does not carry over. Positions and finished files seen at the output pad go to the
+        checkpoint, files done before are skipped and the frames processed before a restart are dropped
+        after decoding.
+        :param pipeline:       Gst.Pipeline
+        :param streammux:      nvstreammux with live-source 0
+        :param files:          video files in processing order
+        :param n_slots:        files decoded in parallel, the muxer batch size
+        :param checkpoint:     Checkpoint, progress is not persisted if None
+        :param drop_intervals: nvv4l2decoder drop-frame-interval per slot, every frame is decoded if None
+        :param on_file_done:   callable(slot, path) after a file ends, for per-source state resets
+        :param verbose:
+        """
+        self.pipeline = pipeline
+        self.streammux = streammux
+        self.checkpoint = checkpoint or Checkpoint()
+        self.n_slots = n_slots
+        self.drop_intervals = drop_intervals or [0] * n_slots
+        self.on_file_done = on_file_done
+        self.verbose = verbose
+        self.pending = deque(path for path in files if not self.checkpoint.is_finished(path))
+        self.n_files = len(self.pending)
+        self.sources = {}
+        self.sink_pads = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.loop = None
+
+    def start(self) -> None:
+        """
+        Fills the slots, call before the pipeline goes to PLAYING
+        :return: None
+        """
+        if self.verbose:
+            logging.info(f'{self.n_files} files to process, {len(self.checkpoint.done)} done before')
+        for slot in range(min(self.n_slots, len(self.pending))):
+            self._start_next(slot)
+
+    def attach(self, pad) -> None:
+        """
+        :param pad: batch pad after the last model and probe, frames are processed when they pass it
+        :return: None
+        """
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._output_probe, 0)
+
+    def current(self, slot: int):
+        """
+        :return: path of the file of a slot, None if the slot is idle
+        """
+        source = self.sources.get(slot)
+        return source.path if source is not None else None
+
+    def _start_next(self, slot: int) -> None:
+        path = self.pending.popleft()
+        self._counter += 1
+        source = FileSource(f'file_source_{slot}_{self._counter}', path, self.drop_intervals[slot], self.verbose)
+        self.pipeline.add(source.bin)
+        sink_pad = self.streammux.get_request_pad(f'sink_{slot}')
+        self.sink_pads[slot] = sink_pad
+        source.src_pad.link(sink_pad)
+        source.src_pad.add_probe(Gst.PadProbeType.BUFFER, self._resume_probe(source), 0)
+        source.src_pad.add_probe(Gst.PadProbeType.EVENT_DOWNSTREAM, self._eos_probe(slot, source), 0)
+        self.sources[slot] = source
+        if self.verbose:
+            logging.info(f'Slot {slot}: {path}, {len(self.pending)} files left')
+        source.bin.sync_state_with_parent()
+
+    def _resume_probe(self, source: FileSource):
+        resume = self.checkpoint.position(source.path)
+
+        def _buffer_probe(pad, info, u_data):
+            gst_buffer = info.get_buffer()
+            if not gst_buffer or gst_buffer.pts == Gst.CLOCK_TIME_NONE:
+                return Gst.PadProbeReturn.OK
+            if gst_buffer.pts / Gst.SECOND < resume:
+                # Processed before the restart
+                return Gst.PadProbeReturn.DROP
+            with self._lock:
+                source.last_pts = gst_buffer.pts
+            return Gst.PadProbeReturn.OK
+
+        return _buffer_probe
+
+    def _eos_probe(self, slot: int, source: FileSource):
+        def _event_probe(pad, info, u_data):
+            if info.get_event().type != Gst.EventType.EOS:
+                return Gst.PadProbeReturn.OK
+            with self._lock:
+                source.ended = True
+                drained = source.last_pts is None or \
+                    (source.output_pts is not None and source.output_pts >= source.last_pts)
+            if drained:
+                self._request_finish(slot, source, False)
+            else:
+                # Frames dropped downstream never reach the output pad
+                GLib.timeout_add_seconds(DRAIN_TIMEOUT, self._request_finish, slot, source, False)
+            # The slot is switched to the next file in the main loop, which decides on the EOS of the muxer pad
+            return Gst.PadProbeReturn.DROP
+
+        return _event_probe
+
+    def _output_probe(self, pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta in nvmeta.frames(nvmeta.batch_meta(gst_buffer)):
+            slot = frame_meta.pad_index
+            source = self.sources.get(slot)
+            if source is None:
+                continue
+            self.checkpoint.update(source.path, frame_meta.buf_pts / Gst.SECOND)
+            with self._lock:
+                source.output_pts = frame_meta.buf_pts
+                drained = source.ended and source.last_pts is not None and source.output_pts >= source.last_pts
+            if drained:
+                self._request_finish(slot, source, False)
+        return Gst.PadProbeReturn.OK
+
+    def _request_finish(self, slot: int, source: FileSource, failed: bool) -> bool:
+        """
+        Switches the slot once per file in the main loop, whichever of the output pad, the drain timeout or
+        an error comes first
+        """
+        with self._lock:
+            if source.finishing:
+                return False
+            source.finishing = True
+        GLib.idle_add(self._finish, slot, failed)
+        return False
+
+    def _finish(self, slot: int, failed: bool) -> bool:
+        source = self.sources.pop(slot, None)
+        if source is None:
+            return False
+        self.checkpoint.complete(source.path, failed=failed)
+        if self.on_file_done is not None:
+            self.on_file_done(slot, source.path)
+        sink_pad = self.sink_pads[slot]
+        source.bin.set_state(Gst.State.NULL)
+        source.src_pad.unlink(sink_pad)
+        sink_pad.send_event(Gst.Event.new_flush_stop(False))
+        self.pipeline.remove(source.bin)
+        if self.pending:
+            # The muxer signals the removed stream downstream, nvtracker drops its tracks before the next file
+            self.streammux.release_request_pad(sink_pad)
+            self._start_next(slot)
+        else:
+            # The muxer ends the batch stream after the EOS of every pad
+            sink_pad.send_event(Gst.Event.new_eos())
+        return False
+
+    def watch_bus(self, loop) -> None:
+        """
+        Ends the loop on the EOS of the muxer, an error of a file skips the file instead of stopping the run.
+        Starts the periodic save of the checkpoint.
+        :param loop: GLib main loop
+        :return: None
+        """
+        self.loop = loop
+        self.checkpoint.start_saver()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message', self._on_message)
+
+    def _on_message(self, bus, message) -> bool:
+        if message.type == Gst.MessageType.EOS:
+            if self.verbose:
+                logging.info(f'All {self.n_files} files processed')
+            self._quit()
+        elif message.type == Gst.MessageType.ERROR:
+            err, debug = message.parse_error()
+            slot = self._slot_of(message.src)
+            if slot is None:
+                logging.error(f'{err.message}: {debug}')
+                self._quit()
+            else:
+                logging.error(f'Skipping {self.sources[slot].path}: {err.message}')
+                self._request_finish(slot, self.sources[slot], True)
+        return True
+
+    def _slot_of(self, element):
+        while element is not None:
+            for slot, source in self.sources.items():
+                if element == source.bin:
+                    return slot
+            element = element.get_parent()
+        return None
+
+    def _quit(self) -> None:
+        self.checkpoint.stop_saver()
+        self.checkpoint.save()
+        if self.loop is not None and self.loop.is_running():
+            self.loop.quit()
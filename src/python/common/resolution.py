@@ -0,0 +1,99 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gst, GstPbutils
+
+# Even sizes are required for NV12 surfaces, multiples of 8 keep 1080 and the usual network sizes as they are
+ALIGN = 8
+
+
+def parse_size(size: str) -> tuple:
+    """
+    :param size: 'WxH'
+    :return: (width, height)
+    """
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def _align(value: float, align: int = ALIGN) -> int:
+    return max(align, int(round(value / align)) * align)
+
+
+def discover_source_size(uri: str, timeout: float = 5.0):
+    """
+    Native video size of a source from its negotiated caps
+    :param uri:     rtsp:// or file:// URI
+    :param timeout: seconds
+    :return: (width, height) or None if the source did not answer
+    """
+    try:
+        discoverer = GstPbutils.Discoverer.new(int(timeout * Gst.SECOND))
+        info = discoverer.discover_uri(uri)
+    except Exception as e:
+        logging.warning(f'Could not discover {uri}: {e}')
+        return None
+    for stream in info.get_video_streams():
+        if stream.get_width() and stream.get_height():
+            return stream.get_width(), stream.get_height()
+    return None
+
+
+def discover_source_sizes(uris: list, timeout: float = 5.0, workers: int = 8) -> dict:
+    """
+    :param uris:    source URIs
+    :param timeout: seconds per source
+    :param workers: sources discovered in parallel
+    :return: uri -> (width, height), unreachable sources are left out
+    """
+    if not Gst.is_initialized():
+        Gst.init(None)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(uris)))) as pool:
+        sizes = dict(zip(uris, pool.map(lambda uri: discover_source_size(uri, timeout), uris)))
+    return {uri: size for uri, size in sizes.items() if size is not None}
+
+
+def muxer_resolution(model_sizes: list, source_sizes: list = (), align: int = ALIGN,
+                     default: tuple = (1920, 1080)) -> tuple:
+    """
+    Muxer output size the models consume without a second scaling pass: the largest model input, scaled down
+    when every source is smaller, so that sources are never upscaled before inference.
+    :param model_sizes:  (width, height) of the full-frame models, None for unknown input sizes
+    :param source_sizes: native (width, height) of the sources, may be empty
+    :param align:        width and height multiple
+    :param default:      model size if no input size is known
+    :return: (width, height)
+    """
+    model_sizes = [size for size in model_sizes if size is not None] or [default]
+    width = max(size[0] for size in model_sizes)
+    height = max(size[1] for size in model_sizes)
+    if source_sizes:
+        source_width = max(size[0] for size in source_sizes)
+        source_height = max(size[1] for size in source_sizes)
+        scale = min(1.0, source_width / width, source_height / height)
+        width, height = width * scale, height * scale
+    return _align(width, align), _align(height, align)
+
+
+def source_scale(source_width: int, source_height: int, mux_width: int, mux_height: int,
+                 padding: bool = False) -> tuple:
+    """
+    Scale from muxer to source coordinates. With enable-padding nvstreammux keeps the aspect ratio and
+    pads the right or bottom of the frame, so both axes share one scale and there is no offset.
+    :param source_width:  frame_meta.source_frame_width, 0 if unknown
+    :param source_height: frame_meta.source_frame_height, 0 if unknown
+    :param mux_width:     nvstreammux width
+    :param mux_height:    nvstreammux height
+    :param padding:       nvstreammux enable-padding
+    :return: (x, y) scale
+    """
+    if not source_width or not source_height:
+        return 1.0, 1.0
+    if padding:
+        scale = max(source_width / mux_width, source_height / mux_height)
+        return scale, scale
+    return source_width / mux_width, source_height / mux_height
@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import struct
+import logging
+import threading
+from collections import namedtuple
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstRtsp', '1.0')
+from gi.repository import Gst, GstRtsp
+
+MAGIC = b'RTPREC1\n'
+RECORD_HEADER = struct.Struct('<qI')
+RTP_HEADER = struct.Struct('!HHI')
+# Caps fields the replay server needs for the SDP, the session fields of the capture are left out
+CAPS_FIELDS = ('media', 'clock-rate', 'encoding-name', 'payload', 'packetization-mode', 'profile-level-id',
+               'sprop-parameter-sets', 'sprop-vps', 'sprop-sps', 'sprop-pps')
+
+Recording = namedtuple('Recording', ['caps', 'arrivals', 'packets'])
+Disconnect = namedtuple('Disconnect', ['mount', 'at', 'duration'])
+
+
+def _monotonic_ns() -> int:
+    return int(time.monotonic() * 1e9)
+
+
+class RecordingWriter:
+
+    def __init__(self, path: str, caps: str):
+        """
+        RTP packets with their arrival time: a magic line, the caps line, then per packet the arrival
+        in nanoseconds since the first packet and the packet length, followed by the packet.
+        :param path: output file
+        :param caps: application/x-rtp caps of the stream
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(caps.encode() + b'\n')
+        self.first = None
+        self.n_packets = 0
+        self.n_bytes = 0
+
+    def write(self, packet: bytes, arrival_ns: int) -> None:
+        if self.first is None:
+            self.first = arrival_ns
+        self.file.write(RECORD_HEADER.pack(arrival_ns - self.first, len(packet)))
+        self.file.write(packet)
+        self.n_packets += 1
+        self.n_bytes += len(packet)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_recording(path: str) -> Recording:
+    """
+    :param path: RecordingWriter file
+    :return: Recording, arrivals in nanoseconds from the first packet
+    """
+    with open(path, 'rb') as f:
+        if f.readline() != MAGIC:
+            raise ValueError(f'{path} is not an RTP recording')
+        caps = f.readline().decode().strip()
+        data = f.read()
+    arrivals, packets = [], []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        arrival, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        arrivals.append(arrival)
+        packets.append(data[offset:offset + length])
+        offset += length
+    return Recording(caps, arrivals, packets)
+
+
+def replay_caps(caps: str) -> str:
+    """
+    :param caps: captured caps
+    :return: caps with the stream description fields only
+    """
+    structure = Gst.Caps.from_string(caps).get_structure(0)
+    fields = [f'{name}={structure.get_value(name)}' if isinstance(structure.get_value(name), int)
+              else f'{name}=(string)"{structure.get_value(name)}"'
+              for name in CAPS_FIELDS if structure.has_field(name)]
+    return ', '.join(['application/x-rtp'] + fields)
+
+
+def capture(uri: str, path: str, seconds: float, verbose: bool = True) -> RecordingWriter:
+    """
+    Records the video RTP packets of an RTSP session, over TCP and before depayloading
+    :param uri:     rtsp:// address
+    :param path:    output file
+    :param seconds: capture duration
+    :param verbose:
+    :return: closed RecordingWriter
+    """
+    pipeline = Gst.Pipeline.new('rtp_capture')
+    rtspsrc = Gst.ElementFactory.make('rtspsrc', 'rtspsrc')
+    rtspsrc.set_property('location', uri)
+    rtspsrc.set_property('protocols', GstRtsp.RTSPLowerTrans.TCP)
+    # No jitterbuffer delay, packets are timed as they arrive
+    rtspsrc.set_property('latency', 0)
+    appsink = Gst.ElementFactory.make('appsink', 'rtp_sink')
+    appsink.set_property('sync', False)
+    appsink.set_property('emit-signals', True)
+    pipeline.add(rtspsrc)
+    pipeline.add(appsink)
+    writers = []
+
+    def _on_pad_added(element, pad):
+        caps = pad.get_current_caps() or pad.query_caps(None)
+        if writers or caps.get_structure(0).get_value('media') != 'video':
+            return
+        writers.append(RecordingWriter(path, caps.to_string()))
+        pad.link(appsink.get_static_pad('sink'))
+
+    def _on_new_sample(sink):
+        gst_buffer = sink.emit('pull-sample').get_buffer()
+        writers[0].write(gst_buffer.extract_dup(0, gst_buffer.get_size()), _monotonic_ns())
+        return Gst.FlowReturn.OK
+
+    rtspsrc.connect('pad-added', _on_pad_added)
+    appsink.connect('new-sample', _on_new_sample)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(int(seconds * Gst.SECOND),
+                                                     Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message is not None and message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        logging.error(f'{uri}: {err.message}')
+    if not writers:
+        raise RuntimeError(f'No video stream captured from {uri}')
+    writer = writers[0]
+    writer.close()
+    if verbose:
+        logging.info(f'{uri} -> {path}: {writer.n_packets} packets, {writer.n_bytes / 1e6:.1f} MB')
+    return writer
+
+
+class Impairments:
+
+    def __init__(self, jitter_ms: float = 0.0, loss: float = 0.0, seed: int = 0):
+        """
+        Network effects applied to the replayed packets, the same seed gives the same effects on every run
+        :param jitter_ms: standard deviation of the extra packet delay, milliseconds. Packets stay in order.
+        :param loss:      packet loss probability
+        :param seed:      random seed
+        """
+        self.jitter_ms = jitter_ms
+        self.loss = loss
+        self.seed = seed
+
+    def schedule(self, arrivals: list, rng: random.Random) -> list:
+        """
+        :param arrivals: recorded arrivals, nanoseconds
+        :param rng:      random.Random of the stream
+        :return: send offsets in nanoseconds, None for lost packets
+        """
+        offsets = []
+        last = 0
+        for arrival in arrivals:
+            if self.loss and rng.random() < self.loss:
+                offsets.append(None)
+                continue
+            delay = int(abs(rng.gauss(0.0, self.jitter_ms)) * 1e6) if self.jitter_ms else 0
+            last = max(last, arrival + delay)
+            offsets.append(last)
+        return offsets
+
+
+class RtpLooper:
+
+    def __init__(self, recording: Recording):
+        """
+        Continues sequence numbers and RTP timestamps when a recording starts over, so clients see one stream
+        :param recording: Recording
+        """
+        headers = [RTP_HEADER.unpack_from(packet, 0) for packet in recording.packets if len(packet) >= 8]
+        self.seq_step = 0
+        self.ts_step = 0
+        if headers:
+            self.seq_step = (headers[-1][1] - headers[0][1] + 1) % 65536
+            span = (headers[-1][2] - headers[0][2]) % 2 ** 32
+            # Packets of a frame share a timestamp, the next iteration starts one frame after the last one
+            n_frames = len(set(header[2] for header in headers))
+            self.ts_step = span + span // max(1, n_frames - 1)
+
+    def rewrite(self, packet: bytes, iteration: int) -> bytes:
+        if not iteration or len(packet) < 8:
+            return packet
+        flags, seq, ts = RTP_HEADER.unpack_from(packet, 0)
+        header = RTP_HEADER.pack(flags, (seq + iteration * self.seq_step) % 65536,
+                                 (ts + iteration * self.ts_step) % 2 ** 32)
+        return header + packet[8:]
+
+
+class StreamFeeder:
+
+    def __init__(self, appsrc, recording: Recording, impairments: Impairments, seed: int, loop: bool = True):
+        """
+        Pushes the packets of a recording into the appsrc of a replay media at their recorded times
+        :param appsrc:      appsrc named pay0 of the media
+        :param recording:   Recording
+        :param impairments: Impairments
+        :param seed:        random seed of the stream
+        :param loop:        start over at the end, the media gets EOS otherwise
+        """
+        self.appsrc = appsrc
+        self.recording = recording
+        self.impairments = impairments
+        self.rng = random.Random(seed)
+        self.loop = loop
+        self.looper = RtpLooper(recording)
+        self.sent = 0
+        self.lost = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        arrivals = self.recording.arrivals
+        if not arrivals:
+            return
+        # One packet interval between the last packet of an iteration and the first of the next
+        period = arrivals[-1] + arrivals[-1] // max(1, len(arrivals) - 1)
+        start = _monotonic_ns()
+        iteration = 0
+        while not self._stop.is_set():
+            offsets = self.impairments.schedule(arrivals, self.rng)
+            for packet, offset in zip(self.recording.packets, offsets):
+                if offset is None:
+                    self.lost += 1
+                    continue
+                wait = start + iteration * period + offset - _monotonic_ns()
+                if wait > 0 and self._stop.wait(wait / 1e9):
+                    return
+                packet = self.looper.rewrite(packet, iteration)
+                if self.appsrc.emit('push-buffer', Gst.Buffer.new_wrapped(packet)) != Gst.FlowReturn.OK:
+                    return
+                self.sent += 1
+            if not self.loop:
+                self.appsrc.emit('end-of-stream')
+                return
+            iteration += 1
+
+
+def parse_disconnect(value: str) -> Disconnect:
+    """
+    :param value: 'mount:at:duration', seconds
+    :return: Disconnect
+    """
+    mount, at, duration = value.rsplit(':', 2)
+    return Disconnect(mount, float(at), float(duration))
+
+
+def mount_name(path: str) -> str:
+    """
+    :return: mount of a recording file, its name without the extension
+    """
+    return os.path.splitext(os.path.basename(path))[0]
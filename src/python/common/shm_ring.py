@@ -0,0 +1,274 @@
+import os
+import mmap
+import time
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+SHM_DIR = os.path.join('/', 'dev', 'shm')
+MAGIC = 0x47534852  # 'GSHR'
+VERSION = 2
+ALIGNMENT = 64
+
+HEADER_DTYPE = np.dtype([('magic', '<u4'),
+                         ('version', '<u4'),
+                         ('n_slots', '<u4'),
+                         ('width', '<u4'),
+                         ('height', '<u4'),
+                         ('channels', '<u4'),
+                         ('max_objects', '<u4'),
+                         ('reserved', '<u4'),
+                         ('slot_size', '<u8'),
+                         ('write_count', '<u8'),
+                         ])
+
+SLOT_META_DTYPE = np.dtype([('seq', '<u8'),
+                            ('frame_num', '<i8'),
+                            ('pts', '<u8'),
+                            ('timestamp', '<f8'),
+                            ('source_id', '<u4'),
+                            ('width', '<u4'),
+                            ('height', '<u4'),
+                            ('n_objects', '<u4'),
+                            ])
+
+# component_id is the gie-unique-id of the model, class ids of different models overlap. Aligned: object_id
+# stays on an 8-byte boundary.
+OBJECT_DTYPE = np.dtype([('left', '<f4'),
+                         ('top', '<f4'),
+                         ('width', '<f4'),
+                         ('height', '<f4'),
+                         ('confidence', '<f4'),
+                         ('class_id', '<i4'),
+                         ('component_id', '<i4'),
+                         ('object_id', '<u8'),
+                         ], align=True)
+
+SharedFrame = namedtuple('SharedFrame', ['slot', 'seq', 'frame_num', 'pts', 'timestamp', 'source_id',
+                                         'objects', 'image'])
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def ring_path(source_id: int, prefix: str = 'inference_gst') -> str:
+    return os.path.join(SHM_DIR, f'{prefix}_{source_id}')
+
+
+class _ShmRing:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mm = None
+        self.header = None
+        self.metas = []
+        self.objects = []
+        self.pixels = []
+
+    def _map_slots(self) -> None:
+        header = self.header
+        slot_size = int(header['slot_size'])
+        meta_size = _align(SLOT_META_DTYPE.itemsize)
+        objects_size = _align(OBJECT_DTYPE.itemsize * int(header['max_objects']))
+        pixels_size = int(header['width']) * int(header['height']) * int(header['channels'])
+        for i in range(int(header['n_slots'])):
+            offset = _align(HEADER_DTYPE.itemsize) + i * slot_size
+            self.metas.append(np.ndarray((), dtype=SLOT_META_DTYPE, buffer=self.mm, offset=offset))
+            self.objects.append(np.ndarray((int(header['max_objects']),), dtype=OBJECT_DTYPE, buffer=self.mm,
+                                           offset=offset + meta_size))
+            self.pixels.append(np.ndarray((pixels_size,), dtype=np.uint8, buffer=self.mm,
+                                          offset=offset + meta_size + objects_size))
+
+    def close(self) -> None:
+        # Views have to go before the mapping can be closed
+        self.header = None
+        self.metas, self.objects, self.pixels = [], [], []
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                # Frames still referenced by the caller keep the mapping alive until they are collected
+                pass
+            self.mm = None
+
+
+class ShmFrameWriter(_ShmRing):
+
+    def __init__(self, source_id: int, width: int, height: int, channels: int = 4, n_slots: int = 8,
+                 max_objects: int = 64, prefix: str = 'inference_gst', verbose: bool = True):
+        """
+        Single-producer ring of frames (or object crops) with their metadata in POSIX shared memory.
+        Every slot is guarded by a sequence counter which is odd while the slot is being written, so readers
+        can map the frames zero-copy and detect a slot overwritten under them.
+        :param source_id:   source index, one ring per source
+        :param width:       max image width in the ring
+        :param height:      max image height in the ring
+        :param channels:    image channels, 4 for RGBA surfaces
+        :param n_slots:     ring size, readers lagging more than n_slots frames behind lose frames
+        :param max_objects: max objects metadata per slot
+        :param prefix:      shared memory file prefix
+        :param verbose:
+        """
+        super(ShmFrameWriter, self).__init__(ring_path(source_id, prefix))
+        self.source_id = source_id
+        self.verbose = verbose
+
+        meta_size = _align(SLOT_META_DTYPE.itemsize)
+        objects_size = _align(OBJECT_DTYPE.itemsize * max_objects)
+        pixels_size = _align(width * height * channels)
+        slot_size = meta_size + objects_size + pixels_size
+        size = _align(HEADER_DTYPE.itemsize) + n_slots * slot_size
+
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.mm, offset=0)
+        self.header['magic'] = 0
+        self.header['version'] = VERSION
+        self.header['n_slots'] = n_slots
+        self.header['width'] = width
+        self.header['height'] = height
+        self.header['channels'] = channels
+        self.header['max_objects'] = max_objects
+        self.header['slot_size'] = slot_size
+        self.header['write_count'] = 0
+        self._map_slots()
+        for meta in self.metas:
+            meta['seq'] = 0
+        # Readers only attach to a fully initialized ring
+        self.header['magic'] = MAGIC
+        self.write_count = 0
+
+        if self.verbose:
+            logging.info(f'Shared memory ring {self.path}: {n_slots} slots of {slot_size} bytes')
+
+    def write(self, image: np.ndarray, frame_num: int, pts: int = 0, objects: np.ndarray = None,
+              timestamp: float = None) -> int:
+        """
+        Publish an image with metadata in the next slot
+        :param image:     HxWxC uint8 array, at most the ring width and height
+        :param frame_num: frame number
+        :param pts:       buffer timestamp, ns
+        :param objects:   OBJECT_DTYPE array
+        :param timestamp: wall clock time of the frame, time.time() by default
+        :return: slot index
+        """
+        height, width = image.shape[:2]
+        slot = self.write_count % len(self.metas)
+        meta = self.metas[slot]
+        seq = int(meta['seq'])
+
+        meta['seq'] = seq + 1
+        pixels = self.pixels[slot][:image.size].reshape(image.shape)
+        np.copyto(pixels, image)
+        n_objects = 0
+        if objects is not None:
+            n_objects = min(len(objects), len(self.objects[slot]))
+            self.objects[slot][:n_objects] = objects[:n_objects]
+        meta['frame_num'] = frame_num
+        meta['pts'] = pts
+        meta['timestamp'] = time.time() if timestamp is None else timestamp
+        meta['source_id'] = self.source_id
+        meta['width'] = width
+        meta['height'] = height
+        meta['n_objects'] = n_objects
+        meta['seq'] = seq + 2
+
+        self.write_count += 1
+        self.header['write_count'] = self.write_count
+        return slot
+
+    def close(self, unlink: bool = True) -> None:
+        super(ShmFrameWriter, self).close()
+        if unlink and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class ShmFrameReader(_ShmRing):
+
+    def __init__(self, source_id: int, prefix: str = 'inference_gst'):
+        """
+        Zero-copy reader of a ShmFrameWriter ring. Returned images are views into shared memory:
+        check is_valid() after using them, the writer may have reused the slot in the meantime.
+        :param source_id: source index
+        :param prefix:    shared memory file prefix
+        """
+        super(ShmFrameReader, self).__init__(ring_path(source_id, prefix))
+        self.source_id = source_id
+
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.mm = mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.mm, offset=0)
+        if int(self.header['magic']) != MAGIC or int(self.header['version']) != VERSION:
+            self.close()
+            raise ValueError(f'{self.path} is not an initialized shared memory ring')
+        self._map_slots()
+        self.channels = int(self.header['channels'])
+        self.read_count = 0
+
+    @property
+    def write_count(self) -> int:
+        return int(self.header['write_count'])
+
+    def _frame(self, slot: int):
+        meta = self.metas[slot]
+        seq = int(meta['seq'])
+        if seq % 2:
+            return None
+        height, width = int(meta['height']), int(meta['width'])
+        image = self.pixels[slot][:height * width * self.channels].reshape(height, width, self.channels)
+        frame = SharedFrame(slot=slot,
+                            seq=seq,
+                            frame_num=int(meta['frame_num']),
+                            pts=int(meta['pts']),
+                            timestamp=float(meta['timestamp']),
+                            source_id=int(meta['source_id']),
+                            objects=self.objects[slot][:int(meta['n_objects'])],
+                            image=image,
+                            )
+        return frame if self.is_valid(frame) else None
+
+    def is_valid(self, frame: SharedFrame) -> bool:
+        return int(self.metas[frame.slot]['seq']) == frame.seq
+
+    def latest(self):
+        """
+        :return: the most recent complete SharedFrame or None
+        """
+        write_count = self.write_count
+        if not write_count:
+            return None
+        self.read_count = write_count
+        return self._frame((write_count - 1) % len(self.metas))
+
+    def poll(self, timeout: float = 1.0, interval: float = 0.0005):
+        """
+        Wait for the next frame after the last one read. Frames overwritten before
+        the reader got to them are skipped.
+        :param timeout:  seconds
+        :param interval: polling interval, seconds
+        :return: SharedFrame or None on timeout
+        """
+        deadline = time.time() + timeout
+        n_slots = len(self.metas)
+        while True:
+            write_count = self.write_count
+            if write_count > self.read_count:
+                self.read_count = max(self.read_count, write_count - n_slots + 1)
+                frame = self._frame(self.read_count % n_slots)
+                self.read_count += 1
+                if frame is not None:
+                    return frame
+                continue
+            if time.time() > deadline:
+                return None
+            time.sleep(interval)
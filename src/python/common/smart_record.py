@@ -0,0 +1,262 @@
+import os
+import time
+import logging
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+EncodedFrame = namedtuple('EncodedFrame', ['data', 'pts', 'dts', 'duration', 'is_keyframe'])
+
+
+class GOPRingBuffer:
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, max_seconds: float = 10.0):
+        """
+        Ring of complete GOPs of an encoded stream. Eviction drops whole GOPs from the head,
+        so the ring always starts on a keyframe and can be muxed without decoding.
+        :param max_bytes:   memory bound for the stored frames
+        :param max_seconds: duration bound for the stored frames
+        """
+        self.max_bytes = max_bytes
+        self.max_duration = int(max_seconds * Gst.SECOND)
+        self.gops = deque()
+        self.n_bytes = 0
+        self.n_dropped = 0
+
+    def push(self, frame: EncodedFrame) -> None:
+        if frame.is_keyframe or not self.gops:
+            if not frame.is_keyframe:
+                # Nothing decodable before the first keyframe
+                self.n_dropped += 1
+                return
+            self.gops.append([])
+        self.gops[-1].append(frame)
+        self.n_bytes += len(frame.data)
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self.gops) > 1 and (self.n_bytes > self.max_bytes or self.duration > self.max_duration):
+            gop = self.gops.popleft()
+            self.n_bytes -= sum(len(f.data) for f in gop)
+        if self.n_bytes > self.max_bytes:
+            # A single GOP larger than the bound is dropped completely, it is never partially kept
+            self.gops.clear()
+            self.n_bytes = 0
+
+    @property
+    def duration(self) -> int:
+        if not self.gops:
+            return 0
+        return self.gops[-1][-1].pts - self.gops[0][0].pts
+
+    def snapshot(self, max_seconds: float = None) -> list:
+        """
+        Frames of the newest GOPs covering max_seconds, starting on a keyframe
+        :param max_seconds: pre-roll duration, the whole ring if None
+        :return: list of EncodedFrame
+        """
+        if not self.gops:
+            return []
+        gops = list(self.gops)
+        if max_seconds is not None:
+            last_pts = gops[-1][-1].pts
+            start = len(gops) - 1
+            while start > 0 and last_pts - gops[start][0].pts < max_seconds * Gst.SECOND:
+                start -= 1
+            gops = gops[start:]
+        return [frame for gop in gops for frame in gop]
+
+
+class SmartRecorder:
+
+    # Recorders of all sources share the muxing threads
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='smart_record')
+    # Clips being recorded or waiting for the muxing threads, over all sources. Together with the per-source bound
+    # this bounds the executor queue and the memory of the clips.
+    max_clips = 8
+    _n_clips = 0
+    _clips_lock = threading.Lock()
+
+    def __init__(self, source_id: int, output_dir: str, pre_roll: float = 5.0, post_roll: float = 5.0,
+                 max_clip: float = 60.0, max_bytes: int = 8 * 1024 * 1024, max_source_clips: int = 2,
+                 verbose: bool = True):
+        """
+        Event-triggered clip recorder for an encoded elementary stream. Frames come from an appsink on a tee
+        after the parser of RTSPBin, nothing is decoded or re-encoded. trigger() is cheap and can be called
+        from a pad probe: the clip is muxed to MP4 on a background thread once the post-roll is collected.
+        Triggers past the clip bounds extend the current clip or are dropped.
+        :param source_id:        source index
+        :param output_dir:       clips directory
+        :param pre_roll:         seconds before the trigger
+        :param post_roll:        seconds after the last trigger
+        :param max_clip:         clip duration bound, a clip is closed even if triggers keep coming
+        :param max_bytes:        per-source memory bound of the ring and of every clip in flight
+        :param max_source_clips: clips of the source being recorded or waiting to be muxed
+        :param verbose:
+        """
+        self.source_id = source_id
+        self.output_dir = output_dir
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_clip = max_clip
+        self.max_bytes = max_bytes
+        self.max_source_clips = max_source_clips
+        self.verbose = verbose
+
+        # Twice the pre-roll so the pre-roll is covered when it does not start on a GOP boundary
+        self.ring = GOPRingBuffer(max_bytes=max_bytes, max_seconds=2 * pre_roll)
+        self.caps = None
+        self._lock = threading.Lock()
+        self._clip = None
+        self._clip_end_pts = None
+        self._last_pts = None
+        self._pending_trigger = None
+        self._n_source_clips = 0
+        self.n_clips = 0
+        self.n_dropped_triggers = 0
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def attach(self, appsink) -> None:
+        appsink.set_property('emit-signals', True)
+        appsink.set_property('sync', False)
+        appsink.connect('new-sample', self.on_new_sample)
+
+    def on_new_sample(self, appsink):
+        sample = appsink.emit('pull-sample')
+        if sample is None:
+            return Gst.FlowReturn.OK
+        if self.caps is None:
+            self.caps = sample.get_caps()
+        buffer = sample.get_buffer()
+        frame = EncodedFrame(data=buffer.extract_dup(0, buffer.get_size()),
+                             pts=buffer.pts,
+                             dts=buffer.dts,
+                             duration=buffer.duration,
+                             is_keyframe=not buffer.has_flags(Gst.BufferFlags.DELTA_UNIT),
+                             )
+        self.push(frame)
+        return Gst.FlowReturn.OK
+
+    def push(self, frame: EncodedFrame) -> None:
+        with self._lock:
+            self.ring.push(frame)
+            self._last_pts = frame.pts
+            if self._pending_trigger is not None:
+                # The pre-roll snapshot already ends with this frame
+                self._start_clip(self._pending_trigger)
+            elif self._clip is not None:
+                self._clip['frames'].append(frame)
+                self._clip['n_bytes'] += len(frame.data)
+
+            if self._clip is not None:
+                clip_start_pts = self._clip['frames'][0].pts
+                if frame.pts >= self._clip_end_pts or frame.pts - clip_start_pts >= self.max_clip * Gst.SECOND \
+                        or self._clip['n_bytes'] >= self.max_bytes:
+                    clip, self._clip = self._clip, None
+                    self.executor.submit(self._write_clip, clip)
+
+    def trigger(self, reason: str = '') -> None:
+        """
+        Start a clip or extend the post-roll of the current one
+        :param reason: recorded in the clip file name
+        :return: None
+        """
+        with self._lock:
+            if self._last_pts is None:
+                return
+            if self._clip is not None:
+                self._clip_end_pts = self._last_pts + int(self.post_roll * Gst.SECOND)
+            elif self._pending_trigger is None:
+                if not self._acquire_clip():
+                    self.n_dropped_triggers += 1
+                    return
+                # The clip starts with the next encoded frame
+                self._pending_trigger = reason
+
+    @property
+    def is_recording(self) -> bool:
+        return self._clip is not None or self._pending_trigger is not None
+
+    def _acquire_clip(self) -> bool:
+        if self._n_source_clips >= self.max_source_clips:
+            return False
+        with SmartRecorder._clips_lock:
+            if SmartRecorder._n_clips >= self.max_clips:
+                return False
+            SmartRecorder._n_clips += 1
+        self._n_source_clips += 1
+        return True
+
+    def _release_clip(self) -> None:
+        with SmartRecorder._clips_lock:
+            SmartRecorder._n_clips -= 1
+        with self._lock:
+            self._n_source_clips -= 1
+
+    def _start_clip(self, reason: str) -> None:
+        frames = self.ring.snapshot(self.pre_roll)
+        if not frames:
+            # Wait for the first keyframe
+            return
+        self._pending_trigger = None
+        self._clip = {'frames': frames,
+                      'n_bytes': sum(len(frame.data) for frame in frames),
+                      'caps': self.caps,
+                      'location': os.path.join(self.output_dir,
+                                               f'source{self.source_id}_{time.strftime("%Y%m%d-%H%M%S")}'
+                                               f'{"_" + reason if reason else ""}.mp4'),
+                      }
+        self._clip_end_pts = self._last_pts + int(self.post_roll * Gst.SECOND)
+        if self.verbose:
+            logging.info(f'Recording {self._clip["location"]}')
+
+    def _write_clip(self, clip: dict) -> None:
+        try:
+            self.mux_clip(clip)
+        finally:
+            self._release_clip()
+
+    def mux_clip(self, clip: dict) -> bool:
+        """
+        Mux frames to MP4: appsrc -> parser -> mp4mux -> filesink
+        :param clip: dict with frames, caps and location
+        :return: True if the clip is saved
+        """
+        frames = clip['frames']
+        if not frames or clip['caps'] is None:
+            return False
+        parser = 'h265parse' if clip['caps'].to_string().startswith('video/x-h265') else 'h264parse'
+        pipeline = Gst.parse_launch(f'appsrc name=src format=time ! {parser} ! mp4mux ! '
+                                    f'filesink location="{clip["location"]}"')
+        appsrc = pipeline.get_by_name('src')
+        appsrc.set_property('caps', clip['caps'])
+        pipeline.set_state(Gst.State.PLAYING)
+
+        base_pts = frames[0].pts
+        for frame in frames:
+            buffer = Gst.Buffer.new_wrapped(frame.data)
+            buffer.pts = frame.pts - base_pts
+            if frame.dts != Gst.CLOCK_TIME_NONE and frame.dts >= base_pts:
+                buffer.dts = frame.dts - base_pts
+            buffer.duration = frame.duration
+            if not frame.is_keyframe:
+                buffer.set_flags(Gst.BufferFlags.DELTA_UNIT)
+            appsrc.emit('push-buffer', buffer)
+        appsrc.emit('end-of-stream')
+
+        msg = pipeline.get_bus().timed_pop_filtered(10 * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        if msg is not None and msg.type == Gst.MessageType.ERROR:
+            err, debug = msg.parse_error()
+            logging.error(f'Clip {clip["location"]} failed: {err.message}')
+            return False
+        self.n_clips += 1
+        if self.verbose:
+            logging.info(f'Saved {clip["location"]}: {len(frames)} frames')
+        return True
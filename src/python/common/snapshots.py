@@ -0,0 +1,218 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from common import nvmeta
+
+SnapshotRequest = namedtuple('SnapshotRequest', ['source_id', 'frame_num', 'object_id', 'class_id', 'bbox'])
+
+
+class RateLimiter:
+
+    def __init__(self, interval: float, max_keys: int = 100000):
+        """
+        Allows one event per key every interval seconds
+        :param interval: seconds, 0 disables the limit
+        :param max_keys: keys above this bound are pruned by age
+        """
+        self.interval = interval
+        self.max_keys = max_keys
+        self._last = {}
+
+    def ready(self, key, now: float) -> bool:
+        last = self._last.get(key)
+        return not self.interval or last is None or now - last >= self.interval
+
+    def mark(self, key, now: float) -> None:
+        if not self.interval:
+            return
+        self._last[key] = now
+        if len(self._last) > self.max_keys:
+            self._last = {k: v for k, v in self._last.items() if now - v < self.interval}
+
+    def allow(self, key, now: float) -> bool:
+        if not self.ready(key, now):
+            return False
+        self.mark(key, now)
+        return True
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 85) -> bytes:
+    """
+    :param image: HxWx4 RGBA or HxWx3 BGR crop
+    :param quality: JPEG quality
+    :return: JPEG bytes
+    """
+    if image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_RGBA2BGR)
+    ok, data = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError('JPEG encoding failed')
+    return data.tobytes()
+
+
+class SnapshotService:
+
+    def __init__(self, output_dir: str, scale: tuple = (1.0, 1.0), source_interval: float = 1.0,
+                 track_interval: float = 10.0, max_pending: int = 64, max_age: float = 2.0, workers: int = 2,
+                 jpeg_quality: int = 85, encoder=encode_jpeg, verbose: bool = True):
+        """
+        Detection snapshots without blocking the streaming threads:
+            request()      - metadata probe, only records (source, frame, bbox) after the rate limits
+            wants()        - frame branch probe, tells which frames have to be mapped at all
+            submit_frame() - frame branch probe, crops requested boxes and hands them to the worker pool
+        The workers encode JPEGs in parallel (cv2 releases the GIL) and write the files.
+        Frames are plain HxWxC arrays, so the service runs the same on mapped surfaces and on CPU frames.
+        :param output_dir:      snapshots directory
+        :param scale:           (x, y) scale from metadata to frame branch coordinates
+        :param source_interval: min seconds between snapshots of a source
+        :param track_interval:  min seconds between snapshots of a track
+        :param max_pending:     bound of requested and not yet encoded snapshots, the rest is dropped
+        :param max_age:         seconds after which a request whose frame never reached the frame branch is dropped
+        :param workers:         encoding threads
+        :param jpeg_quality:    JPEG quality
+        :param encoder:         callable(image, quality) -> bytes
+        :param verbose:
+        """
+        self.output_dir = output_dir
+        self.scale = scale
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.jpeg_quality = jpeg_quality
+        self.encoder = encoder
+        self.verbose = verbose
+
+        self.source_limiter = RateLimiter(source_interval)
+        self.track_limiter = RateLimiter(track_interval)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='snapshot')
+        self._lock = threading.Lock()
+        # (source_id, frame_num) -> [SnapshotRequest]
+        self._requests = {}
+        # (source_id, frame_num) -> time of the first request, in request order
+        self._requested_at = {}
+        self._n_pending = 0
+        self.n_requested = 0
+        self.n_dropped = 0
+        self.n_saved = 0
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def request(self, source_id: int, frame_num: int, object_id: int, class_id: int, bbox: tuple,
+                now: float = None) -> bool:
+        """
+        :param bbox: (left, top, width, height) in metadata coordinates
+        :return: True if the snapshot was queued
+        """
+        now = time.monotonic() if now is None else now
+        # Untracked objects share one object id, only the source limit applies to them
+        track = (source_id, object_id) if object_id != nvmeta.UNTRACKED_OBJECT_ID else None
+        if track is not None and not self.track_limiter.ready(track, now) \
+                or not self.source_limiter.ready(source_id, now):
+            return False
+        with self._lock:
+            self._expire(now)
+            if self._n_pending >= self.max_pending:
+                self.n_dropped += 1
+                return False
+            if track is not None:
+                self.track_limiter.mark(track, now)
+            self.source_limiter.mark(source_id, now)
+            self._requests.setdefault((source_id, frame_num), []).append(
+                SnapshotRequest(source_id, frame_num, object_id, class_id, bbox))
+            self._requested_at.setdefault((source_id, frame_num), now)
+            self._n_pending += 1
+            self.n_requested += 1
+        return True
+
+    def wants(self, source_id: int, frame_num: int, now: float = None) -> bool:
+        if not self._requests:
+            return False
+        with self._lock:
+            self._expire(time.monotonic() if now is None else now)
+            return (source_id, frame_num) in self._requests
+
+    def _expire(self, now: float) -> None:
+        """
+        Drop the requests of frames the leaky frame branch never delivered, so they do not hold pending slots.
+        Called with the lock held.
+        """
+        expired = []
+        for key, requested_at in self._requested_at.items():
+            if now - requested_at < self.max_age:
+                break
+            expired.append(key)
+        for key in expired:
+            self._drop(key)
+
+    def _drop(self, key: tuple) -> None:
+        del self._requested_at[key]
+        n_requests = len(self._requests.pop(key))
+        self._n_pending -= n_requests
+        self.n_dropped += n_requests
+
+    def submit_frame(self, source_id: int, frame_num: int, image: np.ndarray) -> int:
+        """
+        Crop the requested boxes out of a frame and queue them for encoding. Only the crops are copied,
+        the frame can be reused by the pipeline as soon as this returns.
+        :param source_id: source index
+        :param frame_num: frame number
+        :param image:     HxWxC frame of the frame branch
+        :return: number of queued crops
+        """
+        with self._lock:
+            requests = self._requests.pop((source_id, frame_num), [])
+            self._requested_at.pop((source_id, frame_num), None)
+            # Requests of older frames of this source will never be served: the branch dropped those frames
+            stale = [key for key in self._requests if key[0] == source_id and key[1] < frame_num]
+            for key in stale:
+                self._drop(key)
+
+        height, width = image.shape[:2]
+        n_queued = 0
+        for index, request in enumerate(requests):
+            left, top, w, h = request.bbox
+            x0, y0 = max(0, int(left * self.scale[0])), max(0, int(top * self.scale[1]))
+            x1, y1 = min(width, int((left + w) * self.scale[0])), min(height, int((top + h) * self.scale[1]))
+            if x1 <= x0 or y1 <= y0:
+                self._done(saved=False)
+                continue
+            crop = np.array(image[y0:y1, x0:x1], copy=True)
+            self.executor.submit(self._encode, request, crop, index)
+            n_queued += 1
+        return n_queued
+
+    def _encode(self, request: SnapshotRequest, crop: np.ndarray, index: int = 0) -> None:
+        """
+        :param index: position of the request in its frame, untracked objects of a frame share the object id
+        """
+        try:
+            data = self.encoder(crop, self.jpeg_quality)
+            location = os.path.join(self.output_dir, f'source{request.source_id}_frame{request.frame_num}_'
+                                                     f'class{request.class_id}_track{request.object_id}_'
+                                                     f'{index}.jpg')
+            with open(location, 'wb') as f:
+                f.write(data)
+            self._done(saved=True)
+        except Exception as e:
+            logging.error(f'Snapshot of source {request.source_id} failed: {e}')
+            self._done(saved=False)
+
+    def _done(self, saved: bool) -> None:
+        with self._lock:
+            self._n_pending -= 1
+            if saved:
+                self.n_saved += 1
+            else:
+                self.n_dropped += 1
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.verbose:
+            logging.info(f'{self.__class__.__name__}: requested {self.n_requested}, saved {self.n_saved}, '
+                         f'dropped {self.n_dropped}')
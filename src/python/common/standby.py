@@ -0,0 +1,163 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+# context: objects of the generation the application needs after the build, e.g. its RTSP blocks
+Generation = namedtuple('Generation', ['number', 'pipeline', 'gate_pad', 'context'])
+
+
+def parse_overrides(argument: str) -> dict:
+    """
+    :param argument: 'key=value key=value', e.g. 'pgie=../configs/pgie_v2.txt'
+    :return: key -> value
+    """
+    overrides = {}
+    for item in argument.split():
+        key, sep, value = item.partition('=')
+        if not sep or not key or not value:
+            raise ValueError(f'Expected key=value, got "{item}"')
+        overrides[key] = value
+    return overrides
+
+
+class PipelineGate:
+
+    def __init__(self, active: int):
+        """
+        Only the batches of the active generation pass the muxer src pads, the others are dropped. The switch to
+        another generation is one attribute assignment.
+        :param active: number of the active generation
+        """
+        self.active = active
+        self._seen = set()
+
+    def attach(self, generation: Generation) -> None:
+        number = generation.number
+        seen = self._seen
+
+        def _gate_probe(pad, info, u_data):
+            if number not in seen:
+                seen.add(number)
+            return Gst.PadProbeReturn.OK if self.active == number else Gst.PadProbeReturn.DROP
+
+        generation.gate_pad.add_probe(Gst.PadProbeType.BUFFER, _gate_probe, 0)
+
+    def is_ready(self, number: int) -> bool:
+        """
+        :return: True after the first batch of the generation reached the gate
+        """
+        return number in self._seen
+
+
+class WarmStandby:
+
+    def __init__(self, build, activate, retire, active: Generation, ready_timeout: float = 120.0,
+                 drain_timeout: float = 5.0, verbose: bool = True):
+        """
+        Restarts and model swaps without blind time. A new generation of the pipeline is built on a worker thread,
+        prerolled in PAUSED (nvinfer loads its engines) and set to PLAYING while the gate drops its batches. It is
+        ready when its first batch reaches the gate: engines loaded, sources connected and caps negotiated. The
+        gate then switches to it in the main loop, the old generation is drained with EOS and set to NULL on a
+        worker thread. Until the switch the cameras have two connections and the GPU holds both engines.
+        :param build:         callable(number, **overrides) -> Generation, called on a worker thread
+        :param activate:      callable(Generation), on the main loop after the switch, starts the bus handlers
+        :param retire:        callable(Generation), on the main loop after the switch, stops the bus handlers
+        :param active:        running Generation
+        :param ready_timeout: seconds the new generation has to get ready, it is discarded otherwise
+        :param drain_timeout: seconds the old generation has to drain before it is set to NULL
+        :param verbose:
+        """
+        self.build = build
+        self.activate = activate
+        self.retire = retire
+        self.active = active
+        self.ready_timeout = ready_timeout
+        self.drain_timeout = drain_timeout
+        self.verbose = verbose
+        self.gate = PipelineGate(active.number)
+        self.gate.attach(active)
+        self._next = active.number + 1
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def swap(self, **overrides) -> str:
+        """
+        Starts a new generation, callable from any thread
+        :param overrides: passed to build
+        :return: reply text
+        """
+        with self._lock:
+            if self._pending:
+                return 'a standby generation is already being prepared\n'
+            self._pending = True
+            number = self._next
+            self._next += 1
+        threading.Thread(target=self._prepare, args=(number, overrides), name=f'standby_{number}',
+                         daemon=True).start()
+        return f'preparing generation {number}\n'
+
+    def _prepare(self, number: int, overrides: dict) -> None:
+        start = time.monotonic()
+        try:
+            generation = self.build(number, **overrides)
+        except Exception as e:
+            logging.error(f'Generation {number} not built, generation {self.active.number} keeps running: {e}')
+            self._pending = False
+            return
+        self.gate.attach(generation)
+        pipeline = generation.pipeline
+        bus = pipeline.get_bus()
+        # Live sources do not preroll, the state change returns once the non-live elements are started
+        if pipeline.set_state(Gst.State.PAUSED) == Gst.StateChangeReturn.FAILURE:
+            self._discard(generation, 'PAUSED failed')
+            return
+        if self.verbose:
+            logging.info(f'Generation {number} paused after {time.monotonic() - start:.1f} s')
+        pipeline.set_state(Gst.State.PLAYING)
+        while not self.gate.is_ready(number):
+            message = bus.timed_pop_filtered(100 * Gst.MSECOND, Gst.MessageType.ERROR)
+            if message is not None:
+                err, debug = message.parse_error()
+                self._discard(generation, err.message)
+                return
+            if time.monotonic() - start > self.ready_timeout:
+                self._discard(generation, f'no batch within {self.ready_timeout} s')
+                return
+        if self.verbose:
+            logging.info(f'Generation {number} ready after {time.monotonic() - start:.1f} s')
+        GLib.idle_add(self._switch, generation)
+
+    def _discard(self, generation: Generation, reason: str) -> None:
+        logging.error(f'Generation {generation.number} discarded, generation {self.active.number} keeps running: '
+                      f'{reason}')
+        generation.pipeline.set_state(Gst.State.NULL)
+        self._pending = False
+
+    def _switch(self, generation: Generation) -> bool:
+        old = self.active
+        self.gate.active = generation.number
+        self.active = generation
+        self.retire(old)
+        self.activate(generation)
+        self._pending = False
+        logging.info(f'Generation {generation.number} active, generation {old.number} draining')
+        threading.Thread(target=self._dispose, args=(old,), name=f'dispose_{old.number}', daemon=True).start()
+        return False
+
+    def _dispose(self, generation: Generation) -> None:
+        pipeline = generation.pipeline
+        # Batches in flight after the gate finish, then the EOS of the sources reaches the sinks
+        pipeline.send_event(Gst.Event.new_eos())
+        message = pipeline.get_bus().timed_pop_filtered(int(self.drain_timeout * Gst.SECOND),
+                                                        Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        if message is None or message.type != Gst.MessageType.EOS:
+            logging.warning(f'Generation {generation.number} not drained within {self.drain_timeout} s')
+        pipeline.set_state(Gst.State.NULL)
+        if self.verbose:
+            logging.info(f'Generation {generation.number} disposed')
@@ -0,0 +1,168 @@
+import numpy as np
+
+UNTRACKED_ID = -1
+
+
+def ltwh_to_xyxy(boxes: np.ndarray) -> np.ndarray:
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    :param a: (N, 4) boxes as x1, y1, x2, y2
+    :param b: (M, 4) boxes as x1, y1, x2, y2
+    :return: (N, M) IOU
+    """
+    ax1, ay1, ax2, ay2 = a.T
+    bx1, by1, bx2, by2 = b.T
+    # Coordinate-wise 2D arrays are several times faster than (N, M, 2) broadcasting
+    w = np.minimum(ax2[:, None], bx2) - np.maximum(ax1[:, None], bx1)
+    h = np.minimum(ay2[:, None], by2) - np.maximum(ay1[:, None], by1)
+    np.maximum(w, 0, out=w)
+    np.maximum(h, 0, out=h)
+    inter = w * h
+    union = ((ax2 - ax1) * (ay2 - ay1))[:, None] + (bx2 - bx1) * (by2 - by1) - inter
+    np.maximum(union, 1e-9, out=union)
+    return inter / union
+
+
+def greedy_match(scores: np.ndarray, threshold: float) -> tuple:
+    """
+    Pairs rows and columns by descending score
+    :param scores:    (N, M) similarity
+    :param threshold: minimum score of a pair
+    :return: (rows, cols) index arrays of the pairs
+    """
+    if scores.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matched_rows.append(r)
+        matched_cols.append(c)
+    return np.array(matched_rows, dtype=np.int64), np.array(matched_cols, dtype=np.int64)
+
+
+class IOUTracker:
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 30, min_hits: int = 3, motion: bool = True,
+                 velocity_lr: float = 0.2):
+        """
+        SORT-style tracker of a single stream: tracks are predicted with a smoothed constant velocity,
+        matched to detections of the same class by IOU and confirmed after min_hits updates.
+        The state lives in NumPy arrays, one row per track.
+        :param iou_threshold: minimum IOU of a detection and a predicted track
+        :param max_age:       frames a track survives without detections
+        :param min_hits:      updates before a track id is reported
+        :param motion:        predict tracks with their velocity, plain IOU matching otherwise
+        :param velocity_lr:   exponential smoothing rate of the velocity
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.motion = motion
+        self.velocity_lr = velocity_lr
+
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 2), dtype=np.float32)
+        self.classes = np.empty(0, dtype=np.int64)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.misses = np.empty(0, dtype=np.int64)
+        self.next_id = 0
+
+    @property
+    def n_tracks(self) -> int:
+        return len(self.ids)
+
+    def predict(self) -> np.ndarray:
+        if not self.motion:
+            return self.boxes
+        # Boxes are shifted by the center velocity, sizes are kept from the last detection
+        return self.boxes + np.tile(self.velocity * (self.misses[:, None] + 1), 2)
+
+    def update(self, boxes: np.ndarray, class_ids: np.ndarray) -> np.ndarray:
+        """
+        :param boxes:     (N, 4) detections as left, top, width, height
+        :param class_ids: (N,) detection classes
+        :return: (N,) track ids, UNTRACKED_ID for detections of unconfirmed tracks
+        """
+        detections = ltwh_to_xyxy(boxes)
+        class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        n_detections = len(detections)
+
+        scores = iou_matrix(self.predict(), detections)
+        scores[self.classes[:, None] != class_ids[None, :]] = 0.0
+        track_idx, det_idx = greedy_match(scores, self.iou_threshold)
+
+        # Matched tracks
+        if len(track_idx):
+            steps = (self.misses[track_idx] + 1)[:, None]
+            shift = detections[det_idx] - self.boxes[track_idx]
+            velocity = (shift[:, :2] + shift[:, 2:]) / (2 * steps)
+            self.velocity[track_idx] += self.velocity_lr * (velocity - self.velocity[track_idx])
+            self.boxes[track_idx] = detections[det_idx]
+            self.hits[track_idx] += 1
+        missed = np.ones(self.n_tracks, dtype=bool)
+        missed[track_idx] = False
+        self.misses[missed] += 1
+        self.misses[track_idx] = 0
+
+        ids = np.full(n_detections, UNTRACKED_ID, dtype=np.int64)
+        confirmed = self.hits[track_idx] >= self.min_hits
+        ids[det_idx[confirmed]] = self.ids[track_idx[confirmed]]
+
+        # New tracks from unmatched detections
+        new = np.ones(n_detections, dtype=bool)
+        new[det_idx] = False
+        n_new = int(new.sum())
+        if n_new:
+            new_ids = np.arange(self.next_id, self.next_id + n_new, dtype=np.int64)
+            self.next_id += n_new
+            self.boxes = np.concatenate([self.boxes, detections[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((n_new, 2), dtype=np.float32)])
+            self.classes = np.concatenate([self.classes, class_ids[new]])
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.hits = np.concatenate([self.hits, np.ones(n_new, dtype=np.int64)])
+            self.misses = np.concatenate([self.misses, np.zeros(n_new, dtype=np.int64)])
+            if self.min_hits <= 1:
+                ids[new] = new_ids
+
+        # Expired tracks
+        alive = self.misses <= self.max_age
+        if not alive.all():
+            self.boxes, self.velocity = self.boxes[alive], self.velocity[alive]
+            self.classes, self.ids = self.classes[alive], self.ids[alive]
+            self.hits, self.misses = self.hits[alive], self.misses[alive]
+        return ids
+
+
+class MultiStreamTracker:
+
+    def __init__(self, source_kwargs: dict = None, **tracker_kwargs):
+        """
+        One IOUTracker per source, track ids are unique per source like the ones of nvtracker
+        :param source_kwargs:  source_id -> IOUTracker arguments overriding tracker_kwargs for that source,
+                               e.g. max_age of a source decimated to a lower frame rate
+        :param tracker_kwargs: IOUTracker arguments
+        """
+        self.source_kwargs = source_kwargs or {}
+        self.tracker_kwargs = tracker_kwargs
+        self.trackers = {}
+
+    def update(self, source_id: int, boxes: np.ndarray, class_ids: np.ndarray) -> np.ndarray:
+        tracker = self.trackers.get(source_id)
+        if tracker is None:
+            kwargs = dict(self.tracker_kwargs, **self.source_kwargs.get(source_id, {}))
+            tracker = self.trackers[source_id] = IOUTracker(**kwargs)
+        return tracker.update(boxes, class_ids)
+
+    def remove(self, source_id: int) -> None:
+        self.trackers.pop(source_id, None)
@@ -8,7 +8,87 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument('-port', metavar='port', type=int, default=8554, help='int, rtsp port')
     parser.add_argument('-name', metavar='name', type=str, default='stream', nargs='+', help='str, rtsp address name')
     parser.add_argument('-codec', metavar='codec', type=str, default='h264', help='str, video codec')
+    parser.add_argument('-inventory', metavar='inventory', type=str, default=None,
+                        help='str, JSON camera inventory replacing -ip, -port, -name and -codec, reloaded on change')
+    parser.add_argument('-inventory_slots', metavar='inventory_slots', type=int, default=0,
+                        help='int, muxer slots for inventory cameras, room for cameras added later, '
+                             '0 for the enabled cameras at start')
     parser.add_argument('-debug_level', metavar='debug_level', type=int, default=0, help='str, GStreamer debug level')
+    parser.add_argument('-cascade', action='store_true', help='bool, run the secondary model on object crops')
+    parser.add_argument('-parallel', action='store_true', help='bool, run the models as parallel branches')
+    parser.add_argument('-fuse', action='store_true', help='bool, merge duplicate objects of the models')
+    parser.add_argument('-fusion_iou', metavar='fusion_iou', type=float, default=0.5,
+                        help='float, IOU of duplicate objects of different models')
+    parser.add_argument('-bbox_parser', metavar='bbox_parser', type=str, default='nvinfer',
+                        choices=['nvinfer', 'numpy'],
+                        help='str, primary model output parser: the nvinfer one or NumPy on the raw output tensors')
+    parser.add_argument('-record_tensors', metavar='record_tensors', type=str, default=None,
+                        help='str, .npz file for the first raw output batches of -bbox_parser numpy')
+    parser.add_argument('-pgie_interval', metavar='pgie_interval', type=int, default=0,
+                        help='int, batches skipped by the primary model between inferences')
+    parser.add_argument('-sgie_interval', metavar='sgie_interval', type=int, default=0,
+                        help='int, batches skipped by the secondary model between inferences')
+    parser.add_argument('-sgie_objects', metavar='sgie_objects', type=int, default=4,
+                        help='int, expected objects per frame for the secondary model batch')
+    parser.add_argument('-reinfer_interval', metavar='reinfer_interval', type=int, default=30,
+                        help='int, frames before a tracked object is sent to the secondary model again')
+    parser.add_argument('-shm_export', action='store_true', help='bool, export frames to shared memory')
+    parser.add_argument('-shm_interval', metavar='shm_interval', type=int, default=1,
+                        help='int, export every n-th frame of a source')
+    parser.add_argument('-record_dir', metavar='record_dir', type=str, default=None,
+                        help='str, record event clips of every source to this directory')
+    parser.add_argument('-snapshot_dir', metavar='snapshot_dir', type=str, default=None,
+                        help='str, save JPEG snapshots of detected objects to this directory')
+    parser.add_argument('-mux_size', metavar='mux_size', type=str, default='auto',
+                        help='str, nvstreammux WxH, auto derives it from the model inputs and source caps')
+    parser.add_argument('-mux_padding', action='store_true',
+                        help='bool, keep the source aspect ratio in the muxer with padding')
+    parser.add_argument('-latency_budget', metavar='latency_budget', type=float, default=0.0,
+                        help='float, seconds a source may lag before its late frames are dropped, 0 disables')
+    parser.add_argument('-admission_stage', metavar='admission_stage', type=str, default='both',
+                        choices=['decode', 'mux', 'both'], help='str, where late frames are dropped')
+    parser.add_argument('-files', metavar='files', type=str, nargs='+', default=None,
+                        help='str, process video files, directories or glob patterns instead of the cameras')
+    parser.add_argument('-file_slots', metavar='file_slots', type=int, default=4,
+                        help='int, files decoded in parallel as muxer inputs')
+    parser.add_argument('-checkpoint', metavar='checkpoint', type=str, default=None,
+                        help='str, JSON progress file of the -files run, resumed if it exists')
+    parser.add_argument('-no_source_sharing', action='store_true',
+                        help='bool, open a connection and a decoder per source even for duplicate URLs')
+    parser.add_argument('-analytics_fps', metavar='analytics_fps', type=float, nargs='+', default=[0],
+                        help='float, decoded frames per second passed to the muxer, one value or one per source, '
+                             '0 keeps every frame')
+    parser.add_argument('-source_fps', metavar='source_fps', type=float, default=30.0,
+                        help='float, frame rate of the cameras')
+    parser.add_argument('-stall_timeout', metavar='stall_timeout', type=float, nargs='+', default=[0],
+                        help='float, seconds without new decoded frames before a source is reconnected alone, '
+                             'one value or one per source, 0 disables')
+    parser.add_argument('-standby_timeout', metavar='standby_timeout', type=float, default=120.0,
+                        help='float, seconds a standby pipeline has to get ready before it is discarded')
+    parser.add_argument('-drain_timeout', metavar='drain_timeout', type=float, default=5.0,
+                        help='float, seconds the replaced pipeline has to drain before it is stopped')
+    parser.add_argument('-tracker', metavar='tracker', type=str, default='nvdcf',
+                        choices=('nvdcf', 'iou', 'klt', 'cpu'), help='str, tracker backend: nvdcf, iou, klt or cpu')
+    parser.add_argument('-tracker_width', metavar='tracker_width', type=int, default=1024,
+                        help='int, nvtracker frame width, multiple of 32')
+    parser.add_argument('-tracker_height', metavar='tracker_height', type=int, default=1024,
+                        help='int, nvtracker frame height, multiple of 32')
+    parser.add_argument('-analytics', metavar='analytics', type=str, default=None,
+                        help='str, zones and lines rules file for windowed analytics')
+    parser.add_argument('-metrics_port', metavar='metrics_port', type=int, default=0,
+                        help='int, serve Prometheus metrics on http://127.0.0.1:port/metrics, 0 disables')
+    parser.add_argument('-profile_probes', action='store_true',
+                        help='bool, measure pad probes, SIGUSR2 dumps a cProfile and folded stacks window')
+    parser.add_argument('-profile_window', metavar='profile_window', type=float, default=10.0,
+                        help='float, seconds profiled after SIGUSR2')
+    parser.add_argument('-profile_dir', metavar='profile_dir', type=str, default='probe_profiles',
+                        help='str, directory for the probe profiles')
+    parser.add_argument('-diagnostics_dir', metavar='diagnostics_dir', type=str, default='diagnostics',
+                        help='str, directory for the pipeline diagnostics written on SIGUSR1')
+    parser.add_argument('-control_socket', metavar='control_socket', type=str, default=None,
+                        help='str, unix socket path for diagnostics and debug level commands')
+    parser.add_argument('-effective_configs', metavar='effective_configs', type=str, default=None,
+                        help='str, directory for the model and tracker configs generated for this run')
     parser.add_argument('-d', action='store_true', help='bool, display pipeline output')
     parser.add_argument('-v', action='store_true', help='bool, enable logging')
     return parser.parse_args()
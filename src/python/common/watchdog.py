@@ -0,0 +1,194 @@
+import time
+import logging
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+# A block that stays silent after a restart is restarted again after deadline * 2 ** attempts, at most this factor
+MAX_BACKOFF = 8
+
+
+def source_deadlines(values: list, n_sources: int) -> list:
+    """
+    :param values:    seconds without new frames, one for all sources or one per source, 0 disables
+    :param n_sources: number of sources
+    :return: deadline per source
+    """
+    values = list(values or [0])
+    if len(values) == 1:
+        return values * n_sources
+    if len(values) != n_sources:
+        raise ValueError(f'Expected 1 or {n_sources} stall timeouts, got {len(values)}')
+    return values
+
+
+def block_deadlines(deadlines: list, source_groups: dict) -> dict:
+    """
+    :param deadlines:     deadline per source, source_deadlines
+    :param source_groups: block id -> source ids of the block
+    :return: block id -> deadline, the shortest enabled deadline of the sources sharing the block
+    """
+    blocks = {}
+    for block_id, source_ids in source_groups.items():
+        enabled = [deadlines[source_id] for source_id in source_ids if deadlines[source_id] > 0]
+        blocks[block_id] = min(enabled) if enabled else 0
+    return blocks
+
+
+class StallWatchdog:
+
+    def __init__(self, blocks: dict, deadlines: dict, sources: dict = None, check_interval: float = 1.0,
+                 metrics=None, verbose: bool = True):
+        """
+        Data-flow watchdog of the RTSP blocks. A probe on the decoded pad of a block records the arrival of buffers
+        whose timestamp moved on, a GLib timeout restarts a block silent for longer than its deadline: a connected
+        rtspsrc of a frozen camera or a stuck decoder is reconnected alone while the other sources keep running.
+        :param blocks:         block id -> gstreamer_wrappers.RTSPBin
+        :param deadlines:      block id -> seconds without new frames before a restart, 0 disables the block
+        :param sources:        block id -> source ids of the block, metrics labels, the block id if None
+        :param check_interval: seconds between checks
+        :param metrics:        metrics.PipelineMetrics for stalls, stall durations and restarts, optional
+        :param verbose:
+        """
+        self.blocks = blocks
+        self.deadlines = {block_id: deadline for block_id, deadline in deadlines.items() if deadline > 0}
+        self.sources = sources or {block_id: [block_id] for block_id in blocks}
+        self.check_interval = check_interval
+        self.metrics = metrics
+        self.verbose = verbose
+        self.last_arrival = {}
+        self.last_pts = {}
+        # block id -> arrival of the last buffer before the stall
+        self.stalled = {}
+        self.attempts = {}
+        self._restarted_at = {}
+        self._grace = 0.0
+        self._last_check = None
+        self._timeout_id = None
+
+    def attach(self) -> None:
+        """
+        Adds the arrival probes, call before the pipeline starts
+        :return: None
+        """
+        for block_id in self.deadlines:
+            self._attach_block(block_id)
+
+    def _attach_block(self, block_id: int) -> None:
+        decoder = self.blocks[block_id].decoder
+        probe = self._arrival_probe(block_id)
+        pad = decoder.get_static_pad('src')
+        if pad is not None:
+            pad.add_probe(Gst.PadProbeType.BUFFER, probe, 0)
+        else:
+            # decodebin src pads come and go with the session
+            decoder.connect('pad-added', lambda element, new_pad, p=probe:
+                            new_pad.add_probe(Gst.PadProbeType.BUFFER, p, 0))
+
+    def add(self, block_id: int, deadline: float, source_ids: list) -> None:
+        """
+        Watches a block added to the running pipeline, the block is in blocks already
+        :param block_id:   block id
+        :param deadline:   seconds without new frames before a restart, 0 disables the block
+        :param source_ids: source ids of the block
+        :return: None
+        """
+        self.sources[block_id] = source_ids
+        if deadline <= 0:
+            return
+        self._attach_block(block_id)
+        self.last_arrival[block_id] = time.monotonic()
+        self.deadlines[block_id] = deadline
+
+    def remove(self, block_id: int) -> None:
+        for state in (self.deadlines, self.last_arrival, self.last_pts, self.stalled, self.attempts,
+                      self._restarted_at):
+            state.pop(block_id, None)
+
+    def _arrival_probe(self, block_id: int):
+        last_pts = self.last_pts
+        last_arrival = self.last_arrival
+
+        def _buffer_probe(pad, info, u_data):
+            pts = info.get_buffer().pts
+            # A frozen source can keep repeating its last frame, only a new timestamp is progress
+            if pts == Gst.CLOCK_TIME_NONE or pts != last_pts.get(block_id):
+                last_pts[block_id] = pts
+                last_arrival[block_id] = time.monotonic()
+            return Gst.PadProbeReturn.OK
+
+        return _buffer_probe
+
+    def start(self) -> None:
+        """
+        Starts the checks in the default main context, every block gets a full deadline from now
+        :return: None
+        """
+        now = time.monotonic()
+        self._grace = now
+        self._last_check = now
+        self._timeout_id = GLib.timeout_add(int(self.check_interval * 1000), self.check)
+        if self.verbose:
+            logging.info(f'Stall watchdog: deadlines {self.deadlines} s')
+
+    def stop(self) -> None:
+        if self._timeout_id is not None:
+            GLib.source_remove(self._timeout_id)
+            self._timeout_id = None
+
+    def check(self) -> bool:
+        """
+        :return: True, a repeating GLib timeout
+        """
+        now = time.monotonic()
+        if now - self._last_check > 2 * self.check_interval:
+            # The main loop was blocked, by a pipeline restart of RTSPHandler for instance: nothing could arrive
+            self._grace = now
+        self._last_check = now
+        for block_id, deadline in list(self.deadlines.items()):
+            last = self.last_arrival.get(block_id, 0.0)
+            stall_start = self.stalled.get(block_id)
+            if stall_start is not None and last > stall_start:
+                self._recovered(block_id, last - stall_start)
+                continue
+            silence = now - max(last, self._grace)
+            self._set_silence(block_id, now - last if last else silence)
+            wait = deadline * min(2 ** self.attempts.get(block_id, 0), MAX_BACKOFF)
+            if silence < deadline or now - self._restarted_at.get(block_id, 0.0) < wait:
+                continue
+            if stall_start is None:
+                self.stalled[block_id] = last or self._grace
+                if self.metrics is not None:
+                    for source_id in self.sources[block_id]:
+                        self.metrics.stalls.labels(source=source_id).inc()
+                logging.warning(f'Sources {self.sources[block_id]}: no new frames for {silence:.1f} s')
+            self._restart(block_id, now)
+        return True
+
+    def _restart(self, block_id: int, now: float) -> None:
+        self.attempts[block_id] = self.attempts.get(block_id, 0) + 1
+        self._restarted_at[block_id] = now
+        if self.verbose:
+            logging.info(f'Sources {self.sources[block_id]}: restarting the RTSP block, '
+                         f'attempt {self.attempts[block_id]}')
+        if self.metrics is not None:
+            for source_id in self.sources[block_id]:
+                self.metrics.watchdog_restarts.labels(source=source_id).inc()
+        self.blocks[block_id].restart()
+
+    def _recovered(self, block_id: int, duration: float) -> None:
+        del self.stalled[block_id]
+        self.attempts.pop(block_id, None)
+        self._restarted_at.pop(block_id, None)
+        logging.info(f'Sources {self.sources[block_id]}: frames again after {duration:.1f} s')
+        if self.metrics is not None:
+            for source_id in self.sources[block_id]:
+                self.metrics.stall_duration.labels(source=source_id).observe(duration)
+        self._set_silence(block_id, 0.0)
+
+    def _set_silence(self, block_id: int, seconds: float) -> None:
+        if self.metrics is not None:
+            for source_id in self.sources[block_id]:
+                self.metrics.silence.labels(source=source_id).set(round(seconds, 3))
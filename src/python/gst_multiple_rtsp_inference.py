@@ -1,21 +1,46 @@
 import os
 import sys
 import gi
+import signal
 import logging
+import threading
+import tempfile
+import collections
 import numpy as np
 
 gi.require_version('Gst', '1.0')
 gi.require_version('GstRtsp', '1.0')
-from gi.repository import GObject, Gst, GstRtsp
+from gi.repository import GLib, GObject, Gst, GstRtsp
 from common import nvutils
 from common import gstreamer_wrappers as gsw
 from common import utils
+from common import admission
+from common import analytics
+from common import bbox_parser
+from common import cascade
+from common import configs
+from common import decimation
+from common import diagnostics
+from common import fusion
+from common import inventory
+from common import metamerge
+from common import metrics
+from common import nvmeta
+from common import offline
+from common import resolution
+from common import shm_ring
+from common import smart_record
+from common import snapshots
+from common import standby
+from common import tracking
+from common import watchdog
 
 # Path for pyds library
 sys.path.append(os.path.join(os.getcwd(), 'models', 'deep_stream'))
 sys.path.append(os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib'))
 import pyds
 
+# Class names of models without a label file, each generation counts its objects in a copy, see model_classes
 MODELS_CLASSES = {'pgie': {'names': ["Person", "Bag", "Face"],
                            'counter': {i: 0 for i in range(3)}
                            },
@@ -27,110 +52,1133 @@ MODELS_CLASSES = {'pgie': {'names': ["Person", "Bag", "Face"],
 
 stream_fps = {}
 
+# Models of the swap control command
+MODEL_GIE_IDS = {'pgie': 1, 'sgie0': 2}
+
+# nvtracker low-level libraries, 'cpu' runs tracking.MultiStreamTracker in a probe instead
+TRACKER_LIBS = {'nvdcf': 'libnvds_nvdcf', 'iou': 'libnvds_mot_iou', 'klt': 'libnvds_mot_klt'}
+# tracking.MultiStreamTracker settings in frames at the full rate of a source
+CPU_TRACKER_KWARGS = {'max_age': 30, 'min_hits': 3}
+# Tiled display size, frames of the shared memory export and of the snapshots are half of it
+OUTPUT_SIZE = (1920, 1080)
+UNTRACKED_OBJECT_ID = 0xFFFFFFFFFFFFFFFF
+
+# Clips are recorded when a frame has at least min_objects of these pgie classes. Class ids of the models overlap,
+# the rules name the gie-unique-id of the model too.
+RECORD_RULE = {'component_ids': (1,), 'class_ids': (0,), 'min_objects': 1, 'min_confidence': 0.5}
+
+# Snapshots are requested for objects of these pgie classes
+SNAPSHOT_RULE = {'component_ids': (1,), 'class_ids': (0,), 'min_confidence': 0.5}
+
+
+def instrument(instruments, name, probe):
+    """
+    :param instruments: objects with instrument_probe(name, probe), metrics.PipelineMetrics and
+                        gstreamer_wrappers.ProbeProfiler
+    :param name:        probe label
+    :param probe:       pad probe callback
+    :return: probe wrapped by every instrument
+    """
+    for instrumentation in instruments:
+        probe = instrumentation.instrument_probe(name, probe)
+    return probe
+
+
+def count_batch_objects(info) -> int:
+    """
+    Objects in the batch meta of a probe call, for the probe profiler
+    """
+    gst_buffer = info.get_buffer()
+    if not gst_buffer:
+        return 0
+    return sum(frame_meta.num_obj_meta for frame_meta in nvmeta.frames(nvmeta.batch_meta(gst_buffer)))
+
+
+def batch_metrics_probe(pipeline_metrics, batch_size):
+    """
+    Counts frames per source and the muxer batch fill ratio
+    :param pipeline_metrics: metrics.PipelineMetrics
+    :param batch_size:       nvstreammux batch-size
+    :return: probe callback
+    """
+    batch_fill = pipeline_metrics.batch_fill.labels()
+    frames = {}
+
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            return Gst.PadProbeReturn.OK
+
+        batch_meta = nvmeta.batch_meta(gst_buffer)
+        batch_fill.observe(batch_meta.num_frames_in_batch / batch_size)
+        for frame_meta in nvmeta.frames(batch_meta):
+            counter = frames.get(frame_meta.pad_index)
+            if counter is None:
+                counter = frames[frame_meta.pad_index] = pipeline_metrics.frames.labels(source=frame_meta.pad_index)
+            counter.inc()
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def det_buffer_probe(model_name, classes, mux_size=(1920, 1080), padding=False):
+    """
+    Prints the objects of the model in every frame, boxes in source resolution. With -parallel the batch meta is
+    shared with the other branch: only objects of this model are read, under the meta lock, printing comes after.
+    :param model_name: MODELS_CLASSES key
+    :param classes:    {'names': class names, 'counter': class id -> objects} of the model in this generation
+    :param mux_size:   nvstreammux (width, height)
+    :param padding:    nvstreammux enable-padding
+    :return: probe callback
+    """
+    names = classes['names']
+    obj_counter = classes['counter']
+    component_id = MODEL_GIE_IDS[model_name]
 
-def det_buffer_probe(model_name):
     def _buffer_probe(pad, info, u_data):
         gst_buffer = info.get_buffer()
         if not gst_buffer:
             print("Unable to get GstBuffer ")
-            return
+            return Gst.PadProbeReturn.OK
 
-        # Retrieve batch metadata from the gst_buffer
-        # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
-        # C address of gst_buffer as input, which is obtained with hash(gst_buffer)
-        batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-        l_frame = batch_meta.frame_meta_list
-        while l_frame is not None:
-            try:
-                # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
-                # The casting is done by pyds.NvDsFrameMeta.cast()
-                # The casting also keeps ownership of the underlying memory
-                # in the C code, so the Python garbage collector will leave
-                # it alone.
-                frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-            except StopIteration:
-                break
-            frame_number = frame_meta.frame_num
-            l_obj = frame_meta.obj_meta_list
-            num_rects = frame_meta.num_obj_meta
-
-            obj_counter = MODELS_CLASSES[model_name]['counter']
+        frames_info = []
+        batch = nvmeta.batch_meta(gst_buffer)
+        with nvmeta.locked(batch):
+            for frame_meta, obj_metas in nvmeta.batch_objects(batch):
+                sx, sy = resolution.source_scale(frame_meta.source_frame_width, frame_meta.source_frame_height,
+                                                 *mux_size, padding=padding)
+                objects = []
+                for obj_meta in obj_metas:
+                    if obj_meta.unique_component_id != component_id:
+                        continue
+                    rect_params = obj_meta.rect_params
+                    objects.append((frame_meta.batch_id, obj_meta.confidence,
+                                    (int(rect_params.top * sy), int(rect_params.left * sx),
+                                     int(rect_params.width * sx), int(rect_params.height * sy)),
+                                    obj_meta.class_id))
+                frames_info.append((frame_meta.frame_num, frame_meta.pad_index, objects))
+
+        for frame_num, pad_index, objects in frames_info:
             for k in obj_counter.keys():
                 obj_counter[k] = 0
-
             l_obj_info = []
-            while l_obj is not None:
-                try:
-                    # Casting l_obj.data to pyds.NvDsObjectMeta
-                    obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-                except StopIteration:
-                    break
-                obj_counter[obj_meta.class_id] += 1
-                # Getting Image data using nvbufsurface
-                # the input should be address of buffer and batch_id
-                # n_frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
-                rect_params = obj_meta.rect_params
-                top = int(rect_params.top)
-                left = int(rect_params.left)
-                width = int(rect_params.width)
-                height = int(rect_params.height)
-                obj_name = MODELS_CLASSES[model_name]['names'][obj_meta.class_id]
-                l_obj_info.append(
-                    (
-                        frame_meta.batch_id,
-                        frame_meta.pad_index,
-                        obj_meta.confidence,
-                        (top, left, width, height),
-                        obj_name
-                    )
-                )
-                try:
-                    l_obj = l_obj.next
-                except StopIteration:
-                    break
-
-            # print(len(l_obj_info))
-            classes_info = [
-                f"""\t{MODELS_CLASSES[model_name]['names'][cls_id]}: {obj_counter[cls_id]}"""
-                for cls_id in obj_counter.keys()
-            ]
-            classes_info = '\n'.join(classes_info)
-
-            print("\nFrame Number=", frame_number,
+            for batch_id, confidence, box, class_id in objects:
+                if class_id in obj_counter:
+                    obj_counter[class_id] += 1
+                l_obj_info.append((batch_id, pad_index, confidence, box,
+                                   names[class_id] if 0 <= class_id < len(names) else str(class_id)))
+
+            classes_info = '\n'.join(f"\t{names[cls_id]}: {obj_counter[cls_id]}" for cls_id in obj_counter.keys())
+            print("\nFrame Number=", frame_num,
                   f"\nModel: {model_name}\n{classes_info}",
-                  "\nNumber of Objects=", num_rects,
+                  "\nNumber of Objects=", len(l_obj_info),
                   )
             print(*l_obj_info, sep='\n')
 
+            # Get frame rate through this probe
             if model_name == 'pgie':
-                stream_fps["stream{0}".format(frame_meta.pad_index)].get_fps()
+                stream_fps["stream{0}".format(pad_index)].get_fps()
 
-            # Get frame rate through this probe
-            try:
-                l_frame = l_frame.next
-            except StopIteration:
-                break
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def cpu_tracker_probe(tracker):
+    """
+    Assigns object ids with the NumPy tracker in place of nvtracker
+    :param tracker: tracking.MultiStreamTracker
+    :return: probe callback
+    """
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+            arrays = nvmeta.object_arrays(obj_metas)
+            # Objects of different models never share a track
+            ids = tracker.update(frame_meta.pad_index, arrays.boxes, (arrays.component_ids << 16) + arrays.class_ids)
+            for obj_meta, object_id in zip(obj_metas, ids.tolist()):
+                obj_meta.object_id = object_id if object_id != tracking.UNTRACKED_ID else UNTRACKED_OBJECT_ID
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def fusion_probe(taxonomy, iou_threshold=0.5):
+    """
+    Removes objects detected by several models and labels the rest with the shared taxonomy
+    :param taxonomy:      fusion.Taxonomy of the models
+    :param iou_threshold: duplicates IOU
+    :return: probe callback
+    """
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+            if not obj_metas:
+                continue
+            arrays = nvmeta.object_arrays(obj_metas)
+            shared = taxonomy.shared_ids(arrays.component_ids, arrays.class_ids)
+            keep = fusion.fuse(arrays.boxes, arrays.confidences, shared, arrays.component_ids, iou_threshold)
+            for obj_meta, kept, shared_id in zip(obj_metas, keep.tolist(), shared.tolist()):
+                if kept:
+                    obj_meta.obj_label = taxonomy.name(shared_id)
+                else:
+                    nvmeta.remove_object(frame_meta, obj_meta)
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def bbox_parser_probe(decoder, gie_id, labels, recorder=None):
+    """
+    Objects of a model run without the nvinfer parser: its raw output layers are decoded for the whole batch at once
+    :param decoder:  bbox_parser.DetectNetDecoder
+    :param gie_id:   gie-unique-id of the model
+    :param labels:   class names of the model
+    :param recorder: bbox_parser.TensorRecorder, optional
+    :return: probe callback
+    """
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        batch = nvmeta.batch_meta(gst_buffer)
+        frame_metas, covs, bboxes = [], [], []
+        for frame_meta in nvmeta.frames(batch):
+            # Frames skipped by the model interval have no tensors
+            layers = nvmeta.tensor_outputs(frame_meta, gie_id)
+            if layers:
+                frame_metas.append(frame_meta)
+                covs.append(layers[decoder.cov_layer])
+                bboxes.append(layers[decoder.bbox_layer])
+        if not frame_metas:
+            return Gst.PadProbeReturn.OK
+
+        cov, bbox = np.stack(covs), np.stack(bboxes)
+        if recorder is not None:
+            recorder.add(cov, bbox)
+        detections = decoder.decode(cov, bbox)
+        # The other -parallel branch adds and removes objects of the same frames
+        with nvmeta.locked(batch):
+            for frame, box, score, class_id in zip(detections.frames.tolist(), detections.boxes.tolist(),
+                                                   detections.scores.tolist(), detections.class_ids.tolist()):
+                label = labels[class_id] if class_id < len(labels) else str(class_id)
+                nvmeta.add_object(batch, frame_metas[frame], gie_id, class_id, score, tuple(box), label)
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def analytics_probe(engine, gie_id, mux_size=(1920, 1080), padding=False, stream_time=False):
+    """
+    Feeds tracked objects of a model to the analytics rules engine, boxes in source resolution
+    :param engine:      analytics.AnalyticsEngine
+    :param gie_id:      unique component id of the analyzed model
+    :param mux_size:    nvstreammux (width, height)
+    :param padding:     nvstreammux enable-padding
+    :param stream_time: windows in buffer timestamps, for files processed faster than real time
+    :return: probe callback
+    """
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+            arrays = nvmeta.object_arrays(obj_metas)
+            model = arrays.component_ids == gie_id
+            sx, sy = resolution.source_scale(frame_meta.source_frame_width, frame_meta.source_frame_height,
+                                             *mux_size, padding=padding)
+            boxes = arrays.boxes[model] * np.array([sx, sy, sx, sy], dtype=np.float32)
+            # System time attached by the muxer (attach-sys-ts) or the file position, in nanoseconds
+            timestamp = (frame_meta.buf_pts if stream_time else frame_meta.ntp_timestamp) / 1e9
+            engine.update(frame_meta.pad_index, timestamp, arrays.object_ids[model], arrays.class_ids[model], boxes)
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def shm_export_probe(writers, width, height, scale, interval=1):
+    """
+    Publishes frames with objects metadata to per-source shared memory rings
+    :param writers:  dict, source id -> shm_ring.ShmFrameWriter, filled lazily
+    :param width:    exported frame width
+    :param height:   exported frame height
+    :param scale:    (x, y) scale from muxer to exported frame coordinates
+    :param interval: export every n-th frame of a source
+    :return: probe callback
+    """
+    box_scale = np.array([scale[0], scale[1], scale[0], scale[1]], dtype=np.float32)
+
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta in nvmeta.frames(nvmeta.batch_meta(gst_buffer)):
+            if frame_meta.frame_num % interval != 0:
+                continue
+            arrays = nvmeta.object_arrays(nvmeta.objects(frame_meta))
+            objects = np.zeros(len(arrays.confidences), dtype=shm_ring.OBJECT_DTYPE)
+            boxes = arrays.boxes * box_scale
+            for i, field in enumerate(('left', 'top', 'width', 'height')):
+                objects[field] = boxes[:, i]
+            objects['confidence'] = arrays.confidences
+            objects['class_id'] = arrays.class_ids
+            objects['component_id'] = arrays.component_ids
+            objects['object_id'] = arrays.object_ids.view(np.uint64)
+
+            writer = writers.get(frame_meta.pad_index)
+            if writer is None:
+                writer = shm_ring.ShmFrameWriter(source_id=frame_meta.pad_index, width=width, height=height)
+                writers[frame_meta.pad_index] = writer
+            # Mapped RGBA surface of the frame, copied once into the ring
+            n_frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+            writer.write(n_frame, frame_meta.frame_num, frame_meta.buf_pts, objects)
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def record_trigger_probe(recorders, component_ids, class_ids, min_objects=1, min_confidence=0.0):
+    """
+    Triggers SmartRecorder of a source when a detection rule fires. Only counts objects,
+    muxing happens on the recorder threads.
+    :param recorders:      dict, source id -> smart_record.SmartRecorder
+    :param component_ids:  gie-unique-ids of the models counted by the rule
+    :param class_ids:      classes counted by the rule
+    :param min_objects:    objects in a frame to fire the rule
+    :param min_confidence: objects with lower confidence are ignored
+    :return: probe callback
+    """
+    component_ids, class_ids = set(component_ids), set(class_ids)
+
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        batch = nvmeta.batch_meta(gst_buffer)
+        with nvmeta.locked(batch):
+            fired = [frame_meta.pad_index for frame_meta, obj_metas in nvmeta.batch_objects(batch)
+                     if sum(1 for obj_meta in obj_metas
+                            if obj_meta.unique_component_id in component_ids and obj_meta.class_id in class_ids
+                            and obj_meta.confidence >= min_confidence) >= min_objects]
+        for pad_index in fired:
+            recorders[pad_index].trigger('detection')
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def snapshot_request_probe(service, component_ids, class_ids, min_confidence=0.0):
+    """
+    Records snapshot requests from metadata, no frame is mapped here
+    :param service:        snapshots.SnapshotService
+    :param component_ids:  gie-unique-ids of the models to snapshot
+    :param class_ids:      classes to snapshot
+    :param min_confidence: objects with lower confidence are ignored
+    :return: probe callback
+    """
+    component_ids, class_ids = set(component_ids), set(class_ids)
+
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+            for obj_meta in obj_metas:
+                if obj_meta.unique_component_id in component_ids and obj_meta.class_id in class_ids \
+                        and obj_meta.confidence >= min_confidence:
+                    rect_params = obj_meta.rect_params
+                    service.request(frame_meta.pad_index, frame_meta.frame_num, obj_meta.object_id,
+                                    obj_meta.class_id,
+                                    (rect_params.left, rect_params.top, rect_params.width, rect_params.height))
+
+        return Gst.PadProbeReturn.OK
+
+    return _buffer_probe
+
+
+def snapshot_frame_probe(service):
+    """
+    Maps downscaled frames with pending snapshot requests and hands the crops to the service workers
+    :param service: snapshots.SnapshotService
+    :return: probe callback
+    """
+    def _buffer_probe(pad, info, u_data):
+        gst_buffer = info.get_buffer()
+        if not gst_buffer:
+            print("Unable to get GstBuffer ")
+            return Gst.PadProbeReturn.OK
+
+        for frame_meta in nvmeta.frames(nvmeta.batch_meta(gst_buffer)):
+            if service.wants(frame_meta.pad_index, frame_meta.frame_num):
+                n_frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
+                service.submit_frame(frame_meta.pad_index, frame_meta.frame_num, n_frame)
 
         return Gst.PadProbeReturn.OK
 
     return _buffer_probe
 
 
+def prepare_models(paths: dict, batch_sizes: dict, output_dir: str = None, overrides: dict = None,
+                   verbose: bool = True) -> dict:
+    """
+    Configs are validated for the runtime batch sizes, -effective_configs rewrites them for this deployment
+    :param paths:       gie id -> nvinfer config file
+    :param batch_sizes: gie id -> batch size of the model
+    :param output_dir:  directory of the effective configs, None keeps the files unless they need a change
+    :param overrides:   gie id -> keys set in the effective config
+    :param verbose:
+    :return: gie id -> configs.NvInferConfig of the file nvinfer has to load
+    """
+    overrides = overrides or {}
+    return {gie_id: configs.prepare_nvinfer_config(path, batch_size=batch_sizes[gie_id], output_dir=output_dir,
+                                                   overrides=overrides.get(gie_id), verbose=verbose)
+            for gie_id, path in paths.items()}
+
+
+def model_classes(prepared: dict) -> dict:
+    """
+    Class names and object counters of one generation, the names follow the label files of its models
+    :param prepared: gie id -> configs.NvInferConfig
+    :return: model name -> {'names': class names, 'counter': class id -> objects}, same layout as MODELS_CLASSES
+    """
+    classes = {}
+    for model_name, gie_id in MODEL_GIE_IDS.items():
+        names = prepared[gie_id].labels or MODELS_CLASSES[model_name]['names']
+        classes[model_name] = {'names': names, 'counter': {i: 0 for i in range(len(names))}}
+    return classes
+
+
+# Per-source settings of the muxer slots at one point in time, lists indexed by slot
+Sources = collections.namedtuple('Sources', ['locations', 'codecs', 'analytics_fps', 'stall_timeouts',
+                                             'drop_intervals', 'rates'])
+
+
+class SourceTable:
+
+    def __init__(self, locations: list, codecs: list, analytics_fps: list, stall_timeouts: list,
+                 source_fps: float):
+        """
+        Per-source settings of the muxer slots. Inventory changes are applied on the main loop while a standby
+        generation is built on a worker thread, builds read a snapshot taken under the lock.
+        :param locations:      source address per slot, None for a free slot
+        :param codecs:         codec per slot
+        :param analytics_fps:  analytics frame rate per slot, 0 for every frame
+        :param stall_timeouts: seconds without frames before a source is reconnected, per slot
+        :param source_fps:     frame rate of the sources
+        """
+        self.locations = list(locations)
+        self.codecs = list(codecs)
+        self.analytics_fps = list(analytics_fps)
+        self.stall_timeouts = list(stall_timeouts)
+        self.source_fps = source_fps
+        self.drop_intervals = [decimation.drop_interval(fps, source_fps) for fps in self.analytics_fps]
+        self.rates = [decimation.effective_fps(fps, source_fps) for fps in self.analytics_fps]
+        self._default_fps = list(analytics_fps)
+        self._default_stall_timeouts = list(stall_timeouts)
+        self._lock = threading.Lock()
+
+    def set_camera(self, slot: int, camera: inventory.Camera) -> None:
+        """
+        Settings of an inventory camera, the command line values apply where the camera sets none
+        :param slot:   muxer slot of the camera
+        :param camera: inventory.Camera
+        :return: None
+        """
+        fps = self._default_fps[slot] if camera.analytics_fps is None else camera.analytics_fps
+        with self._lock:
+            self.locations[slot] = camera.url
+            self.codecs[slot] = camera.codec
+            self.analytics_fps[slot] = fps
+            self.stall_timeouts[slot] = (self._default_stall_timeouts[slot] if camera.stall_timeout is None
+                                         else camera.stall_timeout)
+            self.drop_intervals[slot] = decimation.drop_interval(fps, self.source_fps)
+            self.rates[slot] = decimation.effective_fps(fps, self.source_fps)
+
+    def clear(self, slot: int) -> None:
+        with self._lock:
+            self.locations[slot] = None
+
+    def snapshot(self) -> Sources:
+        with self._lock:
+            return Sources(list(self.locations), list(self.codecs), list(self.analytics_fps),
+                           list(self.stall_timeouts), list(self.drop_intervals), list(self.rates))
+
+
+class SourceBlocks:
+
+    def __init__(self, pipeline, streammux, args, admission_controller=None, admission_stages: tuple = ()):
+        """
+        RTSP blocks of one pipeline generation. Duplicate URLs share one connection and decoder fanned out to their
+        muxer pads, clips of a shared camera are recorded once.
+        :param pipeline:             Gst.Pipeline of the generation
+        :param streammux:            nvstreammux of the generation
+        :param args:                 command line arguments
+        :param admission_controller: admission.AdmissionController, None without -latency_budget
+        :param admission_stages:     admission.STAGES where late frames are dropped
+        """
+        self.pipeline = pipeline
+        self.streammux = streammux
+        self.args = args
+        self.admission_controller = admission_controller
+        self.admission_stages = admission_stages
+        self.rtsp_blocks = {}
+        self.fanouts = {}
+        self.mux_handlers = {}
+        self.recorders = {}
+        self.groups = {}
+
+    def add(self, block_id: int, source_ids: list, sources: Sources):
+        """
+        RTSPBin of the sources added to the pipeline and linked to their muxer pads
+        :param block_id:   RTSPBin builder id
+        :param source_ids: muxer pads of the sources sharing the connection
+        :param sources:    Sources snapshot with the settings of the sources
+        :return: gsw.RTSPBin
+        """
+        args = self.args
+        admission_controller = self.admission_controller
+        admission_stages = self.admission_stages
+        i = source_ids[0]
+        self.groups[block_id] = source_ids
+        block_fps = decimation.shared_rate([sources.analytics_fps[source_id] for source_id in source_ids])
+        rtsp_bin = gsw.RTSPBin(builder_id=block_id, location=sources.locations[i], compression=sources.codecs[i],
+                               record=args.record_dir is not None, parse='decode' in admission_stages,
+                               target_fps=block_fps, source_fps=args.source_fps, verbose=args.v)
+        self.rtsp_blocks.update({block_id: rtsp_bin})
+        if args.record_dir is not None:
+            # Clips of a shared camera are recorded once, events of every source sharing it trigger them
+            recorder = smart_record.SmartRecorder(source_id=i, output_dir=args.record_dir, verbose=args.v)
+            recorder.attach(rtsp_bin.record_sink)
+            self.recorders.update({source_id: recorder for source_id in source_ids})
+
+        for element in rtsp_bin.elements:
+            self.pipeline.add(element)
+        rtsp_bin.link_elements()
+        # A standby generation is prerolled before it gets an RTSPHandler, its rtspsrc pads are linked by the block
+        rtsp_bin.link_rtspsrc()
+
+        decoder_srcpad = rtsp_bin.decoder.get_static_pad("src") if nvutils.is_aarch64() else None
+        if len(source_ids) > 1:
+            fanout = self.fanouts[block_id] = gsw.SourceFanOut(builder_id=block_id, source_ids=source_ids,
+                                                               verbose=args.v)
+            for element in fanout.elements:
+                self.pipeline.add(element)
+            fanout.link_elements()
+            fanout.link_muxer(self.streammux)
+            decoded_handler = gsw.DecodeBinHandler(next_element=fanout.tee, scr_pad=decoder_srcpad)
+        else:
+            decoded_handler = gsw.StreamMuxHandler(next_element=self.streammux, scr_pad=decoder_srcpad, index=i)
+        self.mux_handlers[block_id] = decoded_handler
+
+        if nvutils.is_aarch64():
+            rtsp_bin.rtspsrc.connect("pad-added", decoded_handler.on_pad_added)
+            rtsp_bin.rtspsrc.connect("pad-removed", decoded_handler.on_pad_removed)
+        else:
+            rtsp_bin.decoder.connect("pad-added", decoded_handler.on_pad_added)
+            rtsp_bin.decoder.connect("pad-removed", decoded_handler.on_pad_removed)
+
+        if 'decode' in admission_stages:
+            admission_controller.attach(i, rtsp_bin.decoder.get_static_pad("sink"), stage='decode')
+
+        if len(source_ids) > 1:
+            for source_id in source_ids:
+                # Sources slower than the shared decoder are decimated further on their branch
+                if sources.analytics_fps[source_id] and sources.analytics_fps[source_id] != block_fps:
+                    decimator = decimation.FrameDecimator(sources.analytics_fps[source_id])
+                    fanout.src_pad(source_id).add_probe(Gst.PadProbeType.BUFFER, decimator.probe, 0)
+                if 'mux' in admission_stages:
+                    admission_controller.attach(source_id, fanout.src_pad(source_id), stage='mux')
+        elif 'mux' in admission_stages:
+            if nvutils.is_aarch64():
+                admission_controller.attach(i, rtsp_bin.decoder.get_static_pad("src"), stage='mux')
+            else:
+                rtsp_bin.decoder.connect("pad-added", lambda decodebin, pad, source_id=i:
+                                         admission_controller.attach(source_id, pad, stage='mux'))
+        return rtsp_bin
+
+    def remove(self, block_id: int) -> None:
+        """
+        Removes the RTSPBin of an unshared source from the running pipeline, its muxer pad is released
+        :param block_id: RTSPBin builder id
+        :return: None
+        """
+        # The pads of rtspsrc are removed at NULL, the handlers still need the block
+        for element in self.rtsp_blocks[block_id].elements:
+            element.set_state(Gst.State.NULL)
+            self.pipeline.remove(element)
+        self.rtsp_blocks.pop(block_id)
+        self.mux_handlers.pop(block_id).destroy_sink_pad()
+        for source_id in self.groups.pop(block_id):
+            self.recorders.pop(source_id, None)
+
+
+class GenerationBuilder:
+
+    def __init__(self, args, sources: SourceTable, mux_size: tuple, models_batch: dict, effective_configs: str = None,
+                 parser_overrides: dict = None, tracker_config: str = None, files: bool = False,
+                 inventory_slots: bool = False, pipeline_metrics=None, probe_instruments: list = (),
+                 analytics_engine=None, analytics_gie_id: int = 1, shm_writers: dict = None,
+                 snapshot_service=None, tensor_recorder=None):
+        """
+        Builds the generations of the pipeline. The Python consumers (shared memory, snapshots, analytics, metrics)
+        are created once and shared by the generations. Nothing is read from the caller while building, a standby
+        generation is built on a worker thread.
+        :param args:              command line arguments
+        :param sources:           SourceTable, every build reads a snapshot of it
+        :param mux_size:          nvstreammux (width, height)
+        :param models_batch:      gie id -> batch size
+        :param effective_configs: directory of the effective nvinfer configs
+        :param parser_overrides:  gie id -> nvinfer config keys of the NumPy parser
+        :param tracker_config:    nvtracker low-level config file, None for the library defaults
+        :param files:             offline mode, the slots are filled by offline.FileSourcePool
+        :param inventory_slots:   camera inventory mode, sources are never shared
+        :param pipeline_metrics:  metrics.PipelineMetrics
+        :param probe_instruments: wrappers of the probes, see instrument
+        :param analytics_engine:  analytics.AnalyticsEngine
+        :param analytics_gie_id:  gie id of the objects of the analytics rules
+        :param shm_writers:       source id -> shm_ring writer, filled by the export probe
+        :param snapshot_service:  snapshots.SnapshotService
+        :param tensor_recorder:   bbox_parser.TensorRecorder
+        """
+        self.args = args
+        self.sources = sources
+        self.mux_size = mux_size
+        self.models_batch = models_batch
+        self.effective_configs = effective_configs
+        self.parser_overrides = parser_overrides or {}
+        self.tracker_config = tracker_config
+        self.files = files
+        self.inventory_slots = inventory_slots
+        self.pipeline_metrics = pipeline_metrics
+        self.probe_instruments = probe_instruments
+        self.analytics_engine = analytics_engine
+        self.analytics_gie_id = analytics_gie_id
+        self.shm_writers = shm_writers if shm_writers is not None else {}
+        self.snapshot_service = snapshot_service
+        self.tensor_recorder = tensor_recorder
+
+        self.n_sources = len(sources.locations)
+        self.tiler_rows = int(self.n_sources ** 0.5)
+        self.tiler_columns = int(np.math.ceil((1.0 * self.n_sources) / self.tiler_rows))
+        self.batched_push_timeout = 10
+        self.attach_sys_ts = 1
+        self.tracker_batch_process = 1
+        self.tracker_display_id = 1
+        self.tracker_path = None
+        if args.tracker in TRACKER_LIBS:
+            self.tracker_path = os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib',
+                                             f'{TRACKER_LIBS[args.tracker]}.so')
+
+    def prepare(self, paths: dict) -> dict:
+        """
+        :param paths: gie id -> nvinfer config file
+        :return: gie id -> configs.NvInferConfig of the file nvinfer has to load
+        """
+        return prepare_models(paths, self.models_batch, output_dir=self.effective_configs,
+                              overrides=self.parser_overrides, verbose=self.args.v)
+
+    def build(self, number: int, prepared: dict) -> standby.Generation:
+        """
+        One generation of the pipeline: elements, RTSP blocks and their per-pipeline helpers
+        :param number:   generation number, 0 for the first pipeline, standby pipelines count up
+        :param prepared: gie id -> configs.NvInferConfig, see prepare
+        :return: standby.Generation, gate pad on the muxer output
+        """
+        args = self.args
+        files = self.files
+        width, height = self.mux_size
+        n_sources = self.n_sources
+        pipeline_metrics = self.pipeline_metrics
+        probe_instruments = self.probe_instruments
+        output_width, output_height = OUTPUT_SIZE
+        sources = self.sources.snapshot()
+        models_config = {gie_id: config.path for gie_id, config in prepared.items()}
+        classes = model_classes(prepared)
+
+        # Init GStreamer pipeline
+        pipeline = Gst.Pipeline.new(f'rtsp_client_{number}')
+
+        # Init streammuxer
+        streammux = Gst.ElementFactory.make("nvstreammux", "stream_muxer")
+        streammux.set_property('live-source', int(not files))
+
+        streammux.set_property('width', width)
+        streammux.set_property('height', height)
+        streammux.set_property('enable-padding', int(args.mux_padding))
+        streammux.set_property('batch-size', n_sources)
+        streammux.set_property('batched-push-timeout', self.batched_push_timeout)
+        streammux.set_property('attach-sys-ts', self.attach_sys_ts)
+        pipeline.add(streammux)
+
+        # Late frames of a source are dropped, so a slow decoder or a burst of one camera does not stall the muxer
+        admission_controller = None
+        admission_stages = ()
+        if args.latency_budget > 0:
+            admission_controller = admission.AdmissionController(budget=args.latency_budget, metrics=pipeline_metrics,
+                                                                 verbose=args.v)
+            admission_stages = admission.STAGES if args.admission_stage == 'both' else (args.admission_stage,)
+
+        # Init multiple RTSP sources
+        blocks = SourceBlocks(pipeline, streammux, args, admission_controller, admission_stages)
+        if files:
+            # File slots are filled by offline.FileSourcePool before the pipeline starts
+            groups = {}
+        elif self.inventory_slots:
+            # Inventory cameras are never shared, a camera is added or removed without touching the others
+            groups = {slot: [slot] for slot, location in enumerate(sources.locations) if location is not None}
+        else:
+            groups = dict(enumerate(gsw.group_sources(sources.locations, share=not args.no_source_sharing)))
+        for block_id, source_ids in groups.items():
+            blocks.add(block_id, source_ids, sources)
+
+        # Connected sources without new frames, a frozen camera or a stuck decoder, are reconnected alone
+        stall_watchdog = None
+        if not files and (any(sources.stall_timeouts) or self.inventory_slots):
+            deadlines = watchdog.block_deadlines(sources.stall_timeouts, blocks.groups)
+            stall_watchdog = watchdog.StallWatchdog(blocks.rtsp_blocks, deadlines, sources=blocks.groups,
+                                                    metrics=pipeline_metrics, verbose=args.v)
+            stall_watchdog.attach()
+
+        # Primary GPU inference engine - pgie
+        pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
+        pgie.set_property('config-file-path', models_config.get(1))
+        pgie.set_property("batch-size", self.models_batch.get(1))
+        pgie.set_property("interval", args.pgie_interval)
+
+        # Secondary GPU inference engine - sgie0
+        sgie0 = Gst.ElementFactory.make("nvinfer", "secondary-gie0")
+        sgie0.set_property('config-file-path', models_config.get(2))
+        sgie0.set_property("batch-size", self.models_batch.get(2))
+        sgie0.set_property("interval", args.sgie_interval)
+        # Both DashCamNet configs are told apart from PeopleNet objects by the component id
+        sgie0.set_property("unique-id", 2)
+
+        # Object tracking
+        cpu_tracker = None
+        if args.tracker == 'cpu':
+            # Pass-through element, its src pad probe assigns the object ids
+            nvtracker = Gst.ElementFactory.make("identity", "cpu_tracker")
+            nvtracker.set_property('silent', True)
+            # Settings counted in frames keep their duration at the decimated rate of the source
+            source_kwargs = {i: {key: decimation.scale_frames(value, interval)
+                                 for key, value in CPU_TRACKER_KWARGS.items()}
+                             for i, interval in enumerate(sources.drop_intervals) if interval > 1}
+            cpu_tracker = tracking.MultiStreamTracker(source_kwargs=source_kwargs, **CPU_TRACKER_KWARGS)
+            nvtracker.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                      instrument(probe_instruments, 'cpu_tracker',
+                                                                 cpu_tracker_probe(cpu_tracker)), 0)
+        else:
+            nvtracker = Gst.ElementFactory.make("nvtracker", "nvtracker0")
+            nvtracker.set_property('tracker-width', args.tracker_width)
+            nvtracker.set_property('tracker-height', args.tracker_height)
+            nvtracker.set_property('ll-lib-file', self.tracker_path)
+            if self.tracker_config is not None:
+                nvtracker.set_property('ll-config-file', self.tracker_config)
+            nvtracker.set_property('enable-batch-process', self.tracker_batch_process)
+            nvtracker.set_property('display-tracking-id', self.tracker_display_id)
+
+        pipeline.add(pgie)
+        pipeline.add(sgie0)
+        pipeline.add(nvtracker)
+
+        if args.d:
+            # Combine streams to one array
+            tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
+            tiler.set_property("rows", self.tiler_rows)
+            tiler.set_property("columns", self.tiler_columns)
+            tiler.set_property("width", output_width)
+            tiler.set_property("height", output_height)
+
+            # nvvidconv convertor
+            nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
+
+            # Add capsfilter
+            capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
+            capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
+
+            nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
+            pipeline.add(tiler)
+            pipeline.add(nvvidconv)
+            pipeline.add(capsfilter)
+            pipeline.add(nvosd)
+            if nvutils.is_aarch64():
+                transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
+                pipeline.add(transform)
+            sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
+            sink.set_property('sync', int(not files))
+        else:
+            # Headless: the pipeline ends right after the last analytics element, no composition or color conversion
+            sink = gsw.make_metadata_sink()
+        pipeline.add(sink)
+
+        logging.info("Linking elements in the Pipeline")
+
+        if args.cascade:
+            # Tracker goes before the secondary so that object ids are known to the re-inference gate
+            streammux.link(pgie)
+            pgie.link(nvtracker)
+            nvtracker.link(sgie0)
+            last_element = sgie0
+            # network-type 0: nvinfer keeps no per-track results of a secondary detector, the gate attaches them
+            sgie0_detector = prepared[2].get_int('network-type', 0) == 0
+            # sgie0 runs on PeopleNet Person crops
+            reinfer_gate = cascade.ReinferGate(operate_on_gie_id=1,
+                                               operate_on_class_ids=(0,),
+                                               reinfer_interval=args.reinfer_interval,
+                                               reattach=sgie0_detector,
+                                               verbose=args.v)
+            reinfer_gate.attach(sgie0)
+        elif args.parallel:
+            # pgie branch continues to the tracker, sgie0 branch ends after inference, objects merge before the tracker
+            models_tee = Gst.ElementFactory.make("tee", "models_tee")
+            pgie_queue = Gst.ElementFactory.make("queue", "pgie_queue")
+            sgie0_queue = Gst.ElementFactory.make("queue", "sgie0_queue")
+            sgie0_sink = gsw.make_metadata_sink('sgie0_sink')
+            for element in (models_tee, pgie_queue, sgie0_queue, sgie0_sink):
+                pipeline.add(element)
+            streammux.link(models_tee)
+            models_tee.link(pgie_queue)
+            models_tee.link(sgie0_queue)
+            pgie_queue.link(pgie)
+            pgie.link(nvtracker)
+            sgie0_queue.link(sgie0)
+            sgie0.link(sgie0_sink)
+            last_element = nvtracker
+            metadata_merger = metamerge.MetadataMerger(verbose=args.v)
+            metadata_merger.add_branch(sgie0)
+            metadata_merger.attach(nvtracker.get_static_pad("sink"))
+        else:
+            streammux.link(pgie)
+            pgie.link(sgie0)
+            sgie0.link(nvtracker)
+            last_element = nvtracker
+
+        if args.fuse and not args.cascade:
+            # Objects of both models are in the frames before the tracker, after the parallel branches merge
+            taxonomy = fusion.Taxonomy({1: classes['pgie']['names'], 2: classes['sgie0']['names']})
+            nvtracker.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                                       instrument(probe_instruments, 'fusion',
+                                                                  fusion_probe(taxonomy, args.fusion_iou)), 0)
+
+        if self.analytics_engine is not None:
+            last_element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                         instrument(probe_instruments, 'analytics',
+                                                                    analytics_probe(self.analytics_engine,
+                                                                                    self.analytics_gie_id,
+                                                                                    self.mux_size, args.mux_padding,
+                                                                                    stream_time=files)), 0)
+
+        # Side branches converting frames for Python consumers
+        frame_branches = []
+        if args.shm_export:
+            shm_width, shm_height = output_width // 2, output_height // 2
+            shm_branch = gsw.FrameBranch('shm_export', width=shm_width, height=shm_height, verbose=args.v)
+            shm_branch.src_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                         instrument(probe_instruments, 'shm_export',
+                                                    shm_export_probe(self.shm_writers, shm_width, shm_height,
+                                                                     scale=(shm_width / width, shm_height / height),
+                                                                     interval=args.shm_interval)),
+                                         0)
+            frame_branches.append(shm_branch)
+        if self.snapshot_service is not None:
+            # Requests are recorded from metadata only, frames are mapped in the branch only when requested
+            snapshot_width, snapshot_height = output_width // 2, output_height // 2
+            last_element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                         instrument(probe_instruments, 'snapshot_request',
+                                                                    snapshot_request_probe(self.snapshot_service,
+                                                                                           **SNAPSHOT_RULE)), 0)
+            snapshot_branch = gsw.FrameBranch('snapshot', width=snapshot_width, height=snapshot_height, verbose=args.v)
+            snapshot_branch.src_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                              instrument(probe_instruments, 'snapshot_frame',
+                                                         snapshot_frame_probe(self.snapshot_service)), 0)
+            frame_branches.append(snapshot_branch)
+
+        if frame_branches:
+            # Analytics continue through the queue, frame branches never block them
+            tee = Gst.ElementFactory.make("tee", "analytics_tee")
+            main_queue = Gst.ElementFactory.make("queue", "analytics_queue")
+            pipeline.add(tee)
+            pipeline.add(main_queue)
+            last_element.link(tee)
+            tee.link(main_queue)
+            for branch in frame_branches:
+                branch.add_to(pipeline)
+                branch.link_from(tee)
+            last_element = main_queue
+
+        if args.d:
+            last_element.link(tiler)
+            tiler.link(nvvidconv)
+            nvvidconv.link(capsfilter)
+            capsfilter.link(nvosd)
+            if nvutils.is_aarch64():
+                nvosd.link(transform)
+                transform.link(sink)
+            else:
+                nvosd.link(sink)
+        else:
+            last_element.link(sink)
+
+        # Probe for inference description
+        pgie_src_pad = pgie.get_static_pad("src")
+        if args.bbox_parser == 'numpy':
+            # Objects are attached before any other probe or element sees the batch
+            pgie_decoder = bbox_parser.DetectNetDecoder.from_config(prepared[1], output_size=self.mux_size)
+            pgie_src_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                   instrument(probe_instruments, 'bbox_parser',
+                                              bbox_parser_probe(pgie_decoder, 1, classes['pgie']['names'],
+                                                                self.tensor_recorder)), 0)
+        pgie_src_pad.add_probe(Gst.PadProbeType.BUFFER,
+                               instrument(probe_instruments, 'det_buffer_pgie',
+                                          det_buffer_probe('pgie', classes['pgie'], self.mux_size,
+                                                           args.mux_padding)), 0)
+        if blocks.recorders:
+            pgie_src_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                   instrument(probe_instruments, 'record_trigger',
+                                              record_trigger_probe(blocks.recorders, **RECORD_RULE)), 0)
+
+        if pipeline_metrics is not None:
+            last_element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                         batch_metrics_probe(pipeline_metrics, n_sources), 0)
+        return standby.Generation(number, pipeline, streammux.get_static_pad("src"),
+                                  {'models_config': models_config, 'classes': classes, 'streammux': streammux,
+                                   'blocks': blocks, 'rtsp_blocks': blocks.rtsp_blocks,
+                                   'stall_watchdog': stall_watchdog, 'admission_controller': admission_controller,
+                                   'cpu_tracker': cpu_tracker, 'output_pad': last_element.get_static_pad("src")})
+
+
+class LiveGenerations:
+
+    def __init__(self, builder: GenerationBuilder, loop, pipeline_diagnostics, pipeline_metrics=None):
+        """
+        Camera mode: the running generation with its RTSPHandler, restarts and model swaps on a warm standby
+        generation
+        :param builder:              GenerationBuilder
+        :param loop:                 GLib main loop of the RTSPHandler bus watches
+        :param pipeline_diagnostics: diagnostics.PipelineDiagnostics, follows the active generation
+        :param pipeline_metrics:     metrics.PipelineMetrics
+        """
+        self.builder = builder
+        self.loop = loop
+        self.pipeline_diagnostics = pipeline_diagnostics
+        self.pipeline_metrics = pipeline_metrics
+        self.warm_standby = None
+
+    @property
+    def active(self) -> standby.Generation:
+        return self.warm_standby.active
+
+    def start(self, generation: standby.Generation, ready_timeout: float, drain_timeout: float) -> None:
+        """
+        Activates the first generation, the next ones are prepared by swap
+        :param generation:    running standby.Generation
+        :param ready_timeout: see standby.WarmStandby
+        :param drain_timeout: see standby.WarmStandby
+        :return: None
+        """
+        self.activate(generation)
+        self.warm_standby = standby.WarmStandby(self.build, self.activate, self.retire, generation,
+                                                ready_timeout=ready_timeout, drain_timeout=drain_timeout,
+                                                verbose=self.builder.args.v)
+
+    def activate(self, generation: standby.Generation) -> None:
+        args = self.builder.args
+        # Init RTSPHandler: bus watch, flow check and connection metrics, the blocks link their rtspsrc pads
+        generation.context['rtsp_handler'] = gsw.RTSPHandler(pipeline=generation.pipeline,
+                                                             loop=self.loop,
+                                                             basic_blocks=generation.context['rtsp_blocks'],
+                                                             metrics=self.pipeline_metrics,
+                                                             link_pads=False,
+                                                             **{'rtsp': {'addr': args.ip, 'port': args.port}}
+                                                             )
+        if generation.context['stall_watchdog'] is not None:
+            generation.context['stall_watchdog'].start()
+        self.pipeline_diagnostics.pipeline = generation.pipeline
+        if self.pipeline_metrics is not None:
+            self.pipeline_metrics.watch_pipeline(generation.pipeline)
+
+    @staticmethod
+    def retire(generation: standby.Generation) -> None:
+        generation.context['rtsp_handler'].close()
+        if generation.context['stall_watchdog'] is not None:
+            generation.context['stall_watchdog'].stop()
+        if generation.context['admission_controller'] is not None:
+            generation.context['admission_controller'].log_report()
+
+    def build(self, number: int, **overrides) -> standby.Generation:
+        """
+        Standby generation with the models of the active one, overrides replace some of them. Called on a worker
+        thread: the active generation changes only after this build, the sources are read from a snapshot.
+        :param number:    generation number
+        :param overrides: model name -> nvinfer config file
+        :return: standby.Generation
+        """
+        unknown = set(overrides) - set(MODEL_GIE_IDS)
+        if unknown:
+            raise ValueError(f'Unknown models {sorted(unknown)}, expected {sorted(MODEL_GIE_IDS)}')
+        paths = dict(self.warm_standby.active.context['models_config'])
+        paths.update({MODEL_GIE_IDS[name]: path for name, path in overrides.items()})
+        return self.builder.build(number, self.builder.prepare(paths))
+
+    def swap_command(self, argument: str) -> str:
+        return self.warm_standby.swap(**standby.parse_overrides(argument))
+
+    def restart(self) -> bool:
+        self.warm_standby.swap()
+        return True
+
+
+class InventoryController:
+
+    def __init__(self, generations: LiveGenerations, sources: SourceTable, camera_slots: inventory.SlotTable,
+                 analytics_engine=None, pipeline_metrics=None, verbose: bool = True):
+        """
+        Applies the changes of the camera inventory to the active generation on the main loop
+        :param generations:      LiveGenerations
+        :param sources:          SourceTable of the muxer slots
+        :param camera_slots:     inventory.SlotTable
+        :param analytics_engine: analytics.AnalyticsEngine, forgets the state of a removed camera
+        :param pipeline_metrics: metrics.PipelineMetrics
+        :param verbose:
+        """
+        self.generations = generations
+        self.sources = sources
+        self.camera_slots = camera_slots
+        self.analytics_engine = analytics_engine
+        self.pipeline_metrics = pipeline_metrics
+        self.verbose = verbose
+
+    def remove_camera(self, camera_id: str) -> None:
+        slot = self.camera_slots.release(camera_id)
+        if slot is None:
+            return
+        context = self.generations.active.context
+        if context['stall_watchdog'] is not None:
+            context['stall_watchdog'].remove(slot)
+        context['blocks'].remove(slot)
+        context['rtsp_handler'].remove_block(slot)
+        if context['cpu_tracker'] is not None:
+            context['cpu_tracker'].remove(slot)
+        if self.analytics_engine is not None:
+            self.analytics_engine.remove(slot)
+        self.sources.clear(slot)
+        if self.verbose:
+            logging.info(f'Inventory: camera {camera_id} removed from slot {slot}')
+
+    def add_camera(self, camera: inventory.Camera) -> bool:
+        """
+        :return: False if every slot is taken
+        """
+        slot = self.camera_slots.assign(camera.id)
+        if slot is None:
+            return False
+        self.sources.set_camera(slot, camera)
+        sources = self.sources.snapshot()
+        stream_fps[f'stream{slot}'].rtsp_fps = sources.rates[slot]
+        if self.pipeline_metrics is not None:
+            self.pipeline_metrics.target_fps.labels(source=slot).set(sources.rates[slot])
+        context = self.generations.active.context
+        if context['cpu_tracker'] is not None:
+            context['cpu_tracker'].source_kwargs[slot] = {
+                key: decimation.scale_frames(value, max(1, sources.drop_intervals[slot]))
+                for key, value in CPU_TRACKER_KWARGS.items()}
+        rtsp_bin = context['blocks'].add(slot, [slot], sources)
+        context['rtsp_handler'].add_block(slot, rtsp_bin)
+        if context['stall_watchdog'] is not None:
+            context['stall_watchdog'].add(slot, sources.stall_timeouts[slot], [slot])
+        for element in reversed(rtsp_bin.elements):
+            element.sync_state_with_parent()
+        if self.verbose:
+            logging.info(f'Inventory: camera {camera.id} added to slot {slot}, {inventory.display_url(camera.url)}')
+        return True
+
+    def apply(self, diff: inventory.InventoryDiff, new: inventory.Inventory) -> None:
+        # Changed cameras reconnect with their new settings, the others keep running
+        for camera_id in diff.removed + diff.changed:
+            self.remove_camera(camera_id)
+        unplaced = [camera.id for camera in new.enabled
+                    if camera.id not in self.camera_slots.slots and not self.add_camera(camera)]
+        if unplaced:
+            logging.warning(f'Inventory: {len(unplaced)} enabled cameras without a muxer slot, '
+                            f'-inventory_slots {self.camera_slots.n_slots}: {unplaced[:10]}')
+
+
 def main():
     args = utils.parse_arguments()
     if args.v:
         utils.set_logging()
+    if args.cascade and args.parallel:
+        raise ValueError('-cascade and -parallel are exclusive: the cascade secondary needs the primary objects')
+    pipeline_metrics = metrics.PipelineMetrics() if args.metrics_port else None
+    # The profiler is applied last, it also measures the metrics wrapper
+    probe_profiler = gsw.ProbeProfiler(objects=count_batch_objects, verbose=args.v) if args.profile_probes else None
+    probe_instruments = [i for i in (pipeline_metrics, probe_profiler) if i is not None]
 
     rtsp_sources = [f'rtsp://{args.ip}:{args.port}/{name}' for name in args.name]
-    print(rtsp_sources)
-
-    stream_multiplier = 1
-    width, height = 1920, 1080
-    batched_push_timeout = 10
-    attach_sys_ts = 1
-    n_sources = len(rtsp_sources) * stream_multiplier
-    tiler_rows = int(n_sources ** 0.5)
-    tiler_columns = int(np.math.ceil((1.0 * n_sources) / tiler_rows))
+    # Offline mode: recorded files instead of the cameras, each muxer pad is a slot taking the next file
+    checkpoint = None
+    files = []
+    if args.files:
+        if args.record_dir is not None or args.latency_budget > 0:
+            raise ValueError('-files has no clip recording and no late frames: -record_dir and -latency_budget '
+                             'are for cameras')
+        checkpoint = offline.Checkpoint(args.checkpoint)
+        files = [path for path in offline.list_files(args.files) if not checkpoint.is_finished(path)]
+        if not files:
+            logging.info('No files left to process')
+            return 0
+        rtsp_sources = [f'file://{path}' for path in files[:args.file_slots]]
+    # Camera inventory: each enabled camera takes a muxer slot, cameras added while running take the free ones
+    camera_inventory = None
+    camera_slots = None
+    source_codecs = [args.codec] * len(rtsp_sources)
+    if args.inventory is not None:
+        if args.files:
+            raise ValueError('-inventory and -files are exclusive')
+        camera_inventory = inventory.load_inventory(args.inventory)
+        camera_slots = inventory.SlotTable(args.inventory_slots or len(camera_inventory.enabled))
+        if not camera_slots.n_slots:
+            raise ValueError(f'Inventory {args.inventory} has no enabled cameras, -inventory_slots reserves slots '
+                             f'for cameras added later')
+        rtsp_sources = [None] * camera_slots.n_slots
+        source_codecs = [args.codec] * camera_slots.n_slots
+        unplaced = []
+        for camera in camera_inventory.enabled:
+            slot = camera_slots.assign(camera.id)
+            if slot is None:
+                unplaced.append(camera.id)
+                continue
+            rtsp_sources[slot] = camera.url
+            source_codecs[slot] = camera.codec
+        if unplaced:
+            logging.warning(f'Inventory: {len(unplaced)} enabled cameras without a muxer slot, '
+                            f'-inventory_slots {camera_slots.n_slots}: {unplaced[:10]}')
+    print([inventory.display_url(source) if source else source for source in rtsp_sources])
 
     # Models configs
     config_folder = os.path.join('..', 'configs')
@@ -142,161 +1190,203 @@ def main():
     models_batch = {1: n_sources,
                     2: 1,
                     }
+    if args.cascade:
+        # sgie0 runs on PeopleNet Person crops, its batch is sized by objects, not frames
+        models_config[2] = os.path.join(config_folder, 'sgie_dashcamnet.txt')
+        models_batch[2] = cascade.secondary_batch_size(n_sources, args.sgie_objects)
+    elif args.parallel:
+        # sgie0 runs on full frames next to pgie, not after it
+        models_batch[2] = n_sources
+    if args.fuse and not args.cascade:
+        # Persons of DashCamNet are not filtered out, fusion keeps one object per person
+        models_config[2] = os.path.join(config_folder, 'pgie_dashcamnet.txt')
+
+    # The NumPy parser needs a pgie config with nvinfer parsing disabled, effective configs are always written
+    effective_configs = args.effective_configs
+    if args.bbox_parser == 'numpy' and effective_configs is None:
+        effective_configs = tempfile.mkdtemp(prefix='nvinfer_')
+    if args.record_tensors is not None and args.bbox_parser != 'numpy':
+        raise ValueError('-record_tensors records the tensors of -bbox_parser numpy')
+    parser_overrides = {1: bbox_parser.PARSER_OVERRIDES} if args.bbox_parser == 'numpy' else {}
+
+    models_nvinfer = prepare_models(models_config, models_batch, output_dir=effective_configs,
+                                    overrides=parser_overrides, verbose=args.v)
+
+    # Muxer output at the input size of the full-frame models, never above the native size of the sources
+    if args.mux_size != 'auto':
+        width, height = resolution.parse_size(args.mux_size)
+    else:
+        model_sizes = [models_nvinfer[gie_id].input_size for gie_id in models_nvinfer
+                       if not (args.cascade and gie_id != 1)]
+        unique_sources = list(collections.OrderedDict.fromkeys(source for source in rtsp_sources if source))
+        source_sizes = resolution.discover_source_sizes(unique_sources)
+        if len(source_sizes) < len(unique_sources):
+            logging.warning(f'Native size of {len(unique_sources) - len(source_sizes)} sources is unknown')
+        width, height = resolution.muxer_resolution(model_sizes, list(source_sizes.values()))
+    if args.v:
+        logging.info(f'nvstreammux {width}x{height}, padding {args.mux_padding}')
+    mux_size = (width, height)
+
+    # Per-source analytics frame rate, the decoders drop the other frames before the muxer
+    sources = SourceTable(rtsp_sources, source_codecs, decimation.source_rates(args.analytics_fps, n_sources),
+                          watchdog.source_deadlines(args.stall_timeout, n_sources), args.source_fps)
+    if camera_inventory is not None:
+        for camera_id, slot in camera_slots.slots.items():
+            sources.set_camera(slot, camera_inventory.get(camera_id))
+    if args.v and any(sources.drop_intervals):
+        logging.info('Analytics fps per source: ' + ', '.join(f'{i}: {fps:g}' for i, fps in enumerate(sources.rates)))
 
     # Tracker
-    tracker_algs = ('libnvds_nvdcf', 'libnvds_mot_iou', 'libnvds_mot_klt')
-    tracker = tracker_algs[0]
-    tracker_config = os.path.join(config_folder, 'tracker_config.yml')
-    tracker_wh = 1024
-    tracker_batch_process = 1
-    tracker_display_id = 1
-    tracker_path = os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib', f'{tracker}.so')
+    # Settings counted in frames keep their duration at the decimated rate, the fastest source sets it for nvtracker
+    tracker_interval = min(max(1, interval) for interval in sources.drop_intervals)
+    tracker_config = None
+    if args.tracker == 'nvdcf':
+        # IOU and KLT libraries run with their defaults
+        tracker_config = os.path.join(config_folder, 'tracker_config.yml')
+        if args.effective_configs is not None or tracker_interval > 1:
+            nvdcf_config = configs.load_tracker_config(tracker_config)
+            tracker_config = nvdcf_config.effective(args.effective_configs or tempfile.mkdtemp(prefix='tracker_'),
+                                                    decimation.nvdcf_overrides(nvdcf_config, tracker_interval))
+
+    # Shared memory export
+    shm_writers = {}
+
+    # Detection snapshots
+    snapshot_width, snapshot_height = OUTPUT_SIZE[0] // 2, OUTPUT_SIZE[1] // 2
+    snapshot_service = None
+    if args.snapshot_dir is not None:
+        snapshot_service = snapshots.SnapshotService(output_dir=args.snapshot_dir,
+                                                     scale=(snapshot_width / width, snapshot_height / height),
+                                                     verbose=args.v)
 
     Gst.debug_set_active(bool(args.debug_level))
     Gst.debug_set_default_threshold(args.debug_level)
     GObject.threads_init()
     Gst.init(None)
 
-    # Init GStreamer pipeline
-    pipeline = Gst.Pipeline.new('rtsp_client')
-
-    # Init streammuxer
-    streammux = Gst.ElementFactory.make("nvstreammux", "stream_muxer")
-    streammux.set_property('live-source', 1)
-
-    streammux.set_property('width', width)
-    streammux.set_property('height', height)
-    streammux.set_property('batch-size', n_sources)
-    streammux.set_property('batched-push-timeout', batched_push_timeout)
-    streammux.set_property('attach-sys-ts', attach_sys_ts)
-    pipeline.add(streammux)
-
-    # Init multiple RTSP sources
-    rtsp_blocks = {}
+    # Per-source state shared by the pipeline generations
     for i in range(n_sources):
-
-        rtsp_bin = gsw.RTSPBin(builder_id=i, location=rtsp_sources[i], compression=args.codec)
-        rtsp_blocks.update({i: rtsp_bin})
-
         stream_fps.update({f'stream{i}': nvutils.GetFPS(stream_id=i,
                                                         seconds=5,
                                                         save_log=False,
                                                         model_name=__file__,
-                                                        rtsp_fps=30,
+                                                        rtsp_fps=sources.rates[i],
                                                         )
                            }
                           )
 
-        if nvutils.is_aarch64():
-            pipeline.add(rtsp_bin.rtspsrc)
-            pipeline.add(rtsp_bin.depayer)
-            pipeline.add(rtsp_bin.parser)
-            pipeline.add(rtsp_bin.decoder)
-
-            rtsp_bin.depayer.link(rtsp_bin.parser)
-            rtsp_bin.parser.link(rtsp_bin.decoder)
-
-            decoder_srcpad = rtsp_bin.decoder.get_static_pad("src")
-            streammux_handler = gsw.StreamMuxHandler(next_element=streammux, scr_pad=decoder_srcpad, index=i)
-            rtsp_bin.rtspsrc.connect("pad-added", streammux_handler.on_pad_added)
-            rtsp_bin.rtspsrc.connect("pad-removed", streammux_handler.on_pad_removed)
-        else:
-            pipeline.add(rtsp_bin.rtspsrc)
-            pipeline.add(rtsp_bin.decoder)
-            streammux_handler = gsw.StreamMuxHandler(next_element=streammux, index=i)
-            rtsp_bin.decoder.connect("pad-added", streammux_handler.on_pad_added)
-            rtsp_bin.decoder.connect("pad-removed", streammux_handler.on_pad_removed)
-
-    # Primary GPU inference engine - pgie
-    pgie = Gst.ElementFactory.make("nvinfer", "primary-inference")
-    pgie.set_property('config-file-path', models_config.get(1))
-    pgie.set_property("batch-size", models_batch.get(1))
-
-    # Secondary GPU inference engine - sgie0
-    sgie0 = Gst.ElementFactory.make("nvinfer", "secondary-gie0")
-    sgie0.set_property('config-file-path', models_config.get(2))
-    sgie0.set_property("batch-size", models_batch.get(2))
-
-    # Object tracking
-    nvtracker = Gst.ElementFactory.make("nvtracker", "nvtracker0")
-    nvtracker.set_property('tracker-width', tracker_wh)
-    nvtracker.set_property('tracker-height', tracker_wh)
-    nvtracker.set_property('ll-lib-file', tracker_path)
-    nvtracker.set_property('ll-config-file', tracker_config)
-    nvtracker.set_property('enable-batch-process', tracker_batch_process)
-    nvtracker.set_property('display-tracking-id', tracker_display_id)
-
-    # Combine streams to one array
-    tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
-    tiler.set_property("rows", tiler_rows)
-    tiler.set_property("columns", tiler_columns)
-    tiler.set_property("width", width)
-    tiler.set_property("height", height)
-
-    # nvvidconv convertor
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
-
-    # Add capsfilter
-    capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
-    capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
-
-    pipeline.add(pgie)
-    pipeline.add(sgie0)
-    pipeline.add(nvtracker)
-    pipeline.add(tiler)
-    pipeline.add(nvvidconv)
-    pipeline.add(capsfilter)
-
-    if args.d:
-        nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
-        pipeline.add(nvosd)
-        if nvutils.is_aarch64():
-            transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
-            pipeline.add(transform)
-        sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
-        sink.set_property('sync', 1)
-    else:
-        sink = Gst.ElementFactory.make("fakesink", 'fake_sink')
-    pipeline.add(sink)
+        if pipeline_metrics is not None:
+            pipeline_metrics.target_fps.labels(source=i).set(sources.rates[i])
 
-    logging.info("Linking elements in the Pipeline")
+    tensor_recorder = None
+    if args.record_tensors is not None:
+        tensor_recorder = bbox_parser.TensorRecorder(args.record_tensors, input_size=models_nvinfer[1].input_size)
 
-    streammux.link(pgie)
-    pgie.link(sgie0)
-    sgie0.link(nvtracker)
-    nvtracker.link(tiler)
-    tiler.link(nvvidconv)
-    nvvidconv.link(capsfilter)
+    analytics_engine = None
+    analytics_gie_id = 1
+    if args.analytics is not None:
+        analytics_rules = analytics.load_rules(args.analytics)
+        analytics_engine = analytics.AnalyticsEngine(analytics_rules)
+        analytics_gie_id = analytics_rules['gie_id']
 
-    if args.d:
-        capsfilter.link(nvosd)
-        if nvutils.is_aarch64():
-            nvosd.link(transform)
-            transform.link(sink)
-        else:
-            nvosd.link(sink)
+    builder = GenerationBuilder(args, sources, mux_size, models_batch, effective_configs=effective_configs,
+                                parser_overrides=parser_overrides, tracker_config=tracker_config,
+                                files=bool(files), inventory_slots=camera_inventory is not None,
+                                pipeline_metrics=pipeline_metrics, probe_instruments=probe_instruments,
+                                analytics_engine=analytics_engine, analytics_gie_id=analytics_gie_id,
+                                shm_writers=shm_writers, snapshot_service=snapshot_service,
+                                tensor_recorder=tensor_recorder)
+    active = builder.build(0, models_nvinfer)
+
+    metrics_server = None
+    if pipeline_metrics is not None:
+        pipeline_metrics.watch_pipeline(active.pipeline)
+        metrics_server = metrics.MetricsServer(pipeline_metrics.registry, port=args.metrics_port, verbose=args.v)
+        metrics_server.start()
+
+    # kill -USR1 <pid> or the "dump" control command writes the pipeline diagnostics
+    pipeline_diagnostics = diagnostics.PipelineDiagnostics(active.pipeline, output_dir=args.diagnostics_dir,
+                                                           verbose=args.v)
+
+    def _diagnostics_dump():
+        pipeline_diagnostics.dump(reason='SIGUSR1')
+        return True
+    GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, _diagnostics_dump)
+    control_server = None
+    if args.control_socket is not None:
+        control_server = diagnostics.ControlServer(pipeline_diagnostics, args.control_socket, verbose=args.v)
+        control_server.start()
+
+    if probe_profiler is not None:
+        def _profile_window():
+            probe_profiler.start_window(args.profile_window, args.profile_dir)
+            return True
+        # kill -USR2 <pid> profiles the probes for the next profile_window seconds
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR2, _profile_window)
+
+    loop = GObject.MainLoop()
+    generations = None
+    if files:
+        cpu_tracker = active.context['cpu_tracker']
+
+        def _file_done(slot, path):
+            # The last frame of the file passed the output pad, the next file of the slot is a new stream
+            if cpu_tracker is not None:
+                cpu_tracker.remove(slot)
+            if analytics_engine is not None:
+                analytics_engine.remove(slot)
+
+        file_pool = offline.FileSourcePool(active.pipeline, active.context['streammux'], files, n_slots=n_sources,
+                                           checkpoint=checkpoint, drop_intervals=sources.drop_intervals,
+                                           on_file_done=_file_done, verbose=args.v)
+        file_pool.attach(active.context['output_pad'])
+        file_pool.start()
+        file_pool.watch_bus(loop)
+        active.pipeline.set_state(Gst.State.PLAYING)
     else:
-        capsfilter.link(sink)
-
-    # Probe for inference description
-    pgie_src_pad = pgie.get_static_pad("src")
-    pgie_src_pad.add_probe(Gst.PadProbeType.BUFFER, det_buffer_probe('pgie'), 0)
-
-    # Init RTSPHandler
-    rtsp_handler = gsw.RTSPHandler(pipeline=pipeline,
-                                   loop=GObject.MainLoop(),
-                                   basic_blocks=rtsp_blocks,
-                                   **{'rtsp': {'addr': args.ip, 'port': args.port}}
-                                   )
+        # A new pipeline is prepared next to the running one, kill -HUP <pid> restarts with the same models
+        generations = LiveGenerations(builder, loop, pipeline_diagnostics, pipeline_metrics=pipeline_metrics)
+        generations.start(active, ready_timeout=args.standby_timeout, drain_timeout=args.drain_timeout)
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGHUP, generations.restart)
+        pipeline_diagnostics.add_command('swap', generations.swap_command,
+                                         'swap [pgie=<config>] [sgie0=<config>]  restart on a warm standby pipeline, '
+                                         'with new model configs')
+
+        if camera_inventory is not None:
+            inventory_controller = InventoryController(generations, sources, camera_slots,
+                                                       analytics_engine=analytics_engine,
+                                                       pipeline_metrics=pipeline_metrics, verbose=args.v)
+            # The file is polled for changes, the "reload" control command reloads it at once
+            inventory_watcher = inventory.InventoryWatcher(args.inventory, camera_inventory,
+                                                           inventory_controller.apply, verbose=args.v)
+            inventory_watcher.start()
+            pipeline_diagnostics.add_command('reload', inventory_watcher.request_reload,
+                                             'reload  reload the camera inventory file')
     try:
-        rtsp_handler.loop.run()
+        loop.run()
     except KeyboardInterrupt as e:
         logging.error(e)
     except Exception as e:
         logging.error(e)
 
-    pipeline.set_state(Gst.State.NULL)
-    del pipeline
+    if generations is not None:
+        active = generations.active
+    active.pipeline.set_state(Gst.State.NULL)
+    for writer in shm_writers.values():
+        writer.close()
+    if snapshot_service is not None:
+        snapshot_service.close()
+    if analytics_engine is not None:
+        analytics_engine.flush()
+    if metrics_server is not None:
+        metrics_server.close()
+    if control_server is not None:
+        control_server.close()
+    if active.context['admission_controller'] is not None:
+        active.context['admission_controller'].log_report()
+    if probe_profiler is not None:
+        logging.info(f'Probe profile:\n{probe_profiler.report()}')
+    del active
 
 
 if __name__ == '__main__':
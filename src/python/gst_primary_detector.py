@@ -8,12 +8,11 @@ gi.require_version('Gst', '1.0')
 gi.require_version('GstRtsp', '1.0')
 from gi.repository import GObject, Gst
 
-# Path for pyds library if python bindings are not installed
-sys.path.append(os.path.join('/', 'opt', 'nvidia', 'deepstream', 'deepstream', 'lib'))
-import pyds
-
 from common import nvutils
 from common import gstreamer_wrappers as gsw
+from common import configs
+from common import nvmeta
+from common import resolution
 from common import utils
 
 PGIE_CLASSES = ["Vehicle", "TwoWheeler", "Person", "RoadSign"]
@@ -23,6 +22,8 @@ PGIE_CLASS_ID_PERSON = 2
 PGIE_CLASS_ID_ROADSIGN = 3
 
 stream_fps = {}
+# nvstreammux output, boxes are printed in source resolution
+muxer = {'size': (1920, 1080), 'padding': False}
 
 
 def pgie_buffer_probe(pad, info, u_data):
@@ -31,24 +32,9 @@ def pgie_buffer_probe(pad, info, u_data):
         print("Unable to get GstBuffer ")
         return
 
-    # Retrieve batch metadata from the gst_buffer
-    # Note that pyds.gst_buffer_get_nvds_batch_meta() expects the
-    # C address of gst_buffer as input, which is obtained with hash(gst_buffer)
-    batch_meta = pyds.gst_buffer_get_nvds_batch_meta(hash(gst_buffer))
-    l_frame = batch_meta.frame_meta_list
-    while l_frame is not None:
-        try:
-            # Note that l_frame.data needs a cast to pyds.NvDsFrameMeta
-            # The casting is done by pyds.NvDsFrameMeta.cast()
-            # The casting also keeps ownership of the underlying memory
-            # in the C code, so the Python garbage collector will leave
-            # it alone.
-            frame_meta = pyds.NvDsFrameMeta.cast(l_frame.data)
-        except StopIteration:
-            break
-        frame_number = frame_meta.frame_num
-        l_obj = frame_meta.obj_meta_list
-        num_rects = frame_meta.num_obj_meta
+    for frame_meta, obj_metas in nvmeta.batch_objects(nvmeta.batch_meta(gst_buffer)):
+        sx, sy = resolution.source_scale(frame_meta.source_frame_width, frame_meta.source_frame_height,
+                                         *muxer['size'], padding=muxer['padding'])
         obj_counter = {
             PGIE_CLASS_ID_VEHICLE: 0,
             PGIE_CLASS_ID_PERSON: 0,
@@ -56,51 +42,27 @@ def pgie_buffer_probe(pad, info, u_data):
             PGIE_CLASS_ID_ROADSIGN: 0
         }
         l_obj_info = []
-        while l_obj is not None:
-            try:
-                # Casting l_obj.data to pyds.NvDsObjectMeta
-                obj_meta = pyds.NvDsObjectMeta.cast(l_obj.data)
-            except StopIteration:
-                break
+        for obj_meta in obj_metas:
             obj_counter[obj_meta.class_id] += 1
             # Getting Image data using nvbufsurface
             # the input should be address of buffer and batch_id
             # n_frame = pyds.get_nvds_buf_surface(hash(gst_buffer), frame_meta.batch_id)
             rect_params = obj_meta.rect_params
-            top = int(rect_params.top)
-            left = int(rect_params.left)
-            width = int(rect_params.width)
-            height = int(rect_params.height)
-            obj_name = PGIE_CLASSES[obj_meta.class_id]
-            l_obj_info.append(
-                (
-                    frame_meta.batch_id,
-                    frame_meta.pad_index,
-                    obj_meta.confidence,
-                    (top, left, width, height),
-                    obj_name
-                )
-            )
-            try:
-                l_obj = l_obj.next
-            except StopIteration:
-                break
+            l_obj_info.append((frame_meta.batch_id, frame_meta.pad_index, obj_meta.confidence,
+                               (int(rect_params.top * sy), int(rect_params.left * sx),
+                                int(rect_params.width * sx), int(rect_params.height * sy)),
+                               PGIE_CLASSES[obj_meta.class_id]))
 
         print(len(l_obj_info))
         print(*l_obj_info, sep='\n')
-        print("\nFrame Number=", frame_number,
-              "\nNumber of Objects=", num_rects,
+        print("\nFrame Number=", frame_meta.frame_num,
+              "\nNumber of Objects=", frame_meta.num_obj_meta,
               "\nVehicle_count=", obj_counter[PGIE_CLASS_ID_VEHICLE],
               "\nPerson_count=", obj_counter[PGIE_CLASS_ID_PERSON]
               )
 
         stream_fps['stream0'].get_fps()
 
-        try:
-            l_frame = l_frame.next
-        except StopIteration:
-            break
-
     return Gst.PadProbeReturn.OK
 
 
@@ -113,7 +75,6 @@ def main():
     pgie_batch = 1
     batched_push_timeout = 10
     attach_sys_ts = 1
-    width, height = 1920, 1080
 
     rtsp_source = f'rtsp://{args.ip}:{args.port}/{args.name}'
 
@@ -122,6 +83,15 @@ def main():
     GObject.threads_init()
     Gst.init(None)
 
+    # Muxer output at the model input size, never above the native size of the source
+    if args.mux_size != 'auto':
+        width, height = resolution.parse_size(args.mux_size)
+    else:
+        source_size = resolution.discover_source_size(rtsp_source)
+        width, height = resolution.muxer_resolution([configs.load_nvinfer_config(pgie_config).input_size],
+                                                    [source_size] if source_size is not None else [])
+    muxer.update({'size': (width, height), 'padding': args.mux_padding})
+
     stream_fps.update({'stream0': nvutils.GetFPS(stream_id=0,
                                                  seconds=5,
                                                  save_log=False,
@@ -138,6 +108,7 @@ def main():
     streammux.set_property('live-source', 1)
     streammux.set_property('width', width)
     streammux.set_property('height', height)
+    streammux.set_property('enable-padding', int(args.mux_padding))
     streammux.set_property('batch-size', pgie_batch)
     streammux.set_property('batched-push-timeout', batched_push_timeout)
     streammux.set_property('attach-sys-ts', attach_sys_ts)
@@ -146,19 +117,18 @@ def main():
     pgie.set_property('config-file-path', pgie_config)
     pgie.set_property("batch-size", pgie_batch)
 
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
-
-    capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
-    capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
-
     if args.d:
+        nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
+        capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
+        capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
         nvosd = Gst.ElementFactory.make("nvdsosd", "onscreendisplay")
         if nvutils.is_aarch64():
             transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
         sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
         sink.set_property('sync', 1)
     else:
-        sink = Gst.ElementFactory.make("fakesink", 'fake_sink')
+        # Headless: the pipeline ends right after inference, no color conversion
+        sink = gsw.make_metadata_sink()
 
     pipeline.add(rtsp_bin.rtspsrc)
     if nvutils.is_aarch64():
@@ -167,9 +137,9 @@ def main():
     pipeline.add(rtsp_bin.decoder)
     pipeline.add(streammux)
     pipeline.add(pgie)
-    pipeline.add(nvvidconv)
 
     if args.d:
+        pipeline.add(nvvidconv)
         pipeline.add(capsfilter)
         pipeline.add(nvosd)
         if nvutils.is_aarch64():
@@ -192,10 +162,10 @@ def main():
         rtsp_bin.parser.link(rtsp_bin.decoder)
 
     streammux.link(pgie)
-    pgie.link(nvvidconv)
-    nvvidconv.link(capsfilter)
 
     if args.d:
+        pgie.link(nvvidconv)
+        nvvidconv.link(capsfilter)
         capsfilter.link(nvosd)
         if nvutils.is_aarch64():
             nvosd.link(transform)
@@ -203,7 +173,7 @@ def main():
         else:
             nvosd.link(sink)
     else:
-        capsfilter.link(sink)
+        pgie.link(sink)
 
     pgie_src_pad = pgie.get_static_pad("src")
     pgie_src_pad.add_probe(Gst.PadProbeType.BUFFER, pgie_buffer_probe, 0)
@@ -45,70 +45,73 @@ def main():
     streammux.set_property('attach-sys-ts', attach_sys_ts)
     pipeline.add(streammux)
 
+    # Duplicate URLs share one connection and decoder fanned out to their muxer pads
     rtsp_blocks = {}
-    for i in range(n_sources):
-
-        rtsp_bin = gsw.RTSPBin(builder_id=i, location=rtsp_sources[i], compression=args.codec)
-        rtsp_blocks.update({i: rtsp_bin})
+    fanouts = {}
+    for block_id, source_ids in enumerate(gsw.group_sources(rtsp_sources, share=not args.no_source_sharing)):
+
+        rtsp_bin = gsw.RTSPBin(builder_id=block_id, location=rtsp_sources[source_ids[0]], compression=args.codec)
+        rtsp_blocks.update({block_id: rtsp_bin})
+        for element in rtsp_bin.elements:
+            pipeline.add(element)
+        rtsp_bin.link_elements()
+
+        decoder_srcpad = rtsp_bin.decoder.get_static_pad("src") if nvutils.is_aarch64() else None
+        if len(source_ids) > 1:
+            fanout = fanouts[block_id] = gsw.SourceFanOut(builder_id=block_id, source_ids=source_ids, verbose=args.v)
+            for element in fanout.elements:
+                pipeline.add(element)
+            fanout.link_elements()
+            fanout.link_muxer(streammux)
+            decoded_handler = gsw.DecodeBinHandler(next_element=fanout.tee, scr_pad=decoder_srcpad)
+        else:
+            decoded_handler = gsw.StreamMuxHandler(next_element=streammux, scr_pad=decoder_srcpad, index=source_ids[0])
 
         if nvutils.is_aarch64():
-            pipeline.add(rtsp_bin.rtspsrc)
-            pipeline.add(rtsp_bin.depayer)
-            pipeline.add(rtsp_bin.parser)
-            pipeline.add(rtsp_bin.decoder)
-
-            rtsp_bin.depayer.link(rtsp_bin.parser)
-            rtsp_bin.parser.link(rtsp_bin.decoder)
-
-            decoder_srcpad = rtsp_bin.decoder.get_static_pad("src")
-            streammux_handler = gsw.StreamMuxHandler(next_element=streammux, scr_pad=decoder_srcpad, index=i)
-            rtsp_bin.rtspsrc.connect("pad-added", streammux_handler.on_pad_added)
-            rtsp_bin.rtspsrc.connect("pad-removed", streammux_handler.on_pad_removed)
+            rtsp_bin.rtspsrc.connect("pad-added", decoded_handler.on_pad_added)
+            rtsp_bin.rtspsrc.connect("pad-removed", decoded_handler.on_pad_removed)
         else:
-            pipeline.add(rtsp_bin.rtspsrc)
-            pipeline.add(rtsp_bin.decoder)
-            streammux_handler = gsw.StreamMuxHandler(next_element=streammux, index=i)
-            rtsp_bin.decoder.connect("pad-added", streammux_handler.on_pad_added)
-            rtsp_bin.decoder.connect("pad-removed", streammux_handler.on_pad_removed)
+            rtsp_bin.decoder.connect("pad-added", decoded_handler.on_pad_added)
+            rtsp_bin.decoder.connect("pad-removed", decoded_handler.on_pad_removed)
 
-    tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
-    tiler.set_property("rows", tiler_rows)
-    tiler.set_property("columns", tiler_columns)
-    tiler.set_property("width", width)
-    tiler.set_property("height", height)
-    pipeline.add(tiler)
+    if args.d:
+        tiler = Gst.ElementFactory.make("nvmultistreamtiler", "nvtiler")
+        tiler.set_property("rows", tiler_rows)
+        tiler.set_property("columns", tiler_columns)
+        tiler.set_property("width", width)
+        tiler.set_property("height", height)
+        pipeline.add(tiler)
 
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
+        nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
+        pipeline.add(nvvidconv)
 
-    capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
-    capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)NV12"))
-    pipeline.add(capsfilter)
+        capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
+        capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)NV12"))
+        pipeline.add(capsfilter)
 
-    if args.d:
         if nvutils.is_aarch64():
             transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
             pipeline.add(transform)
         sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
         sink.set_property('sync', 1)
     else:
-        sink = Gst.ElementFactory.make("fakesink", 'fake_sink')
+        # Headless: batches are dropped right after the muxer
+        sink = gsw.make_metadata_sink()
 
-    pipeline.add(nvvidconv)
     pipeline.add(sink)
 
     logging.info("Linking elements in the Pipeline \n")
-    streammux.link(tiler)
-    tiler.link(nvvidconv)
-    nvvidconv.link(capsfilter)
-
     if args.d:
+        streammux.link(tiler)
+        tiler.link(nvvidconv)
+        nvvidconv.link(capsfilter)
         if nvutils.is_aarch64():
             capsfilter.link(transform)
             transform.link(sink)
         else:
             capsfilter.link(sink)
     else:
-        capsfilter.link(sink)
+        streammux.link(sink)
 
     rtsp_handler = gsw.RTSPHandler(pipeline=pipeline,
                                    loop=GObject.MainLoop(),
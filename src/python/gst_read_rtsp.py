@@ -27,48 +27,50 @@ def main():
     pipeline = Gst.Pipeline.new('rtsp_client')
     rtsp_bin = gsw.RTSPBin(builder_id=0, location=rtsp_source, compression=args.codec)
 
-    nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
-
-    capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
-    capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
-    pipeline.add(capsfilter)
-
     if args.d:
+        nvvidconv = Gst.ElementFactory.make("nvvideoconvert", "nvidia_convertor")
+        capsfilter = Gst.ElementFactory.make("capsfilter", "filter")
+        capsfilter.set_property("caps", Gst.Caps.from_string("video/x-raw(memory:NVMM), format=(string)RGBA"))
         if nvutils.is_aarch64():
             transform = Gst.ElementFactory.make("nvegltransform", "nvegl-transform")
-            pipeline.add(transform)
         sink = Gst.ElementFactory.make("nveglglessink", "nvvideo-renderer")
         sink.set_property('sync', 1)
+        # Decoded frames go to the color convertor first
+        next_element = nvvidconv
     else:
-        sink = Gst.ElementFactory.make("fakesink", 'fake_sink')
+        # Headless: decoded frames are dropped right after the decoder
+        sink = gsw.make_metadata_sink()
+        next_element = sink
 
     pipeline.add(rtsp_bin.rtspsrc)
     if rtsp_bin.is_aarch64:
         pipeline.add(rtsp_bin.depayer)
         pipeline.add(rtsp_bin.parser)
     pipeline.add(rtsp_bin.decoder)
-    pipeline.add(nvvidconv)
+    if args.d:
+        pipeline.add(nvvidconv)
+        pipeline.add(capsfilter)
+        if nvutils.is_aarch64():
+            pipeline.add(transform)
     pipeline.add(sink)
 
     logging.info("Linking elements in the Pipeline")
     if nvutils.is_aarch64():
         rtsp_bin.depayer.link(rtsp_bin.parser)
         rtsp_bin.parser.link(rtsp_bin.decoder)
-        rtsp_bin.decoder.link(nvvidconv)
+        rtsp_bin.decoder.link(next_element)
     else:
-        decodebin_handler = gsw.DecodeBinHandler(next_element=nvvidconv)
+        decodebin_handler = gsw.DecodeBinHandler(next_element=next_element)
         rtsp_bin.decoder.connect("pad-added", decodebin_handler.on_pad_added)
         rtsp_bin.decoder.connect("pad-removed", decodebin_handler.on_pad_removed)
 
-    nvvidconv.link(capsfilter)
     if args.d:
+        nvvidconv.link(capsfilter)
         if nvutils.is_aarch64():
             capsfilter.link(transform)
             transform.link(sink)
         else:
             capsfilter.link(sink)
-    else:
-        capsfilter.link(sink)
 
     rtsp_handler = gsw.RTSPHandler(pipeline=pipeline,
                                    loop=GObject.MainLoop(),
@@ -0,0 +1,81 @@
+"""
+Captures the RTP packets of live RTSP sessions with their arrival times, for rtsp_replay_server.py.
+
+Packets are recorded over TCP before depayloading, one file per source named after the last path component of
+its address (rtsp://127.0.0.1:8554/stream -> stream.rtp), which becomes the mount of the replay server. Sources
+sharing the last path component are named after their host, port and path instead
+(rtsp://10.0.0.5:554/Streaming/Channels/101 -> 10.0.0.5_554_Streaming_Channels_101.rtp).
+
+Example:
+    $ python3 rtsp_capture.py -uris rtsp://10.0.0.5:554/cam1 rtsp://10.0.0.6:554/cam2 -seconds 120 -output_dir rec
+"""
+import argparse
+import logging
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from common import rtp_replay
+from common import utils
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='RTP capture of RTSP sources')
+    parser.add_argument('-uris', metavar='uris', type=str, nargs='+', required=True, help='str, rtsp:// addresses')
+    parser.add_argument('-seconds', metavar='seconds', type=float, default=60.0, help='float, capture duration')
+    parser.add_argument('-output_dir', metavar='output_dir', type=str, default='recordings',
+                        help='str, directory for the .rtp files')
+    return parser.parse_args()
+
+
+def capture_names(uris: list) -> list:
+    """
+    :param uris: rtsp:// addresses
+    :return: file names without extension, the last path component unless another source shares it
+    """
+    names = [uri.rstrip('/').split('/')[-1] for uri in uris]
+    counts = Counter(names)
+    for i, uri in enumerate(uris):
+        if counts[names[i]] > 1:
+            parsed = urlparse(uri)
+            parts = [parsed.hostname or '', str(parsed.port or '')] + [p for p in parsed.path.split('/') if p]
+            names[i] = '_'.join(part for part in parts if part)
+    duplicates = [name for name, count in Counter(names).items() if count > 1]
+    if duplicates:
+        raise ValueError(f'Sources captured to the same file: {", ".join(duplicates)}')
+    return names
+
+
+def main():
+    args = parse_arguments()
+    utils.set_logging()
+    Gst.init(None)
+    try:
+        names = capture_names(args.uris)
+    except ValueError as e:
+        logging.error(e)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    paths = [os.path.join(args.output_dir, f'{name}.rtp') for name in names]
+    with ThreadPoolExecutor(max_workers=len(args.uris)) as pool:
+        futures = [pool.submit(rtp_replay.capture, uri, path, args.seconds) for uri, path in zip(args.uris, paths)]
+    failed = 0
+    for uri, future in zip(args.uris, futures):
+        try:
+            future.result()
+        except RuntimeError as e:
+            logging.error(e)
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
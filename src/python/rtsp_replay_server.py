@@ -0,0 +1,195 @@
+"""
+Local RTSP server replaying rtsp_capture.py recordings with their original packet timing.
+
+Every recording is served at rtsp://127.0.0.1:port/<file name without .rtp>, N recordings concurrently, so the
+inference scripts and benchmarks see the same streams on every run. Jitter and packet loss are drawn from a
+seeded generator per mount, and scheduled disconnects drop the clients of a mount and refuse connections for
+a while to exercise the reconnection logic. Test pattern mounts (x264enc of a videotestsrc) stand in for cameras
+when there are no recordings.
+
+Example:
+    $ python3 rtsp_replay_server.py -recordings rec/ -jitter_ms 5 -loss 0.001 -disconnect cam1:30:10
+    $ python3 gst_multiple_rtsp_inference.py -ip 127.0.0.1 -port 8554 -name cam1 cam2 -metrics_port 9100
+"""
+import argparse
+import logging
+import os
+import sys
+
+import gi
+
+gi.require_version('Gst', '1.0')
+gi.require_version('GstRtspServer', '1.0')
+from gi.repository import GLib, Gst, GstRtspServer
+
+from common import rtp_replay
+from common import utils
+
+TEST_PATTERN_LAUNCH = ('( videotestsrc is-live=true pattern=ball ! video/x-raw,width=1280,height=720,framerate=30/1 '
+                       '! x264enc tune=zerolatency speed-preset=ultrafast key-int-max=30 '
+                       '! rtph264pay name=pay0 pt=96 config-interval=-1 )')
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='RTSP replay server of RTP recordings')
+    parser.add_argument('-recordings', metavar='recordings', type=str, nargs='+', default=[],
+                        help='str, .rtp files or directories')
+    parser.add_argument('-test_pattern', metavar='test_pattern', type=str, nargs='+', default=[],
+                        help='str, mounts serving an encoded videotestsrc, stand-ins when there are no recordings')
+    parser.add_argument('-port', metavar='port', type=int, default=8554, help='int, RTSP port')
+    parser.add_argument('-jitter_ms', metavar='jitter_ms', type=float, default=0.0,
+                        help='float, standard deviation of the added packet delay, milliseconds')
+    parser.add_argument('-loss', metavar='loss', type=float, default=0.0, help='float, packet loss probability')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, impairments random seed')
+    parser.add_argument('-no_loop', action='store_true', help='bool, send EOS at the end of a recording')
+    parser.add_argument('-disconnect', metavar='mount:at:duration', type=rtp_replay.parse_disconnect,
+                        action='append', default=[],
+                        help='str, drop the clients of a mount at seconds after the start for duration seconds')
+    return parser.parse_args()
+
+
+class ReplayServer:
+
+    def __init__(self, recordings: dict, port: int = 8554, impairments: rtp_replay.Impairments = None,
+                 loop: bool = True, disconnects: list = (), test_patterns: list = (), verbose: bool = True):
+        """
+        The packets go out as recorded, without depayloading and repayloading: the appsrc named pay0 is the stream.
+        Every mount has its own seeded impairments, its media is shared by its clients.
+        :param recordings:    mount -> recording path
+        :param port:          RTSP port
+        :param impairments:   rtp_replay.Impairments of every stream, none if None
+        :param loop:          replay the recordings endlessly
+        :param disconnects:   rtp_replay.Disconnect schedule
+        :param test_patterns: mounts of encoded test patterns, without recorded timing or impairments
+        :param verbose:
+        """
+        self.recordings = {mount: rtp_replay.read_recording(path) for mount, path in recordings.items()}
+        self.impairments = impairments or rtp_replay.Impairments()
+        self.loop = loop
+        self.disconnects = list(disconnects)
+        self.verbose = verbose
+        self.server = GstRtspServer.RTSPServer()
+        self.server.set_service(str(port))
+        self.factories = {}
+        self.medias = {mount: set() for mount in list(self.recordings) + list(test_patterns)}
+        self.feeders = {}
+        for index, (mount, recording) in enumerate(self.recordings.items()):
+            factory = GstRtspServer.RTSPMediaFactory()
+            factory.set_launch('( appsrc name=pay0 is-live=true format=time do-timestamp=true )')
+            factory.set_shared(True)
+            factory.connect('media-configure', self._on_media_configure, mount, self.impairments.seed + index)
+            self.factories[mount] = factory
+            self._mount(mount)
+        for mount in test_patterns:
+            factory = GstRtspServer.RTSPMediaFactory()
+            factory.set_launch(TEST_PATTERN_LAUNCH)
+            factory.set_shared(True)
+            factory.connect('media-configure', self._on_media_configure, mount, 0)
+            self.factories[mount] = factory
+            self._mount(mount)
+
+    def _mount(self, mount: str) -> bool:
+        self.server.get_mount_points().add_factory(f'/{mount}', self.factories[mount])
+        return False
+
+    @property
+    def mounts(self) -> list:
+        return list(self.factories)
+
+    def _on_media_configure(self, factory, media, mount: str, seed: int) -> None:
+        self.medias[mount].add(media)
+        media.connect('unprepared', self._on_media_unprepared, mount)
+        recording = self.recordings.get(mount)
+        if recording is None:
+            # Test pattern, the launch line produces the stream
+            return
+        appsrc = media.get_element().get_child_by_name('pay0')
+        appsrc.set_property('caps', Gst.Caps.from_string(rtp_replay.replay_caps(recording.caps)))
+        feeder = rtp_replay.StreamFeeder(appsrc, recording, self.impairments, seed, self.loop)
+        self.feeders[media] = feeder
+        feeder.start()
+        if self.verbose:
+            logging.info(f'/{mount}: replay of {len(recording.packets)} packets started')
+
+    def _on_media_unprepared(self, media, mount: str) -> None:
+        self.medias[mount].discard(media)
+        feeder = self.feeders.pop(media, None)
+        if feeder is not None:
+            feeder.stop()
+            if self.verbose:
+                logging.info(f'/{mount}: replay stopped, {feeder.sent} packets sent, {feeder.lost} lost')
+
+    def disconnect(self, mount: str, duration: float) -> bool:
+        """
+        Closes the connections of the clients of a mount and removes the mount for duration seconds
+        :return: False, a one-shot GLib timeout
+        """
+        medias = self.medias[mount]
+        found = []
+
+        def _media_filter(session, session_media):
+            found.append(session_media.get_media() in medias)
+            return GstRtspServer.RTSPFilterResult.KEEP
+
+        def _session_filter(client, session):
+            session.filter(_media_filter)
+            return GstRtspServer.RTSPFilterResult.KEEP
+
+        def _client_filter(server, client):
+            del found[:]
+            client.session_filter(_session_filter)
+            return GstRtspServer.RTSPFilterResult.REMOVE if any(found) else GstRtspServer.RTSPFilterResult.KEEP
+
+        self.server.get_mount_points().remove_factory(f'/{mount}')
+        self.server.client_filter(_client_filter)
+        for media in list(medias):
+            media.unprepare()
+        if self.verbose:
+            logging.info(f'/{mount}: disconnected for {duration} s')
+        GLib.timeout_add(int(duration * 1000), self._mount, mount)
+        return False
+
+    def start(self) -> None:
+        """
+        Attaches the server to the default main context and schedules the disconnects
+        :return: None
+        """
+        self.server.attach(None)
+        for disconnect in self.disconnects:
+            if disconnect.mount not in self.factories:
+                raise ValueError(f'Unknown mount {disconnect.mount}, expected one of {self.mounts}')
+            GLib.timeout_add(int(disconnect.at * 1000), self.disconnect, disconnect.mount, disconnect.duration)
+        if self.verbose:
+            for mount in self.mounts:
+                logging.info(f'Serving rtsp://127.0.0.1:{self.server.get_service()}/{mount}')
+
+
+def main():
+    args = parse_arguments()
+    utils.set_logging()
+    Gst.init(None)
+
+    paths = []
+    for item in args.recordings:
+        if os.path.isdir(item):
+            paths.extend(os.path.join(item, name) for name in sorted(os.listdir(item)) if name.endswith('.rtp'))
+        else:
+            paths.append(item)
+    recordings = {rtp_replay.mount_name(path): path for path in paths}
+    if not recordings and not args.test_pattern:
+        raise ValueError('Nothing to serve: pass -recordings or -test_pattern')
+    server = ReplayServer(recordings, port=args.port,
+                          impairments=rtp_replay.Impairments(args.jitter_ms, args.loss, args.seed),
+                          loop=not args.no_loop, disconnects=args.disconnect, test_patterns=args.test_pattern)
+    server.start()
+    loop = GLib.MainLoop()
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    for feeder in server.feeders.values():
+        feeder.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Reference consumer of the frames exported with `gst_multiple_rtsp_inference.py -shm_export`.
+
+Frames are mapped zero-copy from /dev/shm as NumPy arrays together with their objects metadata.
+Object crops are cut as views of the shared frame, copy them if they must outlive the slot.
+
+Example:
+    $ python3 shm_consumer.py -sources 0 1 2
+"""
+import argparse
+import logging
+import sys
+import time
+
+from common import shm_ring
+from common import utils
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Shared memory frames consumer')
+    parser.add_argument('-sources', metavar='sources', type=int, default=[0], nargs='+', help='int, source ids')
+    parser.add_argument('-prefix', metavar='prefix', type=str, default='inference_gst',
+                        help='str, shared memory prefix')
+    parser.add_argument('-seconds', metavar='seconds', type=float, default=5, help='float, report interval')
+    parser.add_argument('-v', action='store_true', help='bool, enable logging')
+    return parser.parse_args()
+
+
+def crops(frame: shm_ring.SharedFrame) -> list:
+    """
+    Object crops of a shared frame as zero-copy views
+    :param frame: shm_ring.SharedFrame
+    :return: list of HxWxC arrays
+    """
+    height, width = frame.image.shape[:2]
+    result = []
+    for obj in frame.objects:
+        left, top = max(0, int(obj['left'])), max(0, int(obj['top']))
+        right, bottom = min(width, int(obj['left'] + obj['width'])), min(height, int(obj['top'] + obj['height']))
+        if right > left and bottom > top:
+            result.append(frame.image[top:bottom, left:right])
+    return result
+
+
+def main():
+    args = parse_arguments()
+    if args.v:
+        utils.set_logging()
+
+    readers = {}
+    while len(readers) < len(args.sources):
+        for source_id in args.sources:
+            if source_id not in readers:
+                try:
+                    readers[source_id] = shm_ring.ShmFrameReader(source_id, prefix=args.prefix)
+                    logging.info(f'Attached to {readers[source_id].path}')
+                except (OSError, ValueError):
+                    pass
+        time.sleep(0.1)
+
+    stats = {source_id: {'frames': 0, 'objects': 0, 'latency': 0.0, 'torn': 0} for source_id in readers}
+    start_time = time.time()
+    try:
+        while True:
+            for source_id, reader in readers.items():
+                frame = reader.poll(timeout=0)
+                if frame is None:
+                    continue
+                n_crops = len(crops(frame))
+                if not reader.is_valid(frame):
+                    stats[source_id]['torn'] += 1
+                    continue
+                stats[source_id]['frames'] += 1
+                stats[source_id]['objects'] += n_crops
+                stats[source_id]['latency'] += time.time() - frame.timestamp
+
+            elapsed = time.time() - start_time
+            if elapsed > args.seconds:
+                for source_id, s in stats.items():
+                    latency = 1e3 * s['latency'] / max(1, s['frames'])
+                    print(f'source {source_id}: {s["frames"] / elapsed:6.1f} fps, '
+                          f'{s["objects"] / elapsed:7.1f} crops/s, latency {latency:6.2f} ms, '
+                          f'overwritten {s["torn"]}')
+                    stats[source_id] = {'frames': 0, 'objects': 0, 'latency': 0.0, 'torn': 0}
+                start_time = time.time()
+            time.sleep(0.0005)
+    except KeyboardInterrupt:
+        pass
+
+    for reader in readers.values():
+        reader.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+Soak test of the RTSP reconnection path under randomized source outages.
+
+Every source is a local rtsp_replay_server.py process (a test pattern, or a recording with -recording) which is
+killed and restarted on a seeded random schedule, for hours. The client runs in this process and is built like
+gst_read_multiple_rtsp.py: RTSPBin, StreamMuxHandler and RTSPHandler, so its memory, file descriptors and
+GObjects are the ones measured. After the warm-up the harness samples RSS, open descriptors, live GObject
+wrappers, muxer sink pads and tracemalloc, and measures per source the time from a server restart to the next
+buffer. The run fails when a resource grows faster than its threshold or a source does not recover in time:
+muxer pads not released by StreamMuxHandler show as sink pads above the number of sources, native memory and
+sockets of the repeated cv2.VideoCapture checks of RTSPHandler as RSS and descriptor growth.
+
+Example:
+    $ python3 soak_reconnect.py -n_sources 16 -hours 4 -mean_up 120 -mean_down 20 -report soak.json
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import gi
+import numpy as np
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, GObject, Gst
+
+from common import gstreamer_wrappers as gsw
+from common import nvutils
+from common import rtp_replay
+from common import utils
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rtsp_replay_server.py')
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='RTSP reconnection soak test')
+    parser.add_argument('-n_sources', metavar='n_sources', type=int, default=8, help='int, number of sources')
+    parser.add_argument('-hours', metavar='hours', type=float, default=1.0, help='float, test duration')
+    parser.add_argument('-warmup', metavar='warmup', type=float, default=300.0,
+                        help='float, seconds before the resource baselines are taken')
+    parser.add_argument('-sample_interval', metavar='sample_interval', type=int, default=30,
+                        help='int, seconds between resource samples')
+    parser.add_argument('-base_port', metavar='base_port', type=int, default=8600,
+                        help='int, RTSP port of the first stand-in server')
+    parser.add_argument('-recording', metavar='recording', type=str, default=None,
+                        help='str, .rtp recording served by every stand-in, a test pattern if None')
+    parser.add_argument('-codec', metavar='codec', type=str, default='h264', help='str, stream codec')
+    parser.add_argument('-mean_up', metavar='mean_up', type=float, default=120.0,
+                        help='float, mean seconds a stand-in server runs')
+    parser.add_argument('-mean_down', metavar='mean_down', type=float, default=20.0,
+                        help='float, mean seconds a stand-in server is down')
+    parser.add_argument('-seed', metavar='seed', type=int, default=0, help='int, outage schedule random seed')
+    parser.add_argument('-backend', metavar='backend', type=str, default='auto', choices=('auto', 'nv', 'cpu'),
+                        help='str, muxer: nvstreammux (nv) or funnel (cpu)')
+    parser.add_argument('-max_rss_mb_per_hour', metavar='mb', type=float, default=20.0,
+                        help='float, RSS growth threshold after the warm-up')
+    parser.add_argument('-max_traced_mb_per_hour', metavar='mb', type=float, default=5.0,
+                        help='float, tracemalloc growth threshold after the warm-up')
+    parser.add_argument('-max_fd_growth', metavar='n', type=int, default=8,
+                        help='int, open file descriptors growth threshold after the warm-up')
+    parser.add_argument('-max_gobject_growth', metavar='n', type=int, default=100,
+                        help='int, live GObject wrappers growth threshold after the warm-up')
+    parser.add_argument('-max_recover', metavar='seconds', type=float, default=60.0,
+                        help='float, time-to-recover threshold of a source after its server restarts')
+    parser.add_argument('-report', metavar='report', type=str, default='soak_report.json',
+                        help='str, JSON report path')
+    parser.add_argument('-v', action='store_true', help='bool, verbose pipeline logs')
+    return parser.parse_args()
+
+
+class StandIn:
+
+    def __init__(self, source_id: int, port: int, recording: str = None):
+        """
+        rtsp_replay_server.py process standing in for one camera
+        :param source_id: source index
+        :param port:      RTSP port
+        :param recording: .rtp file, a test pattern if None
+        """
+        self.source_id = source_id
+        self.port = port
+        self.recording = recording
+        self.mount = rtp_replay.mount_name(recording) if recording else 'stream'
+        self.process = None
+        self.outages = 0
+
+    @property
+    def uri(self) -> str:
+        return f'rtsp://127.0.0.1:{self.port}/{self.mount}'
+
+    def start(self) -> None:
+        command = [sys.executable, SERVER_SCRIPT, '-port', str(self.port)]
+        command += ['-recordings', self.recording] if self.recording else ['-test_pattern', self.mount]
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def kill(self) -> None:
+        if self.process is not None:
+            # No RTSP teardown, the client sees the connection drop as with a camera losing power
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+            self.outages += 1
+
+
+class RecoveryTracker:
+
+    def __init__(self):
+        """
+        Time from the restart of a stand-in to the next buffer of its source
+        """
+        self.restarts = {}
+        self.times = {}
+        self.last_buffer = {}
+        self._lock = threading.Lock()
+
+    def restarted(self, source_id: int) -> None:
+        with self._lock:
+            self.restarts[source_id] = time.monotonic()
+
+    def probe(self, source_id: int):
+        def _buffer_probe(pad, info, u_data):
+            now = time.monotonic()
+            with self._lock:
+                self.last_buffer[source_id] = now
+                restart = self.restarts.pop(source_id, None)
+                if restart is not None:
+                    self.times.setdefault(source_id, []).append(now - restart)
+            return Gst.PadProbeReturn.OK
+
+        return _buffer_probe
+
+    def unrecovered(self, limit: float) -> dict:
+        """
+        :return: source_id -> seconds since the restart, for sources waiting longer than limit
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {source_id: round(now - restart, 1) for source_id, restart in self.restarts.items()
+                    if now - restart > limit}
+
+
+class Flapper:
+
+    def __init__(self, stand_in: StandIn, recovery: RecoveryTracker, mean_up: float, mean_down: float, seed: int):
+        """
+        Seeded exponential up and down times of one stand-in
+        """
+        self.stand_in = stand_in
+        self.recovery = recovery
+        self.mean_up = mean_up
+        self.mean_down = mean_down
+        self.rng = random.Random(seed)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.rng.expovariate(1.0 / self.mean_up)):
+            self.stand_in.kill()
+            if self._stop.wait(self.rng.expovariate(1.0 / self.mean_down)):
+                break
+            self.stand_in.start()
+            self.recovery.restarted(self.stand_in.source_id)
+        if self.stand_in.process is None:
+            self.stand_in.start()
+
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def open_fds() -> int:
+    return len(os.listdir('/proc/self/fd'))
+
+
+def gobject_count() -> int:
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, GObject.Object))
+
+
+def sample(start: float, streammux) -> dict:
+    return {'t': round(time.monotonic() - start, 1),
+            'rss_mb': round(rss_mb(), 2),
+            'traced_mb': round(tracemalloc.get_traced_memory()[0] / 2 ** 20, 3),
+            'fds': open_fds(),
+            'gobjects': gobject_count(),
+            'mux_sink_pads': streammux.numsinkpads,
+            }
+
+
+def slope_per_hour(samples: list, key: str) -> float:
+    if len(samples) < 3:
+        return 0.0
+    hours = np.array([s['t'] for s in samples]) / 3600
+    return float(np.polyfit(hours, np.array([s[key] for s in samples], dtype=np.float64), 1)[0])
+
+
+def evaluate(args, samples: list, recovery: RecoveryTracker) -> dict:
+    """
+    :return: check name -> (value, threshold, passed)
+    """
+    steady = [s for s in samples if s['t'] >= args.warmup]
+    first, last = (steady[0], steady[-1]) if steady else ({}, {})
+    recover_times = [t for times in recovery.times.values() for t in times]
+    checks = {'rss_mb_per_hour': (slope_per_hour(steady, 'rss_mb'), args.max_rss_mb_per_hour),
+              'traced_mb_per_hour': (slope_per_hour(steady, 'traced_mb'), args.max_traced_mb_per_hour),
+              'fd_growth': (last.get('fds', 0) - first.get('fds', 0), args.max_fd_growth),
+              'gobject_growth': (last.get('gobjects', 0) - first.get('gobjects', 0), args.max_gobject_growth),
+              'max_mux_sink_pads': (max((s['mux_sink_pads'] for s in samples), default=0), args.n_sources),
+              'max_recover_seconds': (max(recover_times, default=0.0), args.max_recover),
+              'unrecovered_sources': (len(recovery.unrecovered(args.max_recover)), 0),
+              }
+    return {name: (round(value, 3), threshold, value <= threshold) for name, (value, threshold) in checks.items()}
+
+
+def main():
+    args = parse_arguments()
+    utils.set_logging()
+    if not args.v:
+        logging.getLogger().setLevel(logging.WARNING)
+    tracemalloc.start(10)
+    GObject.threads_init()
+    Gst.init(None)
+
+    backend = args.backend
+    if backend == 'auto':
+        backend = 'nv' if Gst.ElementFactory.find('nvstreammux') else 'cpu'
+    stand_ins = [StandIn(i, args.base_port + i, args.recording) for i in range(args.n_sources)]
+    for stand_in in stand_ins:
+        stand_in.start()
+    time.sleep(2)
+
+    pipeline = Gst.Pipeline.new('rtsp_client')
+    if backend == 'nv':
+        streammux = Gst.ElementFactory.make('nvstreammux', 'stream_muxer')
+        streammux.set_property('live-source', 1)
+        streammux.set_property('width', 1280)
+        streammux.set_property('height', 720)
+        streammux.set_property('batch-size', args.n_sources)
+        streammux.set_property('batched-push-timeout', 40000)
+    else:
+        # Same sink_%u request pads, StreamMuxHandler runs unchanged
+        streammux = Gst.ElementFactory.make('funnel', 'stream_muxer')
+    sink = gsw.make_metadata_sink()
+    pipeline.add(streammux)
+    pipeline.add(sink)
+    streammux.link(sink)
+
+    recovery = RecoveryTracker()
+    rtsp_blocks = {}
+    for stand_in in stand_ins:
+        i = stand_in.source_id
+        rtsp_bin = gsw.RTSPBin(builder_id=i, location=stand_in.uri, compression=args.codec, verbose=args.v)
+        rtsp_blocks[i] = rtsp_bin
+        for element in rtsp_bin.elements:
+            pipeline.add(element)
+        rtsp_bin.link_elements()
+        rtsp_bin.connect_plugin.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, recovery.probe(i), 0)
+        decoder_srcpad = rtsp_bin.decoder.get_static_pad('src') if nvutils.is_aarch64() else None
+        streammux_handler = gsw.StreamMuxHandler(next_element=streammux, scr_pad=decoder_srcpad, index=i,
+                                                 verbose=args.v)
+        signal_element = rtsp_bin.rtspsrc if nvutils.is_aarch64() else rtsp_bin.decoder
+        signal_element.connect('pad-added', streammux_handler.on_pad_added)
+        signal_element.connect('pad-removed', streammux_handler.on_pad_removed)
+
+    loop = GObject.MainLoop()
+    gsw.RTSPHandler(pipeline=pipeline, loop=loop, basic_blocks=rtsp_blocks, verbose=args.v)
+
+    start = time.monotonic()
+    samples = []
+    snapshots = {}
+
+    def _sample():
+        samples.append(sample(start, streammux))
+        if 'baseline' not in snapshots and samples[-1]['t'] >= args.warmup:
+            gc.collect()
+            snapshots['baseline'] = tracemalloc.take_snapshot()
+        print(json.dumps(samples[-1]), flush=True)
+        return True
+
+    flappers = [Flapper(stand_in, recovery, args.mean_up, args.mean_down, args.seed + stand_in.source_id)
+                for stand_in in stand_ins]
+    for flapper in flappers:
+        flapper.start()
+    GLib.timeout_add_seconds(args.sample_interval, _sample)
+    GLib.timeout_add_seconds(int(args.hours * 3600), loop.quit)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        logging.warning('Interrupted, reporting the samples so far')
+
+    for flapper in flappers:
+        flapper.stop()
+    gc.collect()
+    _sample()
+    growth = []
+    if 'baseline' in snapshots:
+        stats = tracemalloc.take_snapshot().compare_to(snapshots['baseline'], 'lineno')
+        growth = [str(stat) for stat in stats[:10]]
+    checks = evaluate(args, samples, recovery)
+    pipeline.set_state(Gst.State.NULL)
+    for stand_in in stand_ins:
+        stand_in.kill()
+
+    report = {'backend': backend,
+              'n_sources': args.n_sources,
+              'hours': round((time.monotonic() - start) / 3600, 3),
+              'outages': {s.source_id: s.outages - 1 for s in stand_ins},
+              'recover_seconds': {source_id: [round(t, 2) for t in times]
+                                  for source_id, times in recovery.times.items()},
+              'checks': {name: {'value': value, 'threshold': threshold, 'passed': passed}
+                         for name, (value, threshold, passed) in checks.items()},
+              'tracemalloc_growth': growth,
+              'samples': samples,
+              }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=1)
+
+    print(f'{"check":22} {"value":>12} {"threshold":>10}')
+    for name, (value, threshold, passed) in checks.items():
+        print(f'{name:22} {value:12} {threshold:10} {"ok" if passed else "FAIL"}')
+    print(f'Report: {args.report}')
+    return 0 if all(passed for _, _, passed in checks.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())